@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request, Form
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from core.database import get_db
 from models.models import User
 from models.schemas import (
@@ -7,19 +8,31 @@ from models.schemas import (
     ProfileSetup, ProfileSetupResponse, LoginRequest, LoginResponse
 )
 from services.utils import assign_frontend_design
-from services.email_service import send_verification_email, send_password_reset_email, verify_token, get_verification_code_data, create_verification_token
-from services.auth_utils import hash_password, verify_password, create_access_token
+from services.email_service import queue_verification_email, queue_password_reset_email, verify_token, get_verification_code_data, create_verification_token
+from services.auth_utils import create_user_access_token
+from services.hashing_service import hash_password_async, verify_password_async, upgrade_password_hash
+from services.token_service import revoke_user_tokens
+from services.email_outbox import deliver_after_response
 from services.censorship_service import validate_text_input
+from services.feature_service import refresh_user_features
+from services.principal_cache import get_user_query, get_user_by_email_query
 
 # Create router for authentication routes
 router = APIRouter(prefix="/api", tags=["authentication"])
 
+# The endpoints that hash passwords are async so they can await the hashing pool;
+# their database calls (user lookups and this commit) go through the threadpool to keep the event loop free
+def _commit_user(db: Session, user: User):
+    """Commit, then reload the user (commit expires its attributes)"""
+    db.commit()
+    db.refresh(user)
+
 # Step 1: Request email verification
 @router.post("/request-verification", response_model=EmailRequestResponse, status_code=status.HTTP_201_CREATED)
-async def request_email_verification(email_request: EmailRequest, request: Request, db: Session = Depends(get_db)):
-    """Step 1: Submit email and send verification email"""
+def request_email_verification(email_request: EmailRequest, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Step 1: Submit email and queue the verification email (delivered through the email outbox)"""
     # Check if email already exists
-    existing_user = db.query(User).filter(User.school_email == email_request.school_email).first()
+    existing_user = get_user_by_email_query(db, email_request.school_email).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -34,14 +47,13 @@ async def request_email_verification(email_request: EmailRequest, request: Reque
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    db.flush()
     
-    # Send verification email
+    # Queue the verification email in the same transaction as the new user
     try:
         # Get base URL from request
         base_url = f"{request.url.scheme}://{request.url.netloc}"
-        await send_verification_email(
+        queue_verification_email(
             user_email=db_user.school_email,
             user_name="User",  # Placeholder name since we don't have it yet
             user_major="",  # Placeholder
@@ -50,38 +62,29 @@ async def request_email_verification(email_request: EmailRequest, request: Reque
             db=db,
             base_url=base_url
         )
-        
-        return EmailRequestResponse(
-            message="Verification email sent successfully. Please check your email to continue.",
-            email_sent=True
-        )
-    except ValueError as e:
-        # Handle code generation/storage errors
-        # If email fails, delete the user record
-        db.delete(db_user)
         db.commit()
+        deliver_after_response(background_tasks)
+    except ValueError as e:
+        # Handle code generation/storage errors (nothing was saved)
+        db.rollback()
         print(f"Failed to generate/store verification code: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create verification code: {str(e)}. Please try again."
         )
-    except Exception as e:
-        # If email fails, delete the user record
-        db.delete(db_user)
-        db.commit()
-        print(f"Failed to send verification email: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to send verification email. Please try again."
-        )
+    
+    return EmailRequestResponse(
+        message="Verification email sent successfully. Please check your email to continue.",
+        email_sent=True
+    )
 
 # Resend verification email for unverified users
 @router.post("/resend-verification", response_model=EmailRequestResponse, status_code=status.HTTP_200_OK)
-async def resend_verification_email(email_request: EmailRequest, request: Request, db: Session = Depends(get_db)):
+def resend_verification_email(email_request: EmailRequest, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Resend verification email for users who haven't completed setup"""
     
     # Check if user exists
-    existing_user = db.query(User).filter(User.school_email == email_request.school_email).first()
+    existing_user = get_user_by_email_query(db, email_request.school_email).first()
     if not existing_user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -98,11 +101,11 @@ async def resend_verification_email(email_request: EmailRequest, request: Reques
     # Allow resending even if email is verified, as long as password isn't set
     # This helps users who verified but lost the email or need a new code
     
-    # Send new verification email
+    # Queue new verification email
     try:
         # Get base URL from request
         base_url = f"{request.url.scheme}://{request.url.netloc}"
-        await send_verification_email(
+        queue_verification_email(
             user_email=existing_user.school_email,
             user_name="User",  # Placeholder name since we don't have it yet
             user_major="",  # Placeholder
@@ -111,28 +114,25 @@ async def resend_verification_email(email_request: EmailRequest, request: Reques
             db=db,
             base_url=base_url
         )
-        
-        return EmailRequestResponse(
-            message="New verification email sent successfully. Please check your email to continue.",
-            email_sent=True
-        )
+        db.commit()
+        deliver_after_response(background_tasks)
     except ValueError as e:
         # Handle code generation/storage errors
+        db.rollback()
         print(f"Failed to generate/store verification code: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create verification code: {str(e)}. Please try again."
         )
-    except Exception as e:
-        print(f"Failed to resend verification email: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to send verification email. Please try again."
-        )
+    
+    return EmailRequestResponse(
+        message="New verification email sent successfully. Please check your email to continue.",
+        email_sent=True
+    )
 
 # Step 2: Setup password after email verification
 @router.post("/setup-password/{token}", response_model=PasswordSetupResponse, status_code=status.HTTP_200_OK)
-def setup_password(token: str, password_data: PasswordSetup, db: Session = Depends(get_db)):
+async def setup_password(token: str, password_data: PasswordSetup, db: Session = Depends(get_db)):
     """Step 2: Set password after email verification"""
     try:
         # Verify and decode token
@@ -147,7 +147,7 @@ def setup_password(token: str, password_data: PasswordSetup, db: Session = Depen
             )
         
         # Get user
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await run_in_threadpool(get_user_query(db, user_id).first)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -167,11 +167,11 @@ def setup_password(token: str, password_data: PasswordSetup, db: Session = Depen
             )
         
         # Hash and store password
-        user.password_hash = hash_password(password_data.password)
-        db.commit()
+        user.password_hash = await hash_password_async(password_data.password)
+        await run_in_threadpool(_commit_user, db, user)
         
         # Create access token for automatic login
-        access_token = create_access_token(data={"user_id": user.id})
+        access_token = create_user_access_token(user)
         
         return PasswordSetupResponse(
             message="Password set successfully. You are now logged in!",
@@ -190,7 +190,7 @@ def setup_password(token: str, password_data: PasswordSetup, db: Session = Depen
 def complete_profile(user_id: int, profile_data: ProfileSetup, db: Session = Depends(get_db)):
     """Step 3: Complete profile setup"""
     # Get user
-    user = db.query(User).filter(User.id == user_id).first()
+    user = get_user_query(db, user_id).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -271,6 +271,9 @@ def complete_profile(user_id: int, profile_data: ProfileSetup, db: Session = Dep
     user.frontend_design = assign_frontend_design()  # Assign A/B test design
     user.profile_completed = True
     
+    # Keep the normalized similarity features in sync with the profile
+    refresh_user_features(db, user)
+    
     db.commit()
     db.refresh(user)
     
@@ -281,10 +284,10 @@ def complete_profile(user_id: int, profile_data: ProfileSetup, db: Session = Dep
 
 # Login endpoint (JSON format)
 @router.post("/login", response_model=LoginResponse, status_code=status.HTTP_200_OK)
-def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     """Login user with email and password (JSON format)"""
     # Find user by email
-    user = db.query(User).filter(User.school_email == login_data.school_email).first()
+    user = await run_in_threadpool(get_user_by_email_query(db, login_data.school_email).first)
     
     if not user:
         raise HTTPException(
@@ -306,15 +309,19 @@ def login(login_data: LoginRequest, db: Session = Depends(get_db)):
             detail="Password not set. Please complete your registration."
         )
     
-    # Verify password
-    if not verify_password(login_data.password, user.password_hash):
+    # Verify password (on the hashing pool, which sheds with 503 when saturated)
+    if not await verify_password_async(login_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
     
+    # Move the stored hash to the current hashing policy's cost if it differs
+    if await upgrade_password_hash(user, login_data.password):
+        await run_in_threadpool(_commit_user, db, user)
+    
     # Create access token
-    access_token = create_access_token(data={"user_id": user.id})
+    access_token = create_user_access_token(user)
     
     return LoginResponse(
         access_token=access_token,
@@ -324,7 +331,7 @@ def login(login_data: LoginRequest, db: Session = Depends(get_db)):
 
 # OAuth2 form-based login endpoint (for OAuth2 standard compliance)
 @router.post("/token", status_code=status.HTTP_200_OK)
-def login_for_access_token(
+async def login_for_access_token(
     username: str = Form(...),  # OAuth2 uses 'username' field
     password: str = Form(...),
     db: Session = Depends(get_db)
@@ -332,7 +339,7 @@ def login_for_access_token(
     """OAuth2 standard form-based login endpoint"""
     try:
         # Find user by email (username in OAuth2 context)
-        user = db.query(User).filter(User.school_email == username).first()
+        user = await run_in_threadpool(get_user_by_email_query(db, username).first)
         
         if not user:
             raise HTTPException(
@@ -355,14 +362,18 @@ def login_for_access_token(
             )
         
         # Verify password
-        if not verify_password(password, user.password_hash):
+        if not await verify_password_async(password, user.password_hash):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid email or password"
             )
         
+        # Move the stored hash to the current hashing policy's cost if it differs
+        if await upgrade_password_hash(user, password):
+            await run_in_threadpool(_commit_user, db, user)
+        
         # Create access token
-        access_token = create_access_token(data={"user_id": user.id})
+        access_token = create_user_access_token(user)
         
         # Return standard OAuth2 response format
         return {
@@ -420,7 +431,7 @@ def exchange_verification_code(code: str, db: Session = Depends(get_db)):
             )
         
         # Get user
-        user = db.query(User).filter(User.id == user_id).first()
+        user = get_user_query(db, user_id).first()
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -482,7 +493,7 @@ def verify_email_token(token: str, db: Session = Depends(get_db)):
             )
         
         # Get user
-        user = db.query(User).filter(User.id == user_id).first()
+        user = get_user_query(db, user_id).first()
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -521,7 +532,7 @@ def reject_email_token(token: str, db: Session = Depends(get_db)):
             )
         
         # Get user
-        user = db.query(User).filter(User.id == user_id).first()
+        user = get_user_query(db, user_id).first()
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -566,8 +577,8 @@ def reject_email_token(token: str, db: Session = Depends(get_db)):
         )
 # NEW: request password reset
 @router.post("/request-password-reset", response_model=EmailRequestResponse, status_code=status.HTTP_200_OK)
-async def request_password_reset(email_request: EmailRequest, request: Request, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.school_email == email_request.school_email).first()
+def request_password_reset(email_request: EmailRequest, request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    user = get_user_by_email_query(db, email_request.school_email).first()
     if not user:
         # Don’t leak which emails exist
         return EmailRequestResponse(message="If an account exists, you'll receive a reset email shortly.", email_sent=True)
@@ -575,38 +586,42 @@ async def request_password_reset(email_request: EmailRequest, request: Request,
     if user.email_verified is not True:
         raise HTTPException(status_code=400, detail="Email not verified yet. Please verify first.")
 
-    # send reset email (short code flow)
+    # queue reset email (short code flow), saved with its code
     base_url = f"{request.url.scheme}://{request.url.netloc}"
     try:
-        await send_password_reset_email(user_email=user.school_email, user_name=user.name or "Study Buddy",
-                                        user_id=user.id, db=db, base_url=base_url)
+        queue_password_reset_email(user_email=user.school_email, user_name=user.name or "Study Buddy",
+                                   user_id=user.id, db=db, base_url=base_url)
+        db.commit()
+        deliver_after_response(background_tasks)
         return EmailRequestResponse(message="If an account exists, you'll receive a reset email shortly.", email_sent=True)
-    except Exception as e:
-        print("Failed to send password reset:", e)
+    except ValueError as e:
+        db.rollback()
+        print("Failed to queue password reset:", e)
         raise HTTPException(status_code=500, detail="Failed to send password reset email.")
 
 # NEW: complete password reset using the short code from email
 @router.post("/reset-password/{code}", response_model=PasswordSetupResponse, status_code=status.HTTP_200_OK)
-def reset_password(code: str, password_data: PasswordSetup, db: Session = Depends(get_db)):
-    code_data = get_verification_code_data(db, code)  # validates/marks used
+async def reset_password(code: str, password_data: PasswordSetup, db: Session = Depends(get_db)):
+    code_data = await run_in_threadpool(get_verification_code_data, db, code)  # validates/marks used
     if not code_data:
         raise HTTPException(status_code=400, detail="Invalid or expired reset code")
 
     if code_data["action"] != "reset":
         raise HTTPException(status_code=400, detail="Invalid code action")
 
-    user = db.query(User).filter(User.id == code_data["user_id"]).first()
+    user = await run_in_threadpool(get_user_query(db, code_data["user_id"]).first)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
     if user.email_verified is not True:
         raise HTTPException(status_code=400, detail="Email not verified yet")
 
-    # update password
-    user.password_hash = hash_password(password_data.password)
-    db.commit()
+    # update password and sign out every existing session
+    user.password_hash = await hash_password_async(password_data.password)
+    revoke_user_tokens(db, user)
+    await run_in_threadpool(_commit_user, db, user)
 
-    access_token = create_access_token(data={"user_id": user.id})
+    access_token = create_user_access_token(user)
     return PasswordSetupResponse(
         message="Password reset successfully. You are now logged in!",
         user_id=user.id,
@@ -0,0 +1,83 @@
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from core.database import SessionLocal
+from config.auth_dependencies import authenticate_token, oauth2_scheme
+from services.event_service import hub, get_event_backend
+
+# Create router for event stream routes
+router = APIRouter(prefix="/api", tags=["events"])
+
+# Seconds between keep-alive comments on an idle stream (below common proxy idle timeouts)
+HEARTBEAT_INTERVAL = 25
+
+# Milliseconds the browser waits before reconnecting a dropped stream
+RETRY_INTERVAL = 5000
+
+
+def _authenticate(token: Optional[str]) -> int:
+    """
+    Resolve a token to a user id (from its claims; a short-lived session covers older
+    tokens, so no connection is held by the stream).
+    """
+    db = SessionLocal()
+    try:
+        return authenticate_token(token, db).user_id
+    finally:
+        db.close()
+
+
+def _format_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+async def _event_stream(request: Request, user_id: int):
+    subscription = hub.subscribe(user_id)
+    try:
+        yield f"retry: {RETRY_INTERVAL}\n\n"
+        yield _format_event({"type": "ready"})
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield _format_event(event)
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@router.get("/events")
+async def stream_events(
+    request: Request,
+    token: Optional[str] = None,
+    header_token: Optional[str] = Depends(oauth2_scheme) if oauth2_scheme else None
+):
+    """
+    Server-Sent Events stream of notifications for the current user
+    (reach_out, connection_met, rating_due, connection_rated, mutual_match).
+    EventSource can't send headers, so the JWT may be passed as the `token` query parameter.
+    Events are nudges: clients refetch the affected data when one arrives.
+    """
+    access_token = header_token or token
+    if not access_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    user_id = await run_in_threadpool(_authenticate, access_token)
+    get_event_backend().start()
+
+    return StreamingResponse(
+        _event_stream(request, user_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Don't let nginx-style proxies buffer the stream
+        },
+    )
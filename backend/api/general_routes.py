@@ -1,5 +1,9 @@
-from fastapi import APIRouter, Depends
+import hmac
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from core.database import get_db
 from models.schemas import (
     HealthResponse, 
@@ -13,6 +17,7 @@ from services.statistics_service import (
     calculate_reputation_reach_out_stats,
     get_user_statistics
 )
+from services.email_outbox import OUTBOX_CRON_BATCHES, drain_until_empty, purge_sent_emails
 
 # Create router for general routes
 router = APIRouter(prefix="/api", tags=["general"])
@@ -22,6 +27,20 @@ def health_check():
     """Health check endpoint"""
     return HealthResponse(status="healthy", message="Study Buddy API is running")
 
+@router.get("/cron/drain-email-outbox")
+async def drain_email_outbox(authorization: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    """
+    Scheduled email outbox drain for serverless deployments (Vercel Cron calls it with
+    "Authorization: Bearer $CRON_SECRET"; disabled unless CRON_SECRET is set)
+    """
+    secret = os.getenv("CRON_SECRET")
+    if not secret or not hmac.compare_digest(authorization or "", f"Bearer {secret}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
+    
+    purged = await run_in_threadpool(purge_sent_emails, db)
+    attempted = await drain_until_empty(OUTBOX_CRON_BATCHES)
+    return {"attempted": attempted, "purged": purged}
+
 @router.get("/statistics", response_model=StatisticsResponse)
 def get_statistics(db: Session = Depends(get_db)):
     """
@@ -1,8 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
 from core.database import get_db
-from models.models import User, UserSelection, StudySessionRating
+from models.models import User, UserSelection
 from models.schemas import (
     CursorPageParams,
     CursorPageResponse,
@@ -10,146 +9,70 @@ from models.schemas import (
     SelectBuddyRequest,
     SelectBuddyResponse,
 )
-from config.auth_dependencies import get_current_user
-from utils.similarity import sort_users_by_similarity
+from config.auth_dependencies import require_design
+from services.candidate_service import get_selection_query
+from services.ranking_service import is_feed_fresh, read_feed_page
+from services.rating_service import get_average_ratings
+from utils.pagination import decode_cursor, encode_cursor
+from utils.http_cache import check_not_modified, set_etag, user_etag
 
 router = APIRouter(prefix="/api", tags=["design1 list view"]) 
 
-
-def _apply_user_preferences_query(db: Session, current_user: User):
-    """
-    Get all users for soft matching. Preferences are used for ordering, not filtering.
-    Still respects candidate users' preferences (if they require a match, filter them out).
-    """
-    query = db.query(User).filter(
-        and_(
-            User.id != current_user.id,
-            User.profile_completed == True,
-            User.frontend_design == "design1",
-        )
-    )
-
-    # Don't filter by current_user's preferences - show all users, preferences will be used for ordering
-    
-    # Still respect the candidate users' preferences: if they toggled a filter, they require a match
-    # This ensures we don't show users who explicitly don't want to be matched with the current user
-    # 
-    # Logic: Show a candidate if:
-    # 1. They don't require a match for this field (match_by_* == False), OR
-    # 2. They require a match but don't have the field set (can't enforce requirement), OR
-    # 3. They require a match, have the field set, and it matches current_user's field
-    
-    # Candidate requires same gender
-    query = query.filter(
-        or_(
-            User.match_by_gender == False,  # Candidate doesn't require gender match
-            User.gender == None,  # Candidate requires match but doesn't have gender set
-            and_(
-                User.match_by_gender == True,
-                User.gender != None,
-                current_user.gender != None,
-                User.gender == current_user.gender
-            )  # Candidate requires match and genders match
-        )
-    )
-
-    # Candidate requires same major
-    query = query.filter(
-        or_(
-            User.match_by_major == False,  # Candidate doesn't require major match
-            User.major == None,  # Candidate requires match but doesn't have major set
-            and_(
-                User.match_by_major == True,
-                User.major != None,
-                current_user.major != None,
-                User.major == current_user.major
-            )  # Candidate requires match and majors match
-        )
-    )
-
-    # Candidate requires same academic year
-    query = query.filter(
-        or_(
-            User.match_by_academic_year == False,  # Candidate doesn't require academic year match
-            User.academic_year == None,  # Candidate requires match but doesn't have academic_year set
-            and_(
-                User.match_by_academic_year == True,
-                User.academic_year != None,
-                current_user.academic_year != None,
-                User.academic_year == current_user.academic_year
-            )  # Candidate requires match and academic years match
-        )
-    )
-
-    return query
+# Current user, for design1 users only (the design is checked from the token claims)
+get_list_view_user = require_design(
+    "design1", "This feature is only available for users on the list view design"
+)
 
 
 @router.get("/list/users", response_model=CursorPageResponse)
 def list_users(
+    request: Request,
+    response: Response,
     params: CursorPageParams = Depends(),
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_list_view_user),
     db: Session = Depends(get_db),
 ):
     """
-    List users using soft matching with cursor pagination.
+    List users using soft matching with keyset cursor pagination.
     All users are shown, but results are ordered by similarity to the current user (most similar first).
+    When the current user matches by classes, classmates are listed ahead of everyone else.
     Similarity is calculated based on the current user's preferences (only factors marked as important).
     Still respects candidate users' preferences (if they require a match, they are filtered out).
+    Answers 304 without ranking if the feed is fresh and nothing changed since the If-None-Match ETag.
     Only available for users with frontend_design == 'design1'.
     """
-    if current_user.frontend_design != "design1":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This feature is only available for users on the list view design",
-        )
-
-    # Get all matching users (with a reasonable limit to avoid performance issues)
-    # We fetch up to 1000 users, sort by similarity, then paginate
-    MAX_FETCH = 1000
-    base_q = _apply_user_preferences_query(db, current_user)
-    
-    all_matching_users = base_q.limit(MAX_FETCH).all()
-    
-    # Sort by similarity score (most similar first)
-    sorted_users = sort_users_by_similarity(current_user, all_matching_users)
-    
-    # Create a dictionary to quickly look up similarity scores
-    similarity_scores = {user.id: score for user, score in sorted_users}
+    limit = max(1, min(params.limit, 50))
     
-    # Extract just the users (without scores) for pagination
-    sorted_user_list = [user for user, _ in sorted_users]
+    # The cursor is an opaque keyset (tier, score, id) of the last item on the previous page
+    after = None
+    if params.cursor is not None:
+        try:
+            after = decode_cursor(params.cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor",
+            )
     
-    # Apply pagination
-    limit = max(1, min(params.limit, 50))
-    start_idx = 0
+    # A feed due for a rebuild may list new users, so only a fresh one can be revalidated
+    if is_feed_fresh(db, current_user):
+        check_not_modified(request, response, user_etag(current_user))
     
-    # If cursor is provided, find the cursor position in the sorted list
-    # The cursor represents the last user ID from the previous page
-    if params.cursor is not None and sorted_user_list:
-        # Find the index of the cursor user in the sorted list
-        cursor_idx = next((i for i, u in enumerate(sorted_user_list) if u.id == params.cursor), None)
-        if cursor_idx is not None:
-            start_idx = cursor_idx + 1
-        else:
-            # Cursor not found in current results, start from beginning
-            # This can happen if the user list changed or cursor is invalid
-            start_idx = 0
+    # The ranking is materialized per viewer (rebuilt lazily when stale), so a page
+    # is a single indexed range read; fetch one extra row to detect further pages
+    page = read_feed_page(db, current_user, after, limit + 1)
     
-    # Get the page of results
-    page_users = sorted_user_list[start_idx:start_idx + limit + 1]
-    has_more = len(page_users) > limit
-    items_to_return = page_users[:limit]
+    # Rebuilding the feed bumps the user's data_version; tag the response with the
+    # version it was read at so the next request can revalidate it
+    set_etag(response, user_etag(current_user))
     
-    # Calculate average ratings for all users in this page
-    user_ids = [u.id for u in items_to_return]
-    rating_stats = db.query(
-        StudySessionRating.rated_user_id,
-        func.avg((StudySessionRating.rating_1 + StudySessionRating.rating_2 + StudySessionRating.rating_3) / 3.0).label('avg_rating')
-    ).filter(
-        StudySessionRating.rated_user_id.in_(user_ids)
-    ).group_by(StudySessionRating.rated_user_id).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+    items_to_return = [user for user, _, _ in page]
+    similarity_scores = {user.id: score for user, score, _ in page}
     
-    rating_dict = {user_id: float(avg) for user_id, avg in rating_stats}
+    # Look up average ratings for all users in this page
+    rating_dict = get_average_ratings(db, [u.id for u in items_to_return])
 
     summaries = [
         ListUserSummary(
@@ -173,8 +96,11 @@ def list_users(
         for u in items_to_return
     ]
 
-    # Use the last item's ID as the next cursor
-    next_cursor = summaries[-1].id if summaries and has_more else None
+    # Encode the last item's rank key as the next cursor
+    next_cursor = None
+    if page and has_more:
+        last_user, last_score, last_tier = page[-1]
+        next_cursor = encode_cursor(last_tier, last_score, last_user.id)
 
     return CursorPageResponse(items=summaries, next_cursor=next_cursor, has_more=has_more)
 
@@ -182,19 +108,13 @@ def list_users(
 @router.post("/list/select", response_model=SelectBuddyResponse, status_code=status.HTTP_201_CREATED)
 def select_study_buddy(
     selection: SelectBuddyRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_list_view_user),
     db: Session = Depends(get_db),
 ):
     """
     Allow a design1 user to select another user as their desired study buddy.
     Persist the selection (idempotent).
     """
-    if current_user.frontend_design != "design1":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This feature is only available for users on the list view design",
-        )
-
     # Validate target user exists and matches base criteria (completed profile and not self)
     target = db.query(User).filter(User.id == selection.selected_user_id).first()
     if not target:
@@ -205,12 +125,7 @@ def select_study_buddy(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Target user's profile is not complete")
 
     # Idempotent create: check if selection already exists
-    existing = db.query(UserSelection).filter(
-        and_(
-            UserSelection.selector_id == current_user.id,
-            UserSelection.selected_user_id == target.id,
-        )
-    ).first()
+    existing = get_selection_query(db, current_user.id, target.id).first()
 
     if not existing:
         record = UserSelection(selector_id=current_user.id, selected_user_id=target.id)
@@ -1,36 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
 from typing import List
-from datetime import datetime, timedelta
 from core.database import get_db
 from models.models import User, UserApproval
 from models.schemas import (
-    ApprovalRequest, ApprovalResponse, MutualMatchResponse, MutualMatchesResponse, MessageResponse
+    ApprovalRequest, ApprovalResponse, MutualMatchResponse, MutualMatchesResponse, MessageResponse,
+    CursorPageParams, PotentialMatchesPageResponse
 )
-from config.auth_dependencies import get_current_user
-from utils.similarity import sort_users_by_similarity, calculate_similarity_score
+from config.auth_dependencies import require_design
+from services.feature_service import load_user_features
+from services.candidate_service import get_unreviewed_candidate_query
+from services.ranking_service import rank_top_k
+from services.match_service import (
+    lock_pair, sync_mutual_match, cleanup_stale_approvals, get_approval_query, get_mutual_matches_query
+)
+from services.event_service import publish_event
+from utils.pagination import decode_cursor, encode_cursor
+from utils.http_cache import check_not_modified, user_etag
+from utils.similarity import sort_users_by_similarity, score_users
 
 # Create router for mutual matching routes
 router = APIRouter(prefix="/api", tags=["mutual matching"])
 
+# Current user, for design2 users only (the design is checked from the token claims)
+get_mutual_matching_user = require_design(
+    "design2", "This feature is only available for users on the mutual matching design"
+)
+
 @router.post("/approve-user", response_model=ApprovalResponse, status_code=status.HTTP_201_CREATED)
 def approve_or_reject_user(
     approval_request: ApprovalRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_mutual_matching_user),
     db: Session = Depends(get_db)
 ):
     """
     Approve or reject a potential study buddy.
     Only available for users with design2 (mutual matching).
     """
-    # Check if user is on design2
-    if current_user.frontend_design != "design2":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This feature is only available for users on the mutual matching design"
-        )
-    
     # Check if the user to approve/reject exists
     target_user = db.query(User).filter(User.id == approval_request.approved_user_id).first()
     if not target_user:
@@ -46,32 +52,40 @@ def approve_or_reject_user(
             detail="You cannot approve or reject yourself"
         )
     
+    # Serialize with a concurrent approval in the other direction
+    lock_pair(db, current_user.id, approval_request.approved_user_id)
+    
     # Check if user has already acted on this person
-    existing_approval = db.query(UserApproval).filter(
-        and_(
-            UserApproval.approver_id == current_user.id,
-            UserApproval.approved_user_id == approval_request.approved_user_id
-        )
-    ).first()
+    existing_approval = get_approval_query(db, current_user.id, approval_request.approved_user_id).first()
     
     if existing_approval:
         # Update existing approval/rejection
         existing_approval.is_approved = approval_request.is_approved
-        approval_id = existing_approval.id
+        approval = existing_approval
         action = "updated"
     else:
         # Create new approval/rejection
-        new_approval = UserApproval(
+        approval = UserApproval(
             approver_id=current_user.id,
             approved_user_id=approval_request.approved_user_id,
             is_approved=approval_request.is_approved
         )
-        db.add(new_approval)
-        db.commit()
-        db.refresh(new_approval)
-        approval_id = new_approval.id
+        db.add(approval)
         action = "created"
     
+    # Record (or remove) the mutual match in the same transaction as the approval
+    is_match = sync_mutual_match(db, current_user.id, approval_request.approved_user_id)
+    db.commit()
+    db.refresh(approval)
+    approval_id = approval.id
+    
+    if is_match:
+        for user_id, matched_user_id in (
+            (current_user.id, approval_request.approved_user_id),
+            (approval_request.approved_user_id, current_user.id),
+        ):
+            publish_event(user_id, "mutual_match", matched_user_id=matched_user_id)
+    
     action_text = "approved" if approval_request.is_approved else "rejected"
     message = f"Successfully {action_text} user. Action {action}."
     
@@ -79,66 +93,30 @@ def approve_or_reject_user(
 
 @router.get("/mutual-matches", response_model=MutualMatchesResponse)
 def get_mutual_matches(
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_mutual_matching_user),
     db: Session = Depends(get_db)
 ):
     """
     Get all users who have mutually matched with the current user.
+    Answers 304 without querying if nothing changed since the If-None-Match ETag.
     Only available for users with design2 (mutual matching).
     """
-    # Check if user is on design2
-    if current_user.frontend_design != "design2":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This feature is only available for users on the mutual matching design"
-        )
+    check_not_modified(request, response, user_etag(current_user))
     
-    # Find mutual matches
-    # A mutual match is when:
-    # 1. Current user has approved another user (is_approved=True)
-    # 2. That other user has also approved the current user (is_approved=True)
+    # Read the materialized matches (written at approval time) with their match times
+    rows = get_mutual_matches_query(db, current_user.id).all()
     
-    # Get all users that the current user has approved
-    users_approved_by_current = db.query(UserApproval.approved_user_id).filter(
-        and_(
-            UserApproval.approver_id == current_user.id,
-            UserApproval.is_approved == True
-        )
-    ).subquery()
-    
-    # Get all users who have approved the current user
-    users_who_approved_current = db.query(UserApproval.approver_id).filter(
-        and_(
-            UserApproval.approved_user_id == current_user.id,
-            UserApproval.is_approved == True
-        )
-    ).subquery()
-    
-    # Find intersection - users who are both approved by current user AND have approved current user
-    mutual_matches = db.query(User).filter(
-        and_(
-            User.id.in_(users_approved_by_current),
-            User.id.in_(users_who_approved_current),
-            User.id != current_user.id
-        )
-    ).all()
+    # Score all matches in one batched pass
+    mutual_matches = [user for user, _ in rows]
+    features = load_user_features(db, mutual_matches + [current_user])
+    similarity_scores = {user.id: score for user, score in score_users(current_user, mutual_matches, features)}
     
     # Convert to response format
     matches_response = []
-    for user in mutual_matches:
-        # Get the most recent approval timestamp for the match
-        latest_approval = db.query(UserApproval).filter(
-            and_(
-                or_(
-                    and_(UserApproval.approver_id == current_user.id, UserApproval.approved_user_id == user.id),
-                    and_(UserApproval.approver_id == user.id, UserApproval.approved_user_id == current_user.id)
-                ),
-                UserApproval.is_approved == True
-            )
-        ).order_by(UserApproval.created_at.desc()).first()
-        
-        # Calculate similarity score
-        similarity_score = calculate_similarity_score(current_user, user)
+    for user, matched_at in rows:
+        similarity_score = similarity_scores[user.id]
         
         match_response = MutualMatchResponse(
             id=user.id,
@@ -154,7 +132,7 @@ def get_mutual_matches(
             favorite_study_spot=user.favorite_study_spot,
             mbti=user.mbti,
             yap_to_study_ratio=user.yap_to_study_ratio,
-            matched_at=latest_approval.created_at if latest_approval else user.created_at,
+            matched_at=matched_at,
             match_score=round(similarity_score, 3)  # Round to 3 decimal places
         )
         matches_response.append(match_response)
@@ -163,7 +141,7 @@ def get_mutual_matches(
 
 @router.get("/potential-matches", response_model=List[MutualMatchResponse])
 def get_potential_matches(
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_mutual_matching_user),
     db: Session = Depends(get_db)
 ):
     """
@@ -171,29 +149,15 @@ def get_potential_matches(
     Returns users that the current user hasn't approved or rejected yet.
     Only available for users with design2 (mutual matching).
     """
-    # Check if user is on design2
-    if current_user.frontend_design != "design2":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This feature is only available for users on the mutual matching design"
-        )
-    
     # Get users that the current user hasn't approved or rejected yet
     # and who have completed their profiles
-    users_already_acted_on = db.query(UserApproval.approved_user_id).filter(
-        UserApproval.approver_id == current_user.id
-    ).subquery()
+    base_q = get_unreviewed_candidate_query(db, current_user)
     
-    potential_matches = db.query(User).filter(
-        and_(
-            User.id != current_user.id,
-            User.profile_completed == True,
-            User.id.notin_(users_already_acted_on)
-        )
-    ).all()
+    potential_matches = base_q.all()
     
-    # Sort by similarity score (most similar first)
-    sorted_matches = sort_users_by_similarity(current_user, potential_matches)
+    # Sort by similarity score (most similar first) using the stored normalized features
+    features = load_user_features(db, potential_matches + [current_user])
+    sorted_matches = sort_users_by_similarity(current_user, potential_matches, features)
     
     # Convert to response format
     matches_response = []
@@ -219,58 +183,84 @@ def get_potential_matches(
     
     return matches_response
 
-@router.post("/cleanup-old-approvals", response_model=MessageResponse)
-def cleanup_old_approvals(
-    current_user: User = Depends(get_current_user),
+@router.get("/potential-matches/page", response_model=PotentialMatchesPageResponse)
+def get_potential_matches_page(
+    params: CursorPageParams = Depends(),
+    current_user: User = Depends(get_mutual_matching_user),
     db: Session = Depends(get_db)
 ):
     """
-    Remove approvals/rejections that are more than 7 days old and don't result in mutual matching.
+    Get the next page of potential study buddies, best matches first, with keyset cursor pagination.
+    Walking every page returns the same users as /potential-matches, but only the top `limit`
+    after the cursor are selected (bounded heap over a streamed scan), so each page costs the
+    same as enrollment grows.
+    The order is not always the same as /potential-matches, which is pure similarity order:
+    when the user matches by classes, classmates (found through the class index) are ranked
+    before everyone else, so pages that classmates fill never scan the rest of the pool. A
+    non-classmate who scores higher than some classmates therefore comes later here.
     Only available for users with design2 (mutual matching).
     """
-    # Check if user is on design2
-    if current_user.frontend_design != "design2":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="This feature is only available for users on the mutual matching design"
+    limit = max(1, min(params.limit, 50))
+    
+    # The cursor is an opaque keyset (tier, score, id) of the last item on the previous page
+    after = None
+    if params.cursor is not None:
+        try:
+            after = decode_cursor(params.cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+    
+    # Fetch one extra item to detect further pages
+    base_q = get_unreviewed_candidate_query(db, current_user)
+    page = rank_top_k(db, current_user, base_q, limit + 1, after)
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    items = [
+        MutualMatchResponse(
+            id=user.id,
+            name=user.name or "Unknown",
+            school_email=user.school_email,
+            gender=user.gender,
+            major=user.major,
+            academic_year=user.academic_year,
+            profile_picture=user.profile_picture,
+            classes_taking=user.classes_taking,
+            learn_best_when=user.learn_best_when,
+            study_snack=user.study_snack,
+            favorite_study_spot=user.favorite_study_spot,
+            mbti=user.mbti,
+            yap_to_study_ratio=user.yap_to_study_ratio,
+            matched_at=user.created_at,  # Use user creation date as fallback
+            match_score=round(similarity_score, 3)  # Round to 3 decimal places
         )
+        for user, similarity_score, _ in page
+    ]
     
-    # Calculate cutoff date (7 days ago)
-    cutoff_date = datetime.utcnow() - timedelta(days=7)
+    # Encode the last item's rank key as the next cursor
+    next_cursor = None
+    if page and has_more:
+        last_user, last_score, last_tier = page[-1]
+        next_cursor = encode_cursor(last_tier, last_score, last_user.id)
     
+    return PotentialMatchesPageResponse(items=items, next_cursor=next_cursor, has_more=has_more)
+
+@router.post("/cleanup-old-approvals", response_model=MessageResponse)
+def cleanup_old_approvals(
+    current_user: User = Depends(get_mutual_matching_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Remove approvals/rejections that are more than 7 days old and don't result in mutual matching.
+    Only available for users with design2 (mutual matching).
+    """
     try:
-        # Find all approvals older than 7 days
-        old_approvals = db.query(UserApproval).filter(
-            UserApproval.created_at < cutoff_date
-        ).all()
-        
-        deleted_count = 0
-        
-        for approval in old_approvals:
-            # Check if this approval results in a mutual match
-            # A mutual match exists if:
-            # 1. User A approved User B (this approval)
-            # 2. User B also approved User A
-            
-            approver_id = approval.approver_id
-            approved_user_id = approval.approved_user_id
-            
-            # Check if there's a reverse approval
-            reverse_approval = db.query(UserApproval).filter(
-                and_(
-                    UserApproval.approver_id == approved_user_id,
-                    UserApproval.approved_user_id == approver_id,
-                    UserApproval.is_approved == True
-                )
-            ).first()
-            
-            # If there's no reverse approval, this approval doesn't result in a mutual match
-            # and can be safely deleted
-            if not reverse_approval:
-                db.delete(approval)
-                deleted_count += 1
-        
-        db.commit()
+        # Delete approvals older than 7 days that aren't half of a mutual match (rejections,
+        # and approvals not approved back), in set-based batches
+        deleted_count = cleanup_stale_approvals(db, days_old=7)
         
         return MessageResponse(
             message=f"Successfully cleaned up {deleted_count} old approvals that didn't result in mutual matches."
@@ -1,7 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request, Response, UploadFile, File
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
-from typing import List
+from sqlalchemy import func
+from typing import List, Optional
 from datetime import datetime, date
 from core.database import get_db
 
@@ -10,16 +10,27 @@ from models.schemas import (
     UserCreate, UserUpdate, UserResponse, UserListResponse, MessageResponse,
     FilterOptionsResponse, PreferencesUpdate, ReachOutRequest, ReachOutResponse,
     ReportRequest, ReportResponse, ReachOutStatusResponse,
-    ConnectionsResponse, ConnectionInfo, MarkMetRequest, MarkMetResponse,
+    ConnectionsResponse, ConnectionInfo, ConnectionsSummaryResponse, MarkMetRequest, MarkMetResponse,
     RatingCriteriaResponse, SubmitRatingRequest, SubmitRatingResponse,
     UserNotesResponse, UserNoteResponse, SurveySubmission, SurveySubmissionResponse
 )
 from services.reputation_service import get_random_criteria, update_user_reputation
 from services.utils import assign_frontend_design
 from services.image_service import image_service
-from services.email_service import send_reach_out_email
+from services.email_service import queue_reach_out_email
+from services.email_outbox import deliver_after_response
 from services.censorship_service import validate_text_input
+from services.feature_service import refresh_user_features
+from services.rating_service import record_rating, get_rating_query, get_notes_query
+from services.statistics_service import get_reach_outs_sent_query
+from services.ranking_service import ranking_snapshot, rescore_for_user_change
+from services.connection_service import (
+    get_connection_rows, get_connection_summary, record_reach_out, record_met_change, record_connection_rating
+)
+from services.event_service import publish_event
 from config.auth_dependencies import get_current_user, get_current_active_user
+from utils.pagination import decode_id_cursor, encode_id_cursor
+from utils.http_cache import check_not_modified, user_etag
 
 # Create router for user management routes
 router = APIRouter(prefix="/api", tags=["users"])
@@ -30,18 +41,17 @@ DAILY_REACH_OUT_LIMIT = 5
 def get_today_reach_out_count(db: Session, user_id: int) -> int:
     """Get the count of reach outs sent by a user today"""
     today_start = datetime.combine(date.today(), datetime.min.time())
-    count = db.query(ReachOut).filter(
-        and_(
-            ReachOut.sender_id == user_id,
-            ReachOut.created_at >= today_start
-        )
-    ).count()
-    return count
+    return get_reach_outs_sent_query(db, user_id, today_start).count()
 
 # Get current user profile
 @router.get("/me", response_model=UserResponse)
-def get_current_user_profile(current_user: User = Depends(get_current_user)):
-    """Get current authenticated user's profile"""
+def get_current_user_profile(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    """Get current authenticated user's profile (304 if unchanged since the If-None-Match ETag)"""
+    check_not_modified(request, response, user_etag(current_user))
     return current_user
 
 # Get user profile by ID (users can only access their own profile)
@@ -96,9 +106,15 @@ def update_user(user_update: UserUpdate, current_user: User = Depends(get_curren
                         detail=error_msg
                     )
     
+    ranking_before = ranking_snapshot(current_user)
     for field, value in update_data.items():
         setattr(current_user, field, value)
     
+    # Keep the normalized similarity features in sync with the profile
+    refresh_user_features(db, current_user)
+    # Re-score ranked feeds only if a scoring field actually changed
+    rescore_for_user_change(db, current_user, ranking_before)
+    
     db.commit()
     db.refresh(current_user)
     
@@ -164,6 +180,7 @@ def complete_onboarding(prefs: PreferencesUpdate, current_user: User = Depends(g
         )
     
     # Update preference flags
+    ranking_before = ranking_snapshot(current_user)
     if prefs.match_by_gender is not None:
         current_user.match_by_gender = prefs.match_by_gender
     if prefs.match_by_major is not None:
@@ -177,6 +194,7 @@ def complete_onboarding(prefs: PreferencesUpdate, current_user: User = Depends(g
     
     # Mark onboarding as completed
     current_user.onboarding_completed = True
+    rescore_for_user_change(db, current_user, ranking_before)
     
     db.commit()
     db.refresh(current_user)
@@ -188,6 +206,7 @@ def complete_onboarding(prefs: PreferencesUpdate, current_user: User = Depends(g
 def update_preferences(prefs: PreferencesUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Update the authenticated user's match preference flags"""
     # Update preference flags
+    ranking_before = ranking_snapshot(current_user)
     if prefs.match_by_gender is not None:
         current_user.match_by_gender = prefs.match_by_gender
     if prefs.match_by_major is not None:
@@ -199,6 +218,9 @@ def update_preferences(prefs: PreferencesUpdate, current_user: User = Depends(ge
     if prefs.match_by_classes is not None:
         current_user.match_by_classes = prefs.match_by_classes
     
+    # Re-score ranked feeds only if a flag actually changed
+    rescore_for_user_change(db, current_user, ranking_before)
+    
     db.commit()
     db.refresh(current_user)
     
@@ -338,12 +360,13 @@ def delete_profile_picture(
 
 # Send reach out email
 @router.post("/reach-out", response_model=ReachOutResponse, status_code=status.HTTP_200_OK)
-async def send_reach_out(
+def send_reach_out(
     reach_out_request: ReachOutRequest,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Send a reach out email to another user"""
+    """Send a reach out email to another user (queued with the reach out, delivered through the email outbox)"""
     # Check if recipient exists
     recipient = db.query(User).filter(User.id == reach_out_request.recipient_user_id).first()
     if not recipient:
@@ -391,14 +414,6 @@ async def send_reach_out(
             )
     
     try:
-        # Send the email
-        await send_reach_out_email(
-            sender=current_user,
-            recipient=recipient,
-            personal_message=reach_out_request.personal_message,
-            db=db
-        )
-        
         # Track the reach out in database
         reach_out_record = ReachOut(
             sender_id=current_user.id,
@@ -406,7 +421,21 @@ async def send_reach_out(
             personal_message=reach_out_request.personal_message
         )
         db.add(reach_out_record)
+        record_reach_out(db, reach_out_record)
+        
+        # Queue the email in the same transaction
+        queue_reach_out_email(
+            sender=current_user,
+            recipient=recipient,
+            personal_message=reach_out_request.personal_message,
+            db=db
+        )
         db.commit()
+        deliver_after_response(background_tasks)
+        
+        # Both users now have a new connection to act on
+        for user_id in (current_user.id, recipient.id):
+            publish_event(user_id, "reach_out", reach_out_id=reach_out_record.id)
         
         # Get updated count
         updated_count = get_today_reach_out_count(db, current_user.id)
@@ -418,9 +447,10 @@ async def send_reach_out(
             remaining_reach_outs=remaining
         )
     except Exception as e:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to send email: {str(e)}"
+            detail=f"Failed to send reach out: {str(e)}"
         )
 
 # Report a user
@@ -486,54 +516,86 @@ def get_reach_out_status(
 # Get connections (users reached out to and reached out by)
 @router.get("/connections", response_model=ConnectionsResponse)
 def get_connections(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get list of users the current user has reached out to and who have reached out to them"""
-    # Get users reached out to (where current_user is sender)
-    reached_out_to_records = db.query(ReachOut).filter(
-        ReachOut.sender_id == current_user.id
-    ).all()
-    
-    # Get users who reached out (where current_user is recipient)
-    reached_out_by_records = db.query(ReachOut).filter(
-        ReachOut.recipient_id == current_user.id
-    ).all()
-    
-    # Check which connections have ratings
-    rating_reach_out_ids = set(
-        db.query(StudySessionRating.reach_out_id).filter(
-            StudySessionRating.rater_id == current_user.id
-        ).all()
-    )
-    rating_reach_out_ids = {r[0] for r in rating_reach_out_ids}
-    
-    def build_connection_info(reach_out: ReachOut, other_user: User) -> ConnectionInfo:
-        return ConnectionInfo(
-            id=reach_out.id,
-            user_id=other_user.id,
-            name=other_user.name,
-            school_email=other_user.school_email,
-            profile_picture=other_user.profile_picture,
-            reach_out_id=reach_out.id,
-            created_at=reach_out.created_at,
-            met=reach_out.met,
-            has_rating=reach_out.id in rating_reach_out_ids
-        )
-    
-    reached_out_to = [
-        build_connection_info(ro, ro.recipient)
-        for ro in reached_out_to_records
-    ]
+    """
+    Get list of users the current user has reached out to and who have reached out to them.
+    Both directions, the other users' profiles and the rating flags come from one query.
+    Without `limit` every connection is returned; with it, connections are paged newest
+    first across both lists and `next_cursor` fetches the next page.
+    Answers 304 without querying if nothing changed since the If-None-Match ETag.
+    """
+    check_not_modified(request, response, user_etag(current_user))
+    
+    before_id = None
+    if cursor is not None:
+        try:
+            before_id = decode_id_cursor(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
     
-    reached_out_by = [
-        build_connection_info(ro, ro.sender)
-        for ro in reached_out_by_records
-    ]
+    # Fetch one extra row to detect further pages
+    page_size = max(1, min(limit, 100)) if limit is not None else None
+    rows = get_connection_rows(
+        db, current_user.id, before_id, page_size + 1 if page_size is not None else None
+    )
+    has_more = page_size is not None and len(rows) > page_size
+    if has_more:
+        rows = rows[:page_size]
+    
+    reached_out_to = []
+    reached_out_by = []
+    for row in rows:
+        connection = ConnectionInfo(
+            id=row.reach_out_id,
+            user_id=row.user_id,
+            name=row.name,
+            school_email=row.school_email,
+            profile_picture=row.profile_picture,
+            reach_out_id=row.reach_out_id,
+            created_at=row.created_at,
+            met=row.met,
+            has_rating=bool(row.has_rating)
+        )
+        if row.sender_id == current_user.id:
+            reached_out_to.append(connection)
+        else:
+            reached_out_by.append(connection)
     
     return ConnectionsResponse(
         reached_out_to=reached_out_to,
-        reached_out_by=reached_out_by
+        reached_out_by=reached_out_by,
+        next_cursor=encode_id_cursor(rows[-1].reach_out_id) if has_more else None,
+        has_more=has_more
+    )
+
+# Get pending connection counters (cheap to poll)
+@router.get("/connections/summary", response_model=ConnectionsSummaryResponse)
+def get_connections_summary(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get counts of the current user's connections that need attention, from maintained counters.
+    `version` changes whenever the user's connections do; refetch /connections only when it moves.
+    """
+    stats = get_connection_summary(db, current_user.id)
+    if stats is None:
+        return ConnectionsSummaryResponse(awaiting_met=0, unrated_met=0, pending=0, version=0)
+    
+    return ConnectionsSummaryResponse(
+        awaiting_met=stats.awaiting_met_count,
+        unrated_met=stats.unrated_met_count,
+        pending=stats.awaiting_met_count + stats.unrated_met_count,
+        version=stats.version
     )
 
 # Mark connection as met or not met
@@ -544,9 +606,10 @@ def mark_connection_met(
     db: Session = Depends(get_db)
 ):
     """Mark whether a connection actually met or not"""
+    # Lock the connection so concurrent answers and ratings adjust the counters in order
     reach_out = db.query(ReachOut).filter(
         ReachOut.id == request.reach_out_id
-    ).first()
+    ).with_for_update().first()
     
     if not reach_out:
         raise HTTPException(
@@ -561,9 +624,17 @@ def mark_connection_met(
             detail="You can only mark your own connections"
         )
     
+    previous_met = reach_out.met
     reach_out.met = request.met
+    record_met_change(db, reach_out, previous_met)
     db.commit()
     
+    # Met is shared by both users; each of them can now rate the other
+    for user_id in (reach_out.sender_id, reach_out.recipient_id):
+        publish_event(user_id, "connection_met", reach_out_id=reach_out.id, met=reach_out.met)
+        if reach_out.met:
+            publish_event(user_id, "rating_due", reach_out_id=reach_out.id)
+    
     return MarkMetResponse(
         message="Connection status updated successfully",
         reach_out_id=reach_out.id
@@ -593,12 +664,7 @@ def get_rating_criteria(
         )
     
     # Check if already rated
-    existing_rating = db.query(StudySessionRating).filter(
-        and_(
-            StudySessionRating.reach_out_id == reach_out_id,
-            StudySessionRating.rater_id == current_user.id
-        )
-    ).first()
+    existing_rating = get_rating_query(db, reach_out_id, current_user.id).first()
     
     if existing_rating:
         # Return the criteria that were used
@@ -619,7 +685,8 @@ def submit_rating(
     db: Session = Depends(get_db)
 ):
     """Submit a rating for a study session"""
-    reach_out = db.query(ReachOut).filter(ReachOut.id == request.reach_out_id).first()
+    # Lock the connection so a concurrent met/not met answer adjusts the counters in order
+    reach_out = db.query(ReachOut).filter(ReachOut.id == request.reach_out_id).with_for_update().first()
     
     if not reach_out:
         raise HTTPException(
@@ -635,12 +702,7 @@ def submit_rating(
         )
     
     # Check if already rated
-    existing_rating = db.query(StudySessionRating).filter(
-        and_(
-            StudySessionRating.reach_out_id == request.reach_out_id,
-            StudySessionRating.rater_id == current_user.id
-        )
-    ).first()
+    existing_rating = get_rating_query(db, request.reach_out_id, current_user.id).first()
     
     if existing_rating:
         raise HTTPException(
@@ -669,8 +731,22 @@ def submit_rating(
     )
     
     db.add(rating)
+    
+    # Save reflection note if provided
+    if request.reflection_note:
+        note = UserNote(
+            user_id=current_user.id,
+            note_text=request.reflection_note
+        )
+        db.add(note)
+    
+    # Update the rated user's aggregates and the rater's pending counters in the same transaction
+    # (which also bumps the rater's data_version, covering the new note)
+    record_rating(db, rating)
+    record_connection_rating(db, reach_out, current_user.id)
     db.commit()
     db.refresh(rating)
+    publish_event(current_user.id, "connection_rated", reach_out_id=request.reach_out_id)
     
     # Update reputation of the rated user
     update_user_reputation(
@@ -681,15 +757,6 @@ def submit_rating(
         request.rating_3
     )
     
-    # Save reflection note if provided
-    if request.reflection_note:
-        note = UserNote(
-            user_id=current_user.id,
-            note_text=request.reflection_note
-        )
-        db.add(note)
-        db.commit()
-    
     return SubmitRatingResponse(
         message="Rating submitted successfully",
         rating_id=rating.id
@@ -698,13 +765,15 @@ def submit_rating(
 # Get user's personal notes (reflection notes)
 @router.get("/notes", response_model=UserNotesResponse)
 def get_user_notes(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get the current user's personal reflection notes"""
-    notes = db.query(UserNote).filter(
-        UserNote.user_id == current_user.id
-    ).order_by(UserNote.created_at.desc()).all()
+    """Get the current user's personal reflection notes (304 if unchanged since the If-None-Match ETag)"""
+    check_not_modified(request, response, user_etag(current_user))
+    
+    notes = get_notes_query(db, current_user.id).all()
     
     note_responses = [
         UserNoteResponse(
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark email rendering per template (see services/email_rendering.py).
+
+For each template it times, per email:
+- uncached: a new Jinja environment per render, as fastapi_mail's template loader does
+- html: a render with the precompiled template
+- text: making the plain-text version from the HTML
+- build: rendering both parts and building the MIME message the outbox sends
+
+Usage: python benchmark_email_rendering.py [--samples 500] [--templates reach_out.html]
+"""
+import sys
+import os
+import time
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from jinja2 import Environment, FileSystemLoader
+
+from services.email_rendering import EMAIL_TEMPLATE_FOLDER, html_to_text, load_email_templates, render_email
+from services.email_service import build_email
+
+# Typical template variables for each email
+SAMPLE_CONTEXTS = {
+    "verification.html": {
+        "name": "Jordan Lee",
+        "email": "jordanlee@umich.edu",
+        "major": "Computer Science",
+        "academic_year": "Junior",
+        "verification_url": "https://studybuddy.example.com/verify-email/483920",
+        "rejection_url": "https://api.studybuddy.example.com/api/reject-email/118274",
+        "verification_code": "483920",
+    },
+    "reach_out.html": {
+        "recipient_name": "Jordan Lee",
+        "recipient_email": "jordanlee@umich.edu",
+        "recipient_initials": "JL",
+        "recipient_major": "Computer Science",
+        "recipient_academic_year": "Junior",
+        "recipient_gender": "Non-binary",
+        "recipient_classes_taking": ["EECS 281", "EECS 370", "MATH 214"],
+        "sender_name": "Sam Rivera",
+        "sender_email": "samrivera@umich.edu",
+        "sender_initials": "SR",
+        "sender_major": "Data Science",
+        "sender_academic_year": "Junior",
+        "sender_gender": "Female",
+        "sender_classes_taking": ["EECS 281", "STATS 250"],
+        "sender_learn_best_when": "quiet library",
+        "sender_study_snack": "pretzels",
+        "sender_favorite_study_spot": "Hatcher",
+        "sender_mbti": "INTJ",
+        "sender_yap_to_study_ratio": "30/70",
+        "personal_message": "Want to work through the 281 projects together?",
+    },
+    "password_reset.html": {
+        "name": "Jordan Lee",
+        "reset_url": "https://studybuddy.example.com/reset-password/927461",
+    },
+}
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def time_calls(fn, samples: int) -> dict:
+    """Microseconds per call (p50/p99)"""
+    fn()  # warm up
+    timings = []
+    for _ in range(samples):
+        started_at = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started_at) * 1_000_000)
+    return {"p50": _percentile(timings, 0.5), "p99": _percentile(timings, 0.99)}
+
+
+def benchmark_template(name: str, samples: int) -> dict:
+    context = SAMPLE_CONTEXTS.get(name, {})
+    rendered = render_email(name, context)
+
+    def uncached():
+        Environment(loader=FileSystemLoader(str(EMAIL_TEMPLATE_FOLDER))).get_template(name).render(**context)
+
+    def build():
+        build_email("Subject", ["to@umich.edu"], render_email(name, context), ["cc@umich.edu"]).as_bytes()
+
+    return {
+        "template": name,
+        "html_bytes": len(rendered.html.encode()),
+        "uncached": time_calls(uncached, max(1, samples // 10)),
+        "html": time_calls(lambda: render_email(name, context).html, samples),
+        "text": time_calls(lambda: html_to_text(rendered.html), samples),
+        "build": time_calls(build, samples),
+    }
+
+
+def run_benchmark(names, samples: int) -> None:
+    started_at = time.perf_counter()
+    compiled = load_email_templates()
+    print(f"Compiled {len(compiled)} templates in {(time.perf_counter() - started_at) * 1000:.1f}ms; "
+          f"{samples} samples per measurement (p50 / p99 in microseconds)")
+    print(f"{'template':<22} {'KB':>5}  {'uncached':>15}  {'html':>13}  {'text':>13}  {'build':>13}")
+
+    for name in names or compiled:
+        result = benchmark_template(name, samples)
+        cells = [f"{result[key]['p50']:>6.0f} / {result[key]['p99']:<6.0f}" for key in ("uncached", "html", "text", "build")]
+        print(f"{name:<22} {result['html_bytes'] / 1024:>5.1f}  {cells[0]:>15}  " + "  ".join(cells[1:]))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure email template rendering time per template")
+    parser.add_argument("--samples", type=int, default=500, help="Renders timed per measurement (a tenth for uncached)")
+    parser.add_argument("--templates", nargs="+", help="Templates to measure (default: all in email_templates/)")
+
+    args = parser.parse_args()
+    run_benchmark(args.templates, args.samples)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark bcrypt on this machine to pick BCRYPT_ROUNDS (see services/password_policy.py).
+
+For each cost it measures single-hash latency (p50/p99) and hashes per second on one
+core, then throughput with the hashing pool's worker count, and recommends the highest
+cost whose p99 fits the login target. A login costs one hash at the stored cost.
+
+Usage: python benchmark_password_hashing.py [--rounds 10 11 12 13] [--target-ms 300]
+"""
+import sys
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.auth_utils import hash_password
+from services.hashing_service import HASH_WORKERS
+from services.password_policy import BCRYPT_ROUNDS
+
+PASSWORD = "benchmark-password-123"
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def time_hash(rounds: int) -> float:
+    """Milliseconds for one hash at this cost"""
+    started_at = time.perf_counter()
+    hash_password(PASSWORD, rounds=rounds)
+    return (time.perf_counter() - started_at) * 1000
+
+
+def benchmark_cost(rounds: int, samples: int, workers: int) -> dict:
+    """Latency on one core, then throughput with `workers` hashes running at once"""
+    time_hash(rounds)  # warm up
+    latencies = [time_hash(rounds) for _ in range(samples)]
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(time_hash, [rounds] * (samples * workers)))
+    elapsed = time.perf_counter() - started_at
+
+    return {
+        "rounds": rounds,
+        "p50_ms": _percentile(latencies, 0.5),
+        "p99_ms": _percentile(latencies, 0.99),
+        "per_core_per_second": 1000 / (sum(latencies) / len(latencies)),
+        "pool_per_second": samples * workers / elapsed,
+    }
+
+
+def run_benchmark(rounds_list, samples: int, workers: int, target_ms: float) -> None:
+    print(f"bcrypt benchmark: {samples} samples per cost, {workers} pool workers, "
+          f"{os.cpu_count()} CPUs, current BCRYPT_ROUNDS={BCRYPT_ROUNDS}")
+    print(f"{'cost':>4}  {'p50 ms':>8}  {'p99 ms':>8}  {'hash/s/core':>11}  {'hash/s pool':>11}")
+
+    recommended = None
+    for rounds in rounds_list:
+        result = benchmark_cost(rounds, samples, workers)
+        print(f"{result['rounds']:>4}  {result['p50_ms']:>8.1f}  {result['p99_ms']:>8.1f}  "
+              f"{result['per_core_per_second']:>11.1f}  {result['pool_per_second']:>11.1f}")
+        if result["p99_ms"] <= target_ms:
+            recommended = result
+
+    if recommended is None:
+        print(f"No cost tested meets a {target_ms:.0f}ms p99 per login.")
+        return
+    print(f"Highest cost with p99 <= {target_ms:.0f}ms: BCRYPT_ROUNDS={recommended['rounds']} "
+          f"(~{recommended['pool_per_second']:.0f} logins/s per worker process at {workers} hashing workers)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure bcrypt cost on this machine to choose BCRYPT_ROUNDS")
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13], help="bcrypt costs to measure")
+    parser.add_argument("--samples", type=int, default=20, help="Hashes timed per cost (per worker for throughput)")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS, help="Concurrent hashes for the throughput run (default HASH_WORKERS)")
+    parser.add_argument("--target-ms", type=float, default=300, help="Login p99 budget for a single hash")
+
+    args = parser.parse_args()
+    run_benchmark(sorted(args.rounds), args.samples, args.workers, args.target_ms)
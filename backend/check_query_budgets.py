@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Query budget regression check: calls the hot API endpoints against a fresh
+temporary SQLite database seeded with enough connections, ratings and approvals
+that a per-row (N+1) query pattern blows the budget, and fails if any endpoint
+runs more SQL statements than its budget allows.
+
+Budgets count every statement the request runs, including authentication.
+Exits with status 1 if any endpoint is over budget.
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Must be set before core.database is imported
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "query_budgets.db")
+
+from fastapi.testclient import TestClient
+from core.app import app
+from core.database import engine, SessionLocal
+from core.query_stats import query_budget
+from models.models import Base, User, ReachOut, StudySessionRating, UserApproval
+from services.auth_utils import create_user_access_token
+from services.match_service import sync_mutual_match
+from services.principal_cache import principal_cache
+
+# Number of other users seeded for each design; large enough that an N+1 shows up
+SEED_USERS = 12
+
+# Statements a request spends loading the current user: none when the principal cache is
+# on (EVENTS_BACKEND=postgres), one otherwise. Added to every budget below.
+PRINCIPAL_LOAD = 0 if principal_cache.ttl > 0 else 1
+
+# (method, path, design, max statements). Each endpoint is called once to warm up (the list
+# view's first call builds the feed, and the principal cache gets the viewer) and the
+# second, steady state call is budgeted.
+ENDPOINT_BUDGETS = [
+    ("GET", "/api/me", "design1", 0),
+    ("GET", "/api/reach-out/status", "design1", 1),
+    ("GET", "/api/connections", "design1", 1),
+    ("GET", "/api/connections?limit=5", "design1", 1),
+    ("GET", "/api/connections/summary", "design1", 1),
+    ("GET", "/api/list/users", "design1", 5),
+    ("GET", "/api/notes", "design1", 2),
+    ("GET", "/api/mutual-matches", "design2", 2),
+    ("GET", "/api/potential-matches/page", "design2", 7),
+]
+
+# (path, design, max statements) for a repeat request carrying the previous ETag in
+# If-None-Match, which must be answered 304 before any heavy query runs
+NOT_MODIFIED_BUDGETS = [
+    ("/api/me", "design1", 0),
+    ("/api/connections", "design1", 0),
+    ("/api/notes", "design1", 0),
+    ("/api/list/users", "design1", 1),
+    ("/api/mutual-matches", "design2", 0),
+]
+
+
+def _make_user(db, email: str, design: str) -> User:
+    user = User(
+        school_email=email, password_hash="not-a-real-hash", name=email.split("@")[0],
+        gender="Female", major="Computer Science", academic_year="Junior", frontend_design=design,
+        email_verified=True, profile_completed=True,
+        classes_taking=["EECS 281"], classes_taken=["EECS 203"], learn_best_when="quiet",
+        study_snack="chips", favorite_study_spot="ugli", mbti="INTJ", yap_to_study_ratio="50/50",
+        match_by_classes=True, survey_completed=True, onboarding_completed=True,
+    )
+    db.add(user)
+    return user
+
+
+def seed(db) -> dict:
+    """Create a viewer per design with connections, ratings and approvals. Returns viewer ids by design."""
+    viewers = {}
+    for design in ("design1", "design2"):
+        viewer = _make_user(db, f"viewer_{design}@umich.edu", design)
+        others = [_make_user(db, f"{design}_{i}@umich.edu", design) for i in range(SEED_USERS)]
+        db.flush()
+        viewers[design] = viewer.id
+
+        for i, other in enumerate(others):
+            # Connections in both directions, half of them rated by the viewer
+            sent = ReachOut(sender_id=viewer.id, recipient_id=other.id, met=True)
+            received = ReachOut(sender_id=other.id, recipient_id=viewer.id)
+            db.add_all([sent, received])
+            db.flush()
+            if i % 2 == 0:
+                db.add(StudySessionRating(
+                    rater_id=viewer.id, rated_user_id=other.id, reach_out_id=sent.id,
+                    criterion_1="timeliness", rating_1=5, criterion_2="focus", rating_2=4,
+                    criterion_3="helpfulness", rating_3=5,
+                ))
+
+            # Approvals both ways for a third of the users, so they are mutual matches
+            if design == "design2" and i % 3 == 0:
+                db.add(UserApproval(approver_id=viewer.id, approved_user_id=other.id, is_approved=True))
+                db.add(UserApproval(approver_id=other.id, approved_user_id=viewer.id, is_approved=True))
+                sync_mutual_match(db, viewer.id, other.id)
+
+    db.commit()
+    return viewers
+
+
+def check_query_budgets() -> int:
+    """Call every budgeted endpoint and print its statement count. Returns the number that failed."""
+    if not engine:
+        print("Database engine not available.")
+        return 1
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        viewers = seed(db)
+        # Tokens as issued at login, so the budgets cover claim-based authorization
+        tokens = {design: create_user_access_token(db.get(User, user_id)) for design, user_id in viewers.items()}
+    finally:
+        db.close()
+
+    client = TestClient(app)
+    failures = 0
+    for method, path, design, budget in ENDPOINT_BUDGETS:
+        budget += PRINCIPAL_LOAD
+        headers = {"Authorization": "Bearer " + tokens[design]}
+        # Warm up caches and materialized state so the budget covers the steady state
+        client.request(method, path, headers=headers)
+
+        try:
+            with query_budget(engine, budget) as stats:
+                response = client.request(method, path, headers=headers)
+        except AssertionError as e:
+            failures += 1
+            print(f"OVER       {method} {path}")
+            print(f"    {e}")
+            continue
+
+        if response.status_code >= 400:
+            failures += 1
+            print(f"ERROR      {method} {path}: {response.status_code} {response.text[:200]}")
+        else:
+            print(f"ok         {method} {path}: {stats.count}/{budget} queries")
+
+    for path, design, budget in NOT_MODIFIED_BUDGETS:
+        budget += PRINCIPAL_LOAD
+        headers = {"Authorization": "Bearer " + tokens[design]}
+        etag = client.get(path, headers=headers).headers.get("ETag")
+        if etag is None:
+            failures += 1
+            print(f"NO ETAG    GET {path}")
+            continue
+
+        try:
+            with query_budget(engine, budget) as stats:
+                response = client.get(path, headers={**headers, "If-None-Match": etag})
+        except AssertionError as e:
+            failures += 1
+            print(f"OVER       GET {path} (If-None-Match)")
+            print(f"    {e}")
+            continue
+
+        if response.status_code != 304:
+            failures += 1
+            print(f"MODIFIED   GET {path} (If-None-Match): {response.status_code}")
+        else:
+            print(f"ok         GET {path} (If-None-Match): {stats.count}/{budget} queries")
+
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check_query_budgets()
+    if failures:
+        print(f"{failures} endpoints failed or are over their query budget.")
+        sys.exit(1)
+    print("All endpoints are within their query budget.")
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Query plan regression check: runs EXPLAIN on the hot queries behind the API
+endpoints and fails if any of them falls back to a full table scan. The queries
+come from the same get_*_query builders in services/ that the endpoints call, so
+a change to a query is checked without editing this script.
+
+By default the check runs against a fresh temporary SQLite database created
+from the models; pass --use-configured-db to check the database in DATABASE_URL
+(on PostgreSQL, sequential scans are disabled for the check so the plan shows
+whether a usable index exists at all, regardless of table size).
+Exits with status 1 if any query does a full table scan.
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+if __name__ == "__main__" and "--use-configured-db" not in sys.argv[1:]:
+    # Must be set before core.database is imported
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "query_plans.db")
+
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from core.database import engine, SessionLocal
+from models.models import Base, User
+from services.candidate_service import (
+    get_candidate_query, get_reviewed_user_ids_query, get_selection_query, split_by_classmates
+)
+from services.connection_service import get_connections_page_query
+from services.email_outbox import get_due_emails_query
+from services.feature_service import get_class_index_query, get_user_features_query
+from services.match_service import get_approval_query, get_mutual_matches_query
+from services.principal_cache import get_user_by_email_query, get_user_query
+from services.ranking_service import get_feed_page_query, get_feed_state_query, get_feed_viewers_query
+from services.rating_service import (
+    get_average_ratings_query, get_notes_query, get_rating_query, get_recent_ratings_query
+)
+from services.statistics_service import get_reach_outs_sent_query
+from services.version_service import viewers_of
+
+USER_ID = 1
+OTHER_ID = 2
+REACH_OUT_ID = 1
+
+
+def _viewer() -> User:
+    """A design1 user who matches by classes, so the classmate tier is built."""
+    return User(
+        id=USER_ID, school_email="someone@umich.edu", profile_completed=True, frontend_design="design1",
+        gender="Female", major="Computer Science", academic_year="Junior",
+        classes_taking=["EECS 281", "MATH 214"], match_by_classes=True,
+    )
+
+
+def hot_queries(db: Session):
+    """
+    (name, query) pairs for the lookups the API endpoints run on every request, built by
+    the same service functions the endpoints call. Queries that scan the whole candidate
+    pool by design (ranking streams every candidate) are only checked for their index lookups.
+    """
+    since = datetime.utcnow() - timedelta(days=1)
+    viewer = _viewer()
+    classmates, _ = split_by_classmates(db, viewer, get_candidate_query(db, viewer))
+    return [
+        # Authentication (services/principal_cache.py, api/auth_routes.py)
+        ("user by id", get_user_query(db, USER_ID)),
+        ("user by email", get_user_by_email_query(db, "someone@umich.edu")),
+
+        # Design2 mutual matching (api/mutual_matching_routes.py, services/match_service.py)
+        ("approval by pair", get_approval_query(db, USER_ID, OTHER_ID)),
+        ("users already acted on", get_reviewed_user_ids_query(db, USER_ID)),
+        ("mutual matches", get_mutual_matches_query(db, USER_ID)),
+
+        # Design1 list view (api/list_view.py, services/ranking_service.py)
+        ("ranked feed state", get_feed_state_query(db, USER_ID)),
+        ("ranked feed page", get_feed_page_query(db, USER_ID, (0, -0.5, OTHER_ID)).limit(21)),
+        ("feeds listing a candidate", get_feed_viewers_query(db, OTHER_ID)),
+        ("users displaying a user", viewers_of(OTHER_ID)),
+        ("average ratings", get_average_ratings_query(db, [USER_ID, OTHER_ID])),
+        ("selection by pair", get_selection_query(db, USER_ID, OTHER_ID)),
+        ("user features", get_user_features_query(db, [USER_ID, OTHER_ID])),
+        ("classmates", classmates),
+        ("class index by user", get_class_index_query(db, USER_ID)),
+
+        # Reach outs, connections and ratings (api/user_routes.py)
+        ("daily reach out count", get_reach_outs_sent_query(db, USER_ID, since)),
+        ("connections page", get_connections_page_query(db, USER_ID, 100, 21)),
+        ("rating by connection and rater", get_rating_query(db, REACH_OUT_ID, USER_ID)),
+        ("recent ratings received", get_recent_ratings_query(db, USER_ID, since)),
+        ("notes", get_notes_query(db, USER_ID)),
+        ("due outbox emails", get_due_emails_query(db, datetime.utcnow()).limit(50)),
+    ]
+
+
+def explain(connection, query) -> list:
+    """Return the plan lines for a query (ORM Query or Core statement) on the connection's dialect."""
+    statement = getattr(query, "statement", query)
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params).fetchall()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql("EXPLAIN " + str(compiled), params).fetchall()
+    return [row[0] for row in rows]
+
+
+def full_scans(dialect_name: str, plan: list) -> list:
+    """Plan lines that read a whole table without an index."""
+    if dialect_name == "sqlite":
+        # "SCAN users" is a table scan; "SCAN x USING [COVERING] INDEX" and "SEARCH ..." use an index
+        return [line for line in plan if line.startswith("SCAN ") and " USING " not in line]
+    return [line for line in plan if "Seq Scan" in line]
+
+
+def check_query_plans(verbose: bool = False) -> int:
+    """Explain every hot query and print any full table scans. Returns the number of failing queries."""
+    if not engine:
+        print("Database engine not available. Set DATABASE_URL.")
+        return 1
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    failures = 0
+
+    try:
+        connection = db.connection()
+        if connection.dialect.name == "postgresql":
+            # Tiny tables make sequential scans look cheapest; only fail where no index applies
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+
+        for name, query in hot_queries(db):
+            plan = explain(connection, query)
+            scans = full_scans(connection.dialect.name, plan)
+            if scans:
+                failures += 1
+                print(f"FULL SCAN  {name}")
+                for line in plan:
+                    print(f"    {line}")
+            else:
+                print(f"ok         {name}")
+                if verbose:
+                    for line in plan:
+                        print(f"    {line}")
+    finally:
+        db.rollback()
+        db.close()
+
+    return failures
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fail if a hot API query does a full table scan")
+    parser.add_argument("--use-configured-db", action="store_true", help="Check the database in DATABASE_URL instead of a fresh SQLite database")
+    parser.add_argument("--verbose", action="store_true", help="Print the plan of every query")
+
+    args = parser.parse_args()
+
+    failures = check_query_plans(verbose=args.verbose)
+    if failures:
+        print(f"{failures} hot queries fall back to a full table scan.")
+        sys.exit(1)
+    print("All hot queries use an index.")
@@ -8,18 +8,20 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from sqlalchemy.orm import Session
 from core.database import SessionLocal
 from models.models import UserApproval
+from services.match_service import cleanup_stale_approvals, count_stale_approvals, CLEANUP_BATCH_SIZE
 from sqlalchemy import and_
 from datetime import datetime, timedelta
 
-def cleanup_old_approvals(days_old=7):
+def cleanup_old_approvals(days_old=7, batch_size=CLEANUP_BATCH_SIZE):
     """
     Remove approvals/rejections that are more than specified days old and don't result in mutual matching.
+    Deletes with set-based anti-join statements in batches, reporting progress after each batch.
     
     Args:
         days_old (int): Number of days old to consider for cleanup (default: 7)
+        batch_size (int): Maximum number of approvals deleted per statement
     
     Returns:
         int: Number of approvals deleted
@@ -27,37 +29,12 @@ def cleanup_old_approvals(days_old=7):
     db = SessionLocal()
     
     try:
-        # Calculate cutoff date
-        cutoff_date = datetime.utcnow() - timedelta(days=days_old)
-        
-        # Find all approvals older than cutoff date
-        old_approvals = db.query(UserApproval).filter(
-            UserApproval.created_at < cutoff_date
-        ).all()
-        
-        deleted_count = 0
-        
-        for approval in old_approvals:
-            # Check if this approval results in a mutual match
-            approver_id = approval.approver_id
-            approved_user_id = approval.approved_user_id
-            
-            # Check if there's a reverse approval (mutual match)
-            reverse_approval = db.query(UserApproval).filter(
-                and_(
-                    UserApproval.approver_id == approved_user_id,
-                    UserApproval.approved_user_id == approver_id,
-                    UserApproval.is_approved == True
-                )
-            ).first()
-            
-            # If there's no reverse approval, this approval doesn't result in a mutual match
-            # and can be safely deleted
-            if not reverse_approval:
-                db.delete(approval)
-                deleted_count += 1
-        
-        db.commit()
+        deleted_count = cleanup_stale_approvals(
+            db,
+            days_old=days_old,
+            batch_size=batch_size,
+            progress=lambda deleted: print(f"  ...deleted {deleted} so far"),
+        )
         print(f"Successfully cleaned up {deleted_count} old approvals that didn't result in mutual matches.")
         return deleted_count
         
@@ -122,6 +99,7 @@ if __name__ == "__main__":
     parser.add_argument("--days", type=int, default=7, help="Number of days old to consider for cleanup (default: 7)")
     parser.add_argument("--stats", action="store_true", help="Show approval statistics instead of cleaning up")
     parser.add_argument("--dry-run", action="store_true", help="Show what would be deleted without actually deleting")
+    parser.add_argument("--batch-size", type=int, default=CLEANUP_BATCH_SIZE, help=f"Approvals deleted per statement (default: {CLEANUP_BATCH_SIZE})")
     
     args = parser.parse_args()
     
@@ -130,16 +108,12 @@ if __name__ == "__main__":
     else:
         if args.dry_run:
             print(f"DRY RUN: Would clean up approvals older than {args.days} days")
-            # In a real dry run, you'd query and count without deleting
             db = SessionLocal()
             try:
-                cutoff_date = datetime.utcnow() - timedelta(days=args.days)
-                old_approvals = db.query(UserApproval).filter(
-                    UserApproval.created_at < cutoff_date
-                ).count()
-                print(f"Found {old_approvals} approvals older than {args.days} days")
+                would_delete = count_stale_approvals(db, days_old=args.days)
+                print(f"Would delete {would_delete} approvals older than {args.days} days that didn't result in mutual matches")
             finally:
                 db.close()
         else:
-            deleted_count = cleanup_old_approvals(args.days)
+            deleted_count = cleanup_old_approvals(args.days, args.batch_size)
             print(f"Cleanup completed. Deleted {deleted_count} old approvals.")
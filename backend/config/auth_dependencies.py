@@ -10,7 +10,11 @@ try:
     from fastapi.security import OAuth2PasswordBearer
     from core.database import get_db
     from models.models import User
-    from services.auth_utils import get_user_id_from_token
+    from services.auth_utils import verify_access_token
+    from services.principal_cache import load_principal
+    from services.token_service import (
+        Principal, principal_from_claims, principal_from_user, is_token_revoked
+    )
     
     # OAuth2 scheme - initialize lazily to avoid issues during import
     try:
@@ -38,7 +42,9 @@ except Exception as e:
     oauth2_scheme = None
     get_db = None
     User = None
-    get_user_id_from_token = None
+    verify_access_token = None
+    load_principal = None
+    Principal = None
 
 # Create fallback dependency functions
 def _fallback_token():
@@ -51,14 +57,14 @@ def _fallback_db():
 _token_dep = Depends(oauth2_scheme) if oauth2_scheme else Depends(_fallback_token)
 _db_dep = Depends(get_db) if get_db else Depends(_fallback_db)
 
-def get_current_user(
-    token: str = _token_dep,
-    db: Session = _db_dep
-):
+def authenticate_token(token: str, db: Session) -> Principal:
     """
-    Dependency to get the current authenticated user using OAuth2PasswordBearer
+    Authorize a token and return its Principal. Every request checks the token's
+    version against the user row (see services/token_service.py); gates satisfied in
+    the token's signed claims are taken from them, while older tokens and ones issued
+    before a gate was passed are checked against the row.
     """
-    if not oauth2_scheme or not get_db or not User or not get_user_id_from_token:
+    if not oauth2_scheme or not get_db or not User or not verify_access_token or not Principal:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Authentication dependencies not properly initialized. Check server logs."
@@ -71,43 +77,101 @@ def get_current_user(
     )
     
     try:
-        # Get user ID from token
-        user_id = get_user_id_from_token(token)
-        if not user_id:
+        # Decode the token (signature and expiry)
+        payload = verify_access_token(token) if token else None
+        if not payload or not payload.get("user_id"):
             raise credentials_exception
-            
-        # Get user from database
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
+        
+        # Tokens issued before the claims existed count as version 0
+        principal = principal_from_claims(payload)
+        user_id = int(payload["user_id"])
+        token_version = principal.token_version if principal else 0
+        
+        # Revocation: compare with the user's current token_version (from the principal
+        # cache when it is on, otherwise the database; the handler reuses this load)
+        user = load_principal(db, user_id)
+        if not user or is_token_revoked(token_version, user):
             raise credentials_exception
-            
-        # Check if user is verified and has completed profile
-        if user.email_verified is not True:
+        
+        if principal is None or not all((principal.email_verified, principal.password_set,
+                                         principal.profile_completed, principal.frontend_design)):
+            # Gates the token can't vouch for: check them on the user row
+            principal = principal_from_user(user)
+        
+        # Check if user is verified and has set a password
+        if not principal.email_verified:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Email not verified"
             )
             
-        if user.password_hash is None:
+        if not principal.password_set:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Password not set"
             )
             
-        return user
+        return principal
         
     except HTTPException:
         raise
     except Exception:
         raise credentials_exception
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+def get_current_principal(
+    token: str = _token_dep,
+    db: Session = _db_dep
+) -> Principal:
+    """
+    Dependency to authorize the current request from its token's claims
+    and the user's current token_version
+    """
+    return authenticate_token(token, db)
+
+def get_current_user(
+    principal: Principal = Depends(get_current_principal),
+    db: Session = _db_dep
+) -> User:
+    """
+    Dependency to get the current authenticated user using OAuth2PasswordBearer
+    """
+    # Get user (from the principal cache when possible, see services/principal_cache.py)
+    user = load_principal(db, principal.user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+def get_current_active_user(
+    principal: Principal = Depends(get_current_principal),
+    current_user: User = Depends(get_current_user)
+) -> User:
     """
     Dependency to get the current active user (with completed profile)
     """
-    if not current_user.profile_completed:
+    if not principal.profile_completed:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Profile not completed"
         )
     return current_user
+
+def require_design(design: str, detail: str):
+    """
+    Dependency factory for routes of one frontend design: checks the design claim
+    (403 with `detail` otherwise) before the current user is loaded, then returns the user
+    """
+    def get_design_user(
+        principal: Principal = Depends(get_current_principal),
+        db: Session = _db_dep
+    ) -> User:
+        if principal.frontend_design != design:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=detail
+            )
+        return get_current_user(principal=principal, db=db)
+    return get_design_user
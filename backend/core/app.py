@@ -33,6 +33,71 @@ try:
             except Exception as e:
                 logger.warning(f"⚠️  Survey migration error (non-critical): {e}")
                 # Continue anyway - migration can be run manually if needed
+            
+            # Add the per-user data_version column (idempotent); later steps load users
+            try:
+                from migrate_add_data_version import migrate_database as migrate_data_version
+                if migrate_data_version():
+                    logger.info("✅ Data version migration completed successfully")
+                else:
+                    logger.warning("⚠️  Data version migration had issues, but continuing...")
+            except Exception as e:
+                logger.warning(f"⚠️  Data version migration error (non-critical): {e}")
+            
+            # Add the per-user token_version column (idempotent); authentication reads it
+            try:
+                from migrate_add_token_version import migrate_database as migrate_token_version
+                if migrate_token_version():
+                    logger.info("✅ Token version migration completed successfully")
+                else:
+                    logger.warning("⚠️  Token version migration had issues, but continuing...")
+            except Exception as e:
+                logger.warning(f"⚠️  Token version migration error (non-critical): {e}")
+            
+            # Add the approval pair index and backfill mutual matches (idempotent)
+            try:
+                from migrate_add_mutual_matches import migrate_database as migrate_mutual_matches
+                if migrate_mutual_matches():
+                    logger.info("✅ Mutual matches migration completed successfully")
+                else:
+                    logger.warning("⚠️  Mutual matches migration had issues, but continuing...")
+            except Exception as e:
+                logger.warning(f"⚠️  Mutual matches migration error (non-critical): {e}")
+            
+            # Create indexes declared on existing tables (idempotent)
+            try:
+                from migrate_add_indexes import migrate_database as migrate_indexes
+                if migrate_indexes():
+                    logger.info("✅ Index migration completed successfully")
+                else:
+                    logger.warning("⚠️  Index migration had issues, but continuing...")
+            except Exception as e:
+                logger.warning(f"⚠️  Index migration error (non-critical): {e}")
+            
+            # Backfill similarity features, rating aggregates and connection counters for data created before their tables existed
+            try:
+                from core.database import SessionLocal
+                from services.feature_service import backfill_user_features, backfill_class_index
+                from services.rating_service import backfill_rating_stats
+                from services.connection_service import backfill_connection_stats
+                db = SessionLocal()
+                try:
+                    backfilled = backfill_user_features(db)
+                    if backfilled:
+                        logger.info(f"✅ Backfilled similarity features for {backfilled} users")
+                    indexed = backfill_class_index(db)
+                    if indexed:
+                        logger.info(f"✅ Backfilled class index for {indexed} users")
+                    rated = backfill_rating_stats(db)
+                    if rated:
+                        logger.info(f"✅ Backfilled rating stats for {rated} users")
+                    counted = backfill_connection_stats(db)
+                    if counted:
+                        logger.info(f"✅ Backfilled connection counters for {counted} users")
+                finally:
+                    db.close()
+            except Exception as e:
+                logger.warning(f"⚠️  Derived table backfill error (non-critical): {e}")
         except Exception as e:
             logger.warning(f"⚠️  Error creating database tables: {e}")
             # Continue anyway - tables might already exist or connection will fail later
@@ -48,6 +113,7 @@ user_router = None
 general_router = None
 mutual_matching_router = None
 list_view_router = None
+events_router = None
 
 # Store import errors for debugging
 import_errors = {}
@@ -127,6 +193,21 @@ except Exception as e:
     }
     logger.error(f"❌ Error importing list_view_router: {e}", exc_info=True)
 
+try:
+    from api.event_routes import router as events_router
+    logger.info("✅ Successfully imported events_router")
+except Exception as e:
+    import traceback
+    error_msg = str(e)
+    error_traceback = traceback.format_exc()
+    import_errors["events_router"] = {
+        "error": error_msg,
+        "traceback": error_traceback,
+        "exception_type": type(e).__name__,
+        "full_exception": repr(e)
+    }
+    logger.error(f"❌ Error importing events_router: {e}", exc_info=True)
+
 # Create FastAPI app
 app = FastAPI(
     title="Study Buddy API",
@@ -154,6 +235,10 @@ app = FastAPI(
             "name": "design1 list view",
             "description": "List view operations with cursor pagination for design1 users",
         },
+        {
+            "name": "events",
+            "description": "Server-Sent Events stream of notifications",
+        },
     ]
 )
 
@@ -194,8 +279,49 @@ app.add_middleware(
     allow_credentials=False,  # Not needed since we use JWT tokens, not cookies
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing", "X-DB-Queries", "X-DB-Repeated-Queries"],
 )
 
+# Report per-request SQL statement counts and database time (and log likely N+1s)
+try:
+    from core.database import engine
+    from core.query_stats import install_query_stats_middleware
+    install_query_stats_middleware(app, engine)
+except Exception as e:
+    logger.warning(f"⚠️  Query stats middleware not installed (non-critical): {e}")
+
+@app.on_event("startup")
+def load_email_templates_on_startup():
+    try:
+        from services.email_rendering import load_email_templates
+        names = load_email_templates()
+        logger.info(f"✅ Compiled {len(names)} email templates")
+    except Exception as e:
+        logger.warning(f"⚠️  Email templates not precompiled: {e}")
+
+# Deliver queued emails in the background of each worker process. Off by default on
+# Vercel, where nothing keeps running between requests: there the requests that queue
+# email send it after their response, and a cron retries failures (see email_outbox)
+@app.on_event("startup")
+async def start_email_outbox_worker():
+    from core.database import IS_VERCEL
+    if os.getenv("EMAIL_OUTBOX_WORKER", "0" if IS_VERCEL else "1") == "0":
+        return
+    try:
+        from services.email_outbox import outbox_worker
+        outbox_worker.start()
+        logger.info("✅ Email outbox worker started")
+    except Exception as e:
+        logger.warning(f"⚠️  Email outbox worker not started: {e}")
+
+@app.on_event("shutdown")
+async def stop_email_outbox_worker():
+    try:
+        from services.email_outbox import outbox_worker
+        await outbox_worker.stop()
+    except Exception as e:
+        logger.warning(f"⚠️  Error stopping email outbox worker: {e}")
+
 # Include routers (only if they were imported successfully)
 if auth_router:
     app.include_router(auth_router)
@@ -227,6 +353,12 @@ if list_view_router:
 else:
     logger.warning("⚠️  list_view_router not included (import failed)")
 
+if events_router:
+    app.include_router(events_router)
+    logger.info("✅ Included events_router")
+else:
+    logger.warning("⚠️  events_router not included (import failed)")
+
 # Add error handler for missing database
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
@@ -329,6 +461,7 @@ def list_all_routes():
             "general_router": general_router is not None,
             "mutual_matching_router": mutual_matching_router is not None,
             "list_view_router": list_view_router is not None,
+            "events_router": events_router is not None,
         }
     }
 
@@ -349,6 +482,7 @@ def detailed_health_check():
         "general_router": "loaded" if general_router else "failed to import",
         "mutual_matching_router": "loaded" if mutual_matching_router else "failed to import",
         "list_view_router": "loaded" if list_view_router else "failed to import",
+        "events_router": "loaded" if events_router else "failed to import",
     }
     
     loaded_count = sum(1 for status in routers_status.values() if status == "loaded")
@@ -385,13 +519,26 @@ def detailed_health_check():
         "general_router": [
             "api.general_routes",
             "models.schemas"
+        ],
+        "events_router": [
+            "api.event_routes",
+            "services.event_service",
+            "config.auth_dependencies"
         ]
     }
     
+    # Password hashing pool load (queue depth, shed requests, latency)
+    try:
+        from services.hashing_service import hashing_pool
+        password_hashing = hashing_pool.stats()
+    except Exception as e:
+        password_hashing = {"error": str(e)}
+    
     response = {
         "status": "ok" if loaded_count == total_count else "degraded",
         "database": db_status,
         "routers": routers_status,
+        "password_hashing": password_hashing,
         "summary": f"{loaded_count}/{total_count} routers loaded",
         "message": "Check import_errors below for detailed error messages" if loaded_count < total_count else "All systems operational"
     }
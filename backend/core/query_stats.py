@@ -0,0 +1,148 @@
+"""
+Per-request SQL statistics.
+
+SQLAlchemy engine events count the statements each request runs and the time
+spent in the database. The middleware reports them in the Server-Timing and
+X-DB-Queries response headers and logs statement shapes that repeat within one
+request, which usually means an N+1 (e.g. a lazy relationship load per row).
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# A statement shape repeated this many times in one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+# Collapses expanded IN lists and whitespace so "the same query with other ids" shares a shape
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryStats:
+    """Statements run and time spent in the database during one request."""
+
+    __slots__ = ("count", "duration", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0  # seconds
+        self.shapes: Counter = Counter()
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        """Statement shapes run at least `threshold` times, most frequent first."""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def statement_shape(statement: str) -> str:
+    """Normalize a SQL statement so repeated executions with different parameters compare equal."""
+    return _WHITESPACE.sub(" ", _IN_LIST.sub("(...)", statement)).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # The start time lives on the statement's execution context, so a statement that
+    # fails (no after event) leaves nothing behind on the pooled connection
+    if _current_stats.get() is not None and context is not None:
+        context._query_stats_start = time.perf_counter()
+
+
+def _record(statement: str, context) -> None:
+    stats = _current_stats.get()
+    started_at = getattr(context, "_query_stats_start", None)
+    if stats is None or started_at is None:
+        return
+    context._query_stats_start = None
+    stats.count += 1
+    stats.duration += time.perf_counter() - started_at
+    stats.shapes[statement_shape(statement)] += 1
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record(statement, context)
+
+
+def _handle_error(exception_context):
+    # Failed statements still cost a round trip
+    if exception_context.statement is not None:
+        _record(exception_context.statement, exception_context.execution_context)
+
+
+def install_query_events(engine) -> None:
+    """Attach the statement counting hooks to an engine (safe to call more than once)."""
+    if engine is None or event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Collect statistics for statements run in this context (and threads it hands work to)."""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+@contextmanager
+def query_budget(engine, max_queries: int) -> Iterator[QueryStats]:
+    """
+    Fail with AssertionError if the block runs more than max_queries statements on the engine.
+    Counts every statement on the engine regardless of context, so it also covers requests a
+    test client runs in another thread. Intended for tests and scripts, e.g.:
+
+        with query_budget(engine, 4):
+            client.get("/api/connections", headers=headers)
+    """
+    stats = QueryStats()
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        stats.count += 1
+        stats.shapes[statement_shape(statement)] += 1
+
+    event.listen(engine, "after_cursor_execute", count)
+    try:
+        yield stats
+    finally:
+        event.remove(engine, "after_cursor_execute", count)
+
+    if stats.count > max_queries:
+        shapes = "\n".join(f"  {n}x {shape[:200]}" for shape, n in stats.shapes.most_common())
+        raise AssertionError(f"Ran {stats.count} queries, budget is {max_queries}:\n{shapes}")
+
+
+def install_query_stats_middleware(app, engine) -> None:
+    """Report per-request database statistics in response headers and log likely N+1s."""
+    install_query_events(engine)
+
+    @app.middleware("http")
+    async def query_stats_middleware(request, call_next):
+        with track_queries() as stats:
+            response = await call_next(request)
+
+        duration_ms = stats.duration * 1000
+        response.headers["X-DB-Queries"] = str(stats.count)
+        response.headers["Server-Timing"] = f'db;dur={duration_ms:.1f};desc="{stats.count} queries"'
+
+        repeated = stats.repeated()
+        if repeated:
+            response.headers["X-DB-Repeated-Queries"] = str(len(repeated))
+            for shape, n in repeated:
+                logger.warning(
+                    f"⚠️  Possible N+1 in {request.method} {request.url.path}: "
+                    f"statement ran {n} times: {shape[:200]}"
+                )
+        return response
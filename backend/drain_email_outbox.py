@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Deliver every due email in the outbox and exit. Run on a schedule (e.g. every few
+minutes) where no long-running process hosts the outbox worker (EMAIL_OUTBOX_WORKER=0,
+serverless deployments) so failed sends get retried; it is safe to run alongside
+workers. On Vercel, schedule /api/cron/drain-email-outbox instead (see
+VERCEL_DEPLOYMENT.md).
+
+Usage: python drain_email_outbox.py [--requeue-dead] [--purge]
+"""
+import sys
+import os
+import asyncio
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.database import SessionLocal
+from services.email_outbox import drain_until_empty, purge_sent_emails, requeue_dead_emails
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Deliver due emails from the email outbox")
+    parser.add_argument("--requeue-dead", action="store_true", help="Retry emails that ran out of attempts")
+    parser.add_argument("--purge", action="store_true", help="Delete sent emails past the retention period")
+
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.requeue_dead:
+            print(f"Requeued {requeue_dead_emails(db)} dead emails")
+        if args.purge:
+            print(f"Purged {purge_sent_emails(db)} sent emails")
+    finally:
+        db.close()
+
+    print(f"Attempted {asyncio.run(drain_until_empty())} emails")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the data_version column (per-user change counter
+behind ETag/304 responses) to the users table.
+"""
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+from core.database import engine, SessionLocal
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_database():
+    """Add users.data_version (NOT NULL, default 0).
+    This migration is idempotent and safe to run multiple times.
+    """
+    if not engine:
+        logger.error("Database engine not available. Cannot run migration.")
+        return False
+    
+    db = SessionLocal()
+    try:
+        columns = [column["name"] for column in inspect(engine).get_columns("users")]
+        if "data_version" in columns:
+            logger.info("✅ data_version column already exists")
+            return True
+        
+        # Same statement works on SQLite and PostgreSQL; the default fills existing rows
+        logger.info("Adding data_version column to users table...")
+        db.execute(text("ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0"))
+        db.commit()
+        logger.info("✅ Added data_version column")
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    success = migrate_database()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Migration script to create the indexes declared on the models in existing databases.
+Base.metadata.create_all only creates indexes together with new tables, so indexes
+added to existing tables (user_approvals, user_selections, reach_outs,
+study_session_ratings, ...) are created here.
+"""
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from core.database import engine, SessionLocal
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_database():
+    """Deduplicate rows that would violate the unique indexes, then create any missing indexes.
+    This migration is idempotent and safe to run multiple times.
+    """
+    if not engine:
+        logger.error("Database engine not available. Cannot run migration.")
+        return False
+    
+    db = SessionLocal()
+    try:
+        from models.models import Base
+        
+        # Keep only the first selection for each (selector, selected user) pair,
+        # otherwise the unique index can't be created
+        result = db.execute(text("""
+            DELETE FROM user_selections
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM user_selections GROUP BY selector_id, selected_user_id
+            )
+        """))
+        db.commit()
+        if result.rowcount:
+            logger.info(f"Removed {result.rowcount} duplicate selections")
+        
+        # class_index (current and past classes) was replaced by class_taking_index,
+        # which startup backfills from classes_taking
+        db.execute(text("DROP TABLE IF EXISTS class_index"))
+        db.commit()
+        
+        created = 0
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                # checkfirst skips indexes that already exist (works on SQLite and PostgreSQL)
+                index.create(bind=engine, checkfirst=True)
+                created += 1
+        logger.info(f"✅ Verified {created} indexes")
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    success = migrate_database()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the unique (approver_id, approved_user_id) index to
+user_approvals and backfill the mutual_matches table.
+"""
+import sys
+import os
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from core.database import engine, SessionLocal
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def migrate_database():
+    """Deduplicate approvals, add the unique pair index and backfill mutual matches.
+    This migration is idempotent and safe to run multiple times.
+    """
+    if not engine:
+        logger.error("Database engine not available. Cannot run migration.")
+        return False
+    
+    db = SessionLocal()
+    try:
+        from models.models import Base
+        from services.match_service import backfill_mutual_matches
+        
+        # Make sure mutual_matches exists (create_all skips tables that are already there)
+        Base.metadata.create_all(bind=engine)
+        
+        # Keep only the newest approval for each (approver, approved user) pair,
+        # otherwise the unique index can't be created
+        result = db.execute(text("""
+            DELETE FROM user_approvals
+            WHERE id NOT IN (
+                SELECT MAX(id) FROM user_approvals GROUP BY approver_id, approved_user_id
+            )
+        """))
+        db.commit()
+        if result.rowcount:
+            logger.info(f"Removed {result.rowcount} duplicate approvals")
+        
+        # Same statement works on SQLite and PostgreSQL
+        db.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ux_user_approvals_pair "
+            "ON user_approvals (approver_id, approved_user_id)"
+        ))
+        db.commit()
+        logger.info("✅ user_approvals pair index verified")
+        
+        created = backfill_mutual_matches(db)
+        if created:
+            logger.info(f"✅ Backfilled {created} mutual match rows")
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ Migration failed: {e}")
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    success = migrate_database()
+    sys.exit(0 if success else 1)
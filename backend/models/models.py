@@ -1,5 +1,5 @@
 # backend/models/models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, JSON, ForeignKey, Float, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from core.database import Base
@@ -22,6 +22,10 @@ class User(Base):
     profile_completed = Column(Boolean, default=False)  # Track if profile setup is complete
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Bumped whenever anything this user can see changes; drives ETags (see services/version_service.py)
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Access tokens issued with an older version are revoked (see services/token_service.py)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Additional profile information
     classes_taking = Column(JSON, nullable=True)  # List of current classes
@@ -80,9 +84,13 @@ class UserApproval(Base):
     approver = relationship("User", foreign_keys=[approver_id], back_populates="approvals_given")
     approved_user = relationship("User", foreign_keys=[approved_user_id], back_populates="approvals_received")
     
-    # Ensure a user can only approve/reject another user once
+    # Ensure a user can only approve/reject another user once; also serves the reverse
+    # (B approved A?) lookup when checking for a mutual match
     __table_args__ = (
-        {"extend_existing": True}
+        Index("ux_user_approvals_pair", "approver_id", "approved_user_id", unique=True),
+        # Who approved/rejected a user (reverse lookups, approval statistics)
+        Index("ix_user_approvals_approved_user", "approved_user_id", "is_approved"),
+        {"extend_existing": True},
     )
 
 
@@ -98,6 +106,8 @@ class UserSelection(Base):
     # Not creating back_populates on User to avoid unintended loading; can be added later if needed
 
     __table_args__ = (
+        # A user can select another user at most once (also serves the idempotency check)
+        Index("ux_user_selections_pair", "selector_id", "selected_user_id", unique=True),
         {"sqlite_autoincrement": True},
     )
 
@@ -125,8 +135,8 @@ class ReachOut(Base):
     __tablename__ = "reach_outs"
 
     id = Column(Integer, primary_key=True, index=True)
-    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    recipient_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    recipient_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     personal_message = Column(Text, nullable=True)
     met = Column(Boolean, nullable=True)  # None = not specified, True = met, False = didn't meet
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -136,6 +146,8 @@ class ReachOut(Base):
     recipient = relationship("User", foreign_keys=[recipient_id])
     
     __table_args__ = (
+        # A sender's reach outs, and their daily count (sender_id, created_at >= today)
+        Index("ix_reach_outs_sender_created", "sender_id", "created_at"),
         {"extend_existing": True},
     )
 
@@ -167,6 +179,8 @@ class StudySessionRating(Base):
     reach_out = relationship("ReachOut")
     
     __table_args__ = (
+        # "Has this user already rated this connection?" probe
+        Index("ix_study_session_ratings_reach_out_rater", "reach_out_id", "rater_id"),
         {"extend_existing": True},
     )
 
@@ -222,3 +236,154 @@ class SurveyResponse(Base):
     __table_args__ = (
         {"extend_existing": True},
     )
+
+
+class UserFeatures(Base):
+    __tablename__ = "user_features"
+
+    # Normalized copy of the profile fields used for similarity scoring.
+    # Rebuilt whenever the profile is written so scoring never re-normalizes text.
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    gender = Column(String(20), nullable=True)  # lowercase
+    major = Column(String(100), nullable=True)  # lowercase
+    academic_year = Column(String(20), nullable=True)  # lowercase
+    mbti = Column(String(10), nullable=True)  # uppercase
+    yap_to_study_ratio = Column(String(50), nullable=True)  # lowercase
+    classes_taking = Column(JSON, nullable=True)  # Sorted list of lowercase, stripped class names
+    classes_taken = Column(JSON, nullable=True)
+    learn_best_when = Column(JSON, nullable=True)  # Sorted word list; None when the field is empty
+    study_snack = Column(JSON, nullable=True)
+    favorite_study_spot = Column(JSON, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relationship
+    user = relationship("User")
+
+    __table_args__ = (
+        {"extend_existing": True},
+    )
+
+
+class ClassIndexEntry(Base):
+    __tablename__ = "class_taking_index"
+
+    # Inverted index: normalized course code -> users currently taking it (classes_taking,
+    # the classes the scorer compares for classmates). Kept in sync with user_features
+    # on every profile write.
+    course_code = Column(String(100), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True, index=True)
+
+    __table_args__ = (
+        {"extend_existing": True},
+    )
+
+
+class RankedFeedEntry(Base):
+    __tablename__ = "ranked_feed"
+
+    # Materialized ranking of a viewer's list view: one row per candidate, in rank order
+    # (tier ascending, score descending, candidate id ascending)
+    viewer_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    candidate_id = Column(Integer, ForeignKey("users.id"), primary_key=True, index=True)
+    tier = Column(Integer, nullable=False, default=0)  # 0 = classmates (or single pool), 1 = general pool
+    score = Column(Float, nullable=False)  # Unrounded similarity score
+
+    __table_args__ = (
+        # Matches the page read's ORDER BY exactly, so pages come straight off the index
+        Index("ix_ranked_feed_viewer_rank", viewer_id, tier, score.desc(), candidate_id),
+        {"extend_existing": True},
+    )
+
+
+class RankedFeedState(Base):
+    __tablename__ = "ranked_feed_state"
+
+    # Presence of a row means the viewer's ranked_feed rows are current.
+    # Deleting it invalidates the feed; it is rebuilt on the next read.
+    viewer_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    built_at = Column(DateTime(timezone=True), nullable=False)
+    candidate_count = Column(Integer, nullable=False, default=0)
+    # Rank key of the last stored entry when the feed was cut off at FEED_SIZE; null when
+    # the feed holds every candidate. Entries ranked after it are computed on demand.
+    boundary_tier = Column(Integer, nullable=True)
+    boundary_score = Column(Float, nullable=True)
+    boundary_candidate_id = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        {"extend_existing": True},
+    )
+
+
+class UserRatingStats(Base):
+    __tablename__ = "user_rating_stats"
+
+    # Running aggregates of the study session ratings a user has received,
+    # maintained in the same transaction as each new StudySessionRating
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    rating_count = Column(Integer, nullable=False, default=0)  # Number of ratings (3 scores each)
+    rating_sum = Column(Integer, nullable=False, default=0)  # Sum of all scores
+    average_rating = Column(Float, nullable=True)  # rating_sum / (3 * rating_count)
+    criterion_sums = Column(JSON, nullable=False, default=dict)  # criterion -> sum of its scores
+    criterion_counts = Column(JSON, nullable=False, default=dict)  # criterion -> number of scores
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        {"extend_existing": True},
+    )
+
+
+class UserConnectionStats(Base):
+    __tablename__ = "user_connection_stats"
+
+    # Counts of a user's connections that need attention, maintained in the same
+    # transaction as each reach out, met/not met answer and rating
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    awaiting_met_count = Column(Integer, nullable=False, default=0)  # Connections with met not answered yet
+    unrated_met_count = Column(Integer, nullable=False, default=0)  # Met connections the user hasn't rated
+    version = Column(Integer, nullable=False, default=0)  # Incremented whenever the user's connections change
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        {"extend_existing": True},
+    )
+
+
+class MutualMatch(Base):
+    __tablename__ = "mutual_matches"
+
+    # Written when the second of two approvals makes a match, deleted when either side
+    # withdraws. Each match is stored once per direction so a user's matches are one
+    # primary key range read.
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    matched_user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    matched_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        {"extend_existing": True},
+    )
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    # Emails queued in the same transaction as the change they announce and delivered
+    # by the outbox worker (services/email_outbox.py), with retries and dead-lettering
+    id = Column(Integer, primary_key=True, index=True)
+    subject = Column(String(255), nullable=False)
+    recipients = Column(JSON, nullable=False)  # List of addresses
+    cc = Column(JSON, nullable=True)  # List of addresses
+    template_name = Column(String(100), nullable=True)  # File in email_templates, rendered with template_body
+    template_body = Column(JSON, nullable=True)  # Template variables
+    body = Column(Text, nullable=True)  # Ready HTML body when there is no template
+    status = Column(String(20), nullable=False, default="pending")  # pending, sending, sent or dead
+    attempts = Column(Integer, nullable=False, default=0)
+    # When the email is next due: the retry time while pending, the lease expiry while sending
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_due", "status", "next_attempt_at"),
+        {"extend_existing": True},
+    )
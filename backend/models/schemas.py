@@ -216,8 +216,13 @@ class MutualMatchesResponse(BaseModel):
     matches: List[MutualMatchResponse]
     total: int
 
+class PotentialMatchesPageResponse(BaseModel):
+    items: List[MutualMatchResponse]
+    next_cursor: Optional[str] = None
+    has_more: bool
+
 class CursorPageParams(BaseModel):
-    cursor: Optional[int] = None  # exclusive user.id to start after
+    cursor: Optional[str] = None  # opaque keyset cursor (next_cursor of the previous page)
     limit: int = 20
 
 class ListUserSummary(BaseModel):
@@ -243,7 +248,7 @@ class ListUserSummary(BaseModel):
 
 class CursorPageResponse(BaseModel):
     items: List[ListUserSummary]
-    next_cursor: Optional[int] = None
+    next_cursor: Optional[str] = None
     has_more: bool
 
 class SelectBuddyRequest(BaseModel):
@@ -296,6 +301,14 @@ class ConnectionInfo(BaseModel):
 class ConnectionsResponse(BaseModel):
     reached_out_to: List[ConnectionInfo]
     reached_out_by: List[ConnectionInfo]
+    next_cursor: Optional[str] = None  # set when paging with `limit` and more connections remain
+    has_more: bool = False
+
+class ConnectionsSummaryResponse(BaseModel):
+    awaiting_met: int  # connections with no met/not met answer yet
+    unrated_met: int  # met connections the user hasn't rated
+    pending: int  # awaiting_met + unrated_met
+    version: int  # changes whenever the user's connections change
 
 class MarkMetRequest(BaseModel):
     reach_out_id: int
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Utility script to rebuild the user_rating_stats aggregates from study_session_ratings.
+Run it after editing ratings by hand, or with --missing to only fill in users without stats.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.database import SessionLocal
+from services.rating_service import rebuild_rating_stats, backfill_rating_stats
+
+
+def main():
+    only_missing = "--missing" in sys.argv[1:]
+    db = SessionLocal()
+
+    try:
+        if only_missing:
+            count = backfill_rating_stats(db)
+            print(f"Backfilled rating stats for {count} users.")
+        else:
+            count = rebuild_rating_stats(db)
+            print(f"Rebuilt rating stats for {count} users.")
+        return 0
+    except Exception as e:
+        db.rollback()
+        print(f"Error rebuilding rating stats: {str(e)}")
+        return 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
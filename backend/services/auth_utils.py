@@ -8,6 +8,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 import os
 from dotenv import load_dotenv
+from services.password_policy import BCRYPT_ROUNDS
 
 # Load environment variables
 load_dotenv()
@@ -15,9 +16,10 @@ load_dotenv()
 # JWT Configuration
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-super-secret-key-change-in-production")
 ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", str(60 * 24 * 7)))
 
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
+    """Hash a password using bcrypt (at the policy's cost unless rounds is given)"""
     # Ensure password is a string
     if not isinstance(password, str):
         password = str(password)
@@ -30,7 +32,7 @@ def hash_password(password: str) -> str:
         password_bytes = password_bytes[:72]
     
     # Generate salt and hash
-    salt = bcrypt.gensalt(rounds=12)
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     
     return hashed.decode('utf-8')
@@ -48,11 +50,29 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """Create a JWT access token (no expiration)"""
+    """Create a JWT access token (expires after ACCESS_TOKEN_EXPIRE_MINUTES by default)"""
     to_encode = data.copy()
+    issued_at = datetime.utcnow()
+    to_encode["iat"] = issued_at
+    to_encode["exp"] = issued_at + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_user_access_token(user) -> str:
+    """
+    Create a user's access token carrying the gating fields and token_version as signed
+    claims, so requests can be authorized from them plus a revocation check (see
+    config/auth_dependencies.py)
+    """
+    return create_access_token(data={
+        "user_id": user.id,
+        "tv": user.token_version or 0,
+        "ev": user.email_verified is True,
+        "pw": user.password_hash is not None,
+        "pc": bool(user.profile_completed),
+        "fd": user.frontend_design,
+    })
+
 def verify_access_token(token: str) -> Optional[dict]:
     """Verify and decode a JWT access token"""
     try:
@@ -0,0 +1,156 @@
+"""
+Candidate generation for ranking: which users a viewer may see (and, reversed, who
+may see a candidate), the design2 swipe deck, and the classmate tier (found through the class index) that
+is ranked ahead of the general pool.
+"""
+from typing import Optional, Tuple
+from sqlalchemy import and_, or_, false
+from sqlalchemy.orm import Session, Query
+from models.models import User, UserApproval, UserSelection, ClassIndexEntry
+from services.feature_service import get_user_taking_codes
+
+
+def get_candidate_query(db: Session, current_user: User):
+    """
+    Get all users for soft matching. Preferences are used for ordering, not filtering.
+    Still respects candidate users' preferences (if they require a match, filter them out).
+    """
+    query = db.query(User).filter(
+        and_(
+            User.id != current_user.id,
+            User.profile_completed == True,
+            User.frontend_design == "design1",
+        )
+    )
+
+    # Don't filter by current_user's preferences - show all users, preferences will be used for ordering
+    
+    # Still respect the candidate users' preferences: if they toggled a filter, they require a match
+    # This ensures we don't show users who explicitly don't want to be matched with the current user
+    # 
+    # Logic: Show a candidate if:
+    # 1. They don't require a match for this field (match_by_* == False), OR
+    # 2. They require a match but don't have the field set (can't enforce requirement), OR
+    # 3. They require a match, have the field set, and it matches current_user's field
+    
+    # Candidate requires same gender
+    query = query.filter(
+        or_(
+            User.match_by_gender == False,  # Candidate doesn't require gender match
+            User.gender == None,  # Candidate requires match but doesn't have gender set
+            and_(
+                User.match_by_gender == True,
+                User.gender != None,
+                current_user.gender != None,
+                User.gender == current_user.gender
+            )  # Candidate requires match and genders match
+        )
+    )
+
+    # Candidate requires same major
+    query = query.filter(
+        or_(
+            User.match_by_major == False,  # Candidate doesn't require major match
+            User.major == None,  # Candidate requires match but doesn't have major set
+            and_(
+                User.match_by_major == True,
+                User.major != None,
+                current_user.major != None,
+                User.major == current_user.major
+            )  # Candidate requires match and majors match
+        )
+    )
+
+    # Candidate requires same academic year
+    query = query.filter(
+        or_(
+            User.match_by_academic_year == False,  # Candidate doesn't require academic year match
+            User.academic_year == None,  # Candidate requires match but doesn't have academic_year set
+            and_(
+                User.match_by_academic_year == True,
+                User.academic_year != None,
+                current_user.academic_year != None,
+                User.academic_year == current_user.academic_year
+            )  # Candidate requires match and academic years match
+        )
+    )
+
+    return query
+
+
+def get_reviewed_user_ids_query(db: Session, user_id: int):
+    """Query of the ids of users this user has approved or rejected."""
+    return db.query(UserApproval.approved_user_id).filter(UserApproval.approver_id == user_id)
+
+
+def get_unreviewed_candidate_query(db: Session, current_user: User):
+    """
+    Get completed profiles the current user hasn't approved or rejected yet
+    (the design2 swipe deck).
+    """
+    users_already_acted_on = get_reviewed_user_ids_query(db, current_user.id)
+
+    return db.query(User).filter(
+        and_(
+            User.id != current_user.id,
+            User.profile_completed == True,
+            User.id.notin_(users_already_acted_on)
+        )
+    )
+
+
+def split_by_classmates(db: Session, current_user: User, base_query: Query) -> Optional[Tuple[Query, Query]]:
+    """
+    Split a candidate query into (classmates, everyone else) using the class index.
+    Classmates take one of the current user's classes_taking in their own classes_taking,
+    the overlap the scorer rewards most. Returns None when the current user doesn't match
+    by classes or isn't taking any, since classmates then carry no ranking advantage and
+    the pool shouldn't be split.
+    """
+    if not current_user.match_by_classes:
+        return None
+
+    course_codes = get_user_taking_codes(db, current_user)
+    if not course_codes:
+        return None
+
+    classmate_ids = db.query(ClassIndexEntry.user_id).filter(
+        ClassIndexEntry.course_code.in_(course_codes)
+    ).distinct()
+
+    classmates_query = base_query.filter(User.id.in_(classmate_ids))
+    others_query = base_query.filter(User.id.notin_(classmate_ids))
+    return classmates_query, others_query
+
+
+def get_selection_query(db: Session, selector_id: int, selected_user_id: int):
+    """Query of a design1 user's selection of another user as their study buddy."""
+    return db.query(UserSelection).filter(
+        and_(
+            UserSelection.selector_id == selector_id,
+            UserSelection.selected_user_id == selected_user_id,
+        )
+    )
+
+
+def get_viewer_query(db: Session, candidate: User):
+    """
+    Get all users whose candidate query (see get_candidate_query) includes `candidate`.
+    This is the same visibility rule read the other way round, used to find whose
+    rankings change when one candidate's profile changes.
+    """
+    query = db.query(User).filter(User.id != candidate.id)
+
+    # Only completed design1 profiles are ever candidates
+    if not candidate.profile_completed or candidate.frontend_design != "design1":
+        return query.filter(false())
+
+    # If the candidate requires a match and has the field set, the viewer must share it
+    if candidate.match_by_gender and candidate.gender is not None:
+        query = query.filter(User.gender == candidate.gender)
+    if candidate.match_by_major and candidate.major is not None:
+        query = query.filter(User.major == candidate.major)
+    if candidate.match_by_academic_year and candidate.academic_year is not None:
+        query = query.filter(User.academic_year == candidate.academic_year)
+
+    return query
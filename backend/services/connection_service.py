@@ -0,0 +1,235 @@
+"""
+Connection service: a user's reach outs in both directions, with the counterpart
+user and whether the user has rated the connection, read in one query; and the
+per-user pending counters (the user_connection_stats table) behind the summary endpoint
+"""
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from datetime import datetime
+from sqlalchemy import case, exists, func, select, union_all, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.models import User, ReachOut, StudySessionRating, UserConnectionStats
+from services.version_service import bump_data_version
+
+
+class ConnectionRow(NamedTuple):
+    reach_out_id: int
+    sender_id: int
+    created_at: datetime
+    met: Optional[bool]
+    user_id: int
+    name: Optional[str]
+    school_email: str
+    profile_picture: Optional[str]
+    has_rating: bool
+
+
+def get_connections_query(db: Session, user_id: int):
+    """
+    Query of a user's reach outs in both directions joined to the other user's profile
+    columns, with a has_rating flag for whether the user has rated the connection.
+    """
+    # The counterpart is the recipient of reach outs the user sent, and the sender otherwise
+    counterpart_id = case(
+        (ReachOut.sender_id == user_id, ReachOut.recipient_id),
+        else_=ReachOut.sender_id
+    )
+    has_rating = exists().where(
+        and_(
+            StudySessionRating.reach_out_id == ReachOut.id,
+            StudySessionRating.rater_id == user_id
+        )
+    )
+
+    return db.query(
+        ReachOut.id.label("reach_out_id"),
+        ReachOut.sender_id,
+        ReachOut.created_at,
+        ReachOut.met,
+        User.id.label("user_id"),
+        User.name,
+        User.school_email,
+        User.profile_picture,
+        has_rating.label("has_rating"),
+    ).join(
+        User, User.id == counterpart_id
+    ).filter(
+        or_(ReachOut.sender_id == user_id, ReachOut.recipient_id == user_id)
+    )
+
+
+def get_connections_page_query(db: Session, user_id: int, before_id: Optional[int] = None,
+                               limit: Optional[int] = None):
+    """get_connections_query newest first (by reach out id), from before_id and up to limit rows."""
+    query = get_connections_query(db, user_id)
+    if before_id is not None:
+        query = query.filter(ReachOut.id < before_id)
+    query = query.order_by(ReachOut.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def get_connection_rows(db: Session, user_id: int, before_id: Optional[int] = None,
+                        limit: Optional[int] = None) -> List[ConnectionRow]:
+    """
+    A user's connections newest first (by reach out id), in one query.
+    Pass the last reach_out_id of the previous page as before_id to keyset paginate.
+    """
+    return [ConnectionRow(*row) for row in get_connections_page_query(db, user_id, before_id, limit).all()]
+
+
+def _lock_stats(db: Session, user_ids: Iterable[int]) -> Dict[int, UserConnectionStats]:
+    """
+    Get users' counter records locked for update (in id order, so concurrent writers
+    can't deadlock), creating empty ones where needed.
+    """
+    locked = {}
+    for user_id in sorted(set(user_ids)):
+        stats = db.query(UserConnectionStats).filter(
+            UserConnectionStats.user_id == user_id
+        ).with_for_update().first()
+        if stats is None:
+            # Create in a savepoint so a concurrent insert doesn't roll back the caller's transaction
+            try:
+                with db.begin_nested():
+                    stats = UserConnectionStats(user_id=user_id, awaiting_met_count=0,
+                                                unrated_met_count=0, version=0)
+                    db.add(stats)
+            except IntegrityError:
+                stats = db.query(UserConnectionStats).filter(
+                    UserConnectionStats.user_id == user_id
+                ).with_for_update().one()
+        locked[user_id] = stats
+    return locked
+
+
+def _adjust(stats: UserConnectionStats, awaiting_met: int = 0, unrated_met: int = 0) -> None:
+    stats.awaiting_met_count += awaiting_met
+    stats.unrated_met_count += unrated_met
+    stats.version += 1
+
+
+def record_reach_out(db: Session, reach_out: ReachOut) -> None:
+    """
+    Count a new reach out as awaiting a met/not met answer for both users.
+    Call this in the transaction that inserts the reach out; it does not commit.
+    """
+    stats = _lock_stats(db, [reach_out.sender_id, reach_out.recipient_id])
+    for user_stats in stats.values():
+        _adjust(user_stats, awaiting_met=1)
+    bump_data_version(db, stats.keys())
+
+
+def record_met_change(db: Session, reach_out: ReachOut, previous_met: Optional[bool]) -> None:
+    """
+    Update both users' counters after a connection's met flag changed from previous_met.
+    Call this in the transaction that writes the flag, with the reach out row locked; it does not commit.
+    """
+    user_ids = [reach_out.sender_id, reach_out.recipient_id]
+    stats = _lock_stats(db, user_ids)
+    raters = {
+        rater_id for (rater_id,) in db.query(StudySessionRating.rater_id).filter(
+            StudySessionRating.reach_out_id == reach_out.id
+        )
+    }
+    for user_id in user_ids:
+        awaiting_met = int(reach_out.met is None) - int(previous_met is None)
+        unrated_met = 0
+        if user_id not in raters:
+            unrated_met = int(reach_out.met is True) - int(previous_met is True)
+        _adjust(stats[user_id], awaiting_met, unrated_met)
+    bump_data_version(db, user_ids)
+
+
+def record_connection_rating(db: Session, reach_out: ReachOut, rater_id: int) -> None:
+    """
+    Update the rater's counters (and connection list and notes versions) after they rated a connection.
+    Call this in the transaction that inserts the rating, with the reach out row locked; it does not commit.
+    """
+    stats = _lock_stats(db, [rater_id])
+    _adjust(stats[rater_id], unrated_met=-1 if reach_out.met is True else 0)
+    bump_data_version(db, [rater_id])
+
+
+def get_connection_summary(db: Session, user_id: int) -> Optional[UserConnectionStats]:
+    """A user's pending counters (one primary key lookup), or None if they have no connections."""
+    return db.get(UserConnectionStats, user_id)
+
+
+def _count_connections(db: Session, user_ids: Optional[List[int]] = None):
+    """(user_id, awaiting_met, unrated_met) rows computed from reach_outs and ratings."""
+    sides = union_all(
+        select(ReachOut.sender_id.label("user_id"), ReachOut.id.label("reach_out_id"), ReachOut.met),
+        select(ReachOut.recipient_id.label("user_id"), ReachOut.id.label("reach_out_id"), ReachOut.met),
+    ).subquery()
+    rated = exists().where(
+        and_(
+            StudySessionRating.reach_out_id == sides.c.reach_out_id,
+            StudySessionRating.rater_id == sides.c.user_id
+        )
+    )
+    query = select(
+        sides.c.user_id,
+        func.sum(case((sides.c.met == None, 1), else_=0)),
+        func.sum(case((and_(sides.c.met == True, ~rated), 1), else_=0)),
+    ).group_by(sides.c.user_id)
+    if user_ids is not None:
+        query = query.where(sides.c.user_id.in_(user_ids))
+    return db.execute(query).all()
+
+
+def rebuild_connection_stats(db: Session, user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute pending counters from reach_outs and study_session_ratings and commit.
+    Rebuilds every user with connections when user_ids is None. Versions are bumped,
+    never reset, so clients holding an old version refetch. Returns the number of records written.
+    """
+    if user_ids is not None:
+        user_ids = list(user_ids)
+    existing = {
+        stats.user_id: stats for stats in (
+            db.query(UserConnectionStats).filter(UserConnectionStats.user_id.in_(user_ids))
+            if user_ids is not None else db.query(UserConnectionStats)
+        )
+    }
+
+    written = 0
+    for user_id, awaiting_met, unrated_met in _count_connections(db, user_ids):
+        stats = existing.pop(user_id, None)
+        if stats is None:
+            stats = UserConnectionStats(user_id=user_id, version=0)
+            db.add(stats)
+        stats.awaiting_met_count = int(awaiting_met or 0)
+        stats.unrated_met_count = int(unrated_met or 0)
+        stats.version = (stats.version or 0) + 1
+        written += 1
+
+    # Users whose connections are all gone
+    for stats in existing.values():
+        stats.awaiting_met_count = stats.unrated_met_count = 0
+        stats.version += 1
+
+    db.commit()
+    return written
+
+
+def backfill_connection_stats(db: Session) -> int:
+    """
+    Build counters for users with connections that don't have a record yet.
+    Safe to run repeatedly; returns the number of records created.
+    """
+    sides = union_all(
+        select(ReachOut.sender_id.label("user_id")),
+        select(ReachOut.recipient_id.label("user_id")),
+    ).subquery()
+    missing_ids = [
+        user_id for (user_id,) in db.execute(
+            select(sides.c.user_id).distinct().outerjoin(
+                UserConnectionStats, UserConnectionStats.user_id == sides.c.user_id
+            ).where(UserConnectionStats.user_id == None)
+        )
+    ]
+    if not missing_ids:
+        return 0
+    return rebuild_connection_stats(db, missing_ids)
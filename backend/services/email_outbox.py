@@ -0,0 +1,321 @@
+"""
+Email outbox: emails are queued as email_outbox rows in the same transaction as the
+change they announce (enqueue_email), so requests never wait on SMTP and a rolled
+back change sends nothing. A background worker in each process delivers them:
+- batches are claimed with a lease (status "sending", next_attempt_at = lease end),
+  with SKIP LOCKED on PostgreSQL so workers never claim the same rows; rows of a
+  worker that died mid-batch are claimed again once their lease ends
+- failed sends are retried with exponential backoff, and marked "dead" (kept with
+  their last error) after OUTBOX_MAX_ATTEMPTS
+Delivery is at least once. Committing a transaction that queued email wakes the
+worker in that process; otherwise it polls every OUTBOX_POLL_INTERVAL seconds.
+
+Serverless deployments (Vercel) can't keep a worker running between requests, so it
+is off there (EMAIL_OUTBOX_WORKER=0). Endpoints that queue email call
+deliver_after_response, which sends it after the response within the same
+invocation whenever no worker runs; retries of failed sends need a scheduled drain
+(drain_email_outbox.py, or the /api/cron/drain-email-outbox endpoint).
+"""
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.background import BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+
+from models.models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# Emails claimed per batch
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+
+# Emails of a batch sent at once
+OUTBOX_SEND_CONCURRENCY = int(os.getenv("OUTBOX_SEND_CONCURRENCY", "4"))
+
+# Attempts before an email is marked dead
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
+# Seconds before the first retry (doubling per attempt, up to OUTBOX_RETRY_MAX)
+OUTBOX_RETRY_BASE = 30
+OUTBOX_RETRY_MAX = 3600
+
+# Seconds a claimed batch is reserved for its worker
+OUTBOX_LEASE = 300
+
+# Seconds between checks for due emails when nothing wakes the worker
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "10"))
+
+# Days sent emails are kept before they are purged
+SENT_RETENTION_DAYS = 7
+
+# Batches a request sends after its response when no worker runs
+OUTBOX_AFTER_RESPONSE_BATCHES = 1
+
+# Batches one scheduled drain request sends (stays within serverless time limits)
+OUTBOX_CRON_BATCHES = 5
+
+
+class OutboxMessage(NamedTuple):
+    """A claimed email, detached from its session for sending"""
+    id: int
+    subject: str
+    recipients: List[str]
+    cc: List[str]
+    template_name: Optional[str]
+    template_body: Optional[dict]
+    body: Optional[str]
+    attempts: int
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue_email(db: Session, subject: str, recipients: List[str], template_name: Optional[str] = None,
+                  template_body: Optional[dict] = None, body: Optional[str] = None,
+                  cc: Optional[List[str]] = None) -> EmailOutbox:
+    """
+    Queue an HTML email, rendered from template_name with template_body or given as body.
+    Does not commit: it is sent once the caller's transaction commits.
+    """
+    email = EmailOutbox(
+        subject=subject,
+        recipients=list(recipients),
+        cc=list(cc or []),
+        template_name=template_name,
+        template_body=template_body,
+        body=body,
+        status="pending",
+        attempts=0,
+        next_attempt_at=_now(),
+    )
+    db.add(email)
+    db.info["email_queued"] = True
+    return email
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_worker_after_commit(session):
+    if session.info.pop("email_queued", False):
+        outbox_worker.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_queued_email(session):
+    session.info.pop("email_queued", None)
+
+
+def get_due_emails_query(db: Session, now: datetime):
+    """Query of the emails due for a send attempt at `now` (new, or with an expired lease or backoff), oldest first."""
+    return db.query(EmailOutbox).filter(
+        EmailOutbox.status.in_(("pending", "sending")),
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(
+        EmailOutbox.next_attempt_at, EmailOutbox.id
+    )
+
+
+def claim_batch(db: Session, limit: int = OUTBOX_BATCH_SIZE) -> List[OutboxMessage]:
+    """Lease up to `limit` due emails to this worker and commit. Returns them oldest first."""
+    now = _now()
+    rows = get_due_emails_query(db, now).limit(limit).with_for_update(skip_locked=True).all()
+
+    messages = []
+    for row in rows:
+        row.status = "sending"
+        row.attempts += 1
+        row.next_attempt_at = now + timedelta(seconds=OUTBOX_LEASE)
+        messages.append(OutboxMessage(
+            id=row.id, subject=row.subject, recipients=row.recipients or [], cc=row.cc or [],
+            template_name=row.template_name, template_body=row.template_body, body=row.body,
+            attempts=row.attempts,
+        ))
+    db.commit()
+    return messages
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before the next attempt after `attempts` failed ones (with jitter)"""
+    delay = min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def record_results(db: Session, results: Dict[int, Optional[str]]) -> None:
+    """Mark claimed emails sent, or schedule a retry / dead-letter the failed ones, and commit."""
+    if not results:
+        return
+    now = _now()
+    for row in db.query(EmailOutbox).filter(EmailOutbox.id.in_(list(results))):
+        error = results[row.id]
+        if error is None:
+            row.status = "sent"
+            row.sent_at = now
+            row.last_error = None
+        elif row.attempts >= OUTBOX_MAX_ATTEMPTS:
+            row.status = "dead"
+            row.last_error = error
+            logger.error(f"❌ Email {row.id} ({row.subject}) dead after {row.attempts} attempts: {error}")
+        else:
+            row.status = "pending"
+            row.next_attempt_at = now + timedelta(seconds=retry_delay(row.attempts))
+            row.last_error = error
+    db.commit()
+
+
+def purge_sent_emails(db: Session, older_than_days: int = SENT_RETENTION_DAYS) -> int:
+    """Delete sent emails older than the retention period and commit. Returns the number deleted."""
+    cutoff = _now() - timedelta(days=older_than_days)
+    deleted = db.query(EmailOutbox).filter(
+        EmailOutbox.status == "sent",
+        EmailOutbox.sent_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def requeue_dead_emails(db: Session) -> int:
+    """Give dead emails a fresh set of attempts and commit. Returns the number requeued."""
+    requeued = db.query(EmailOutbox).filter(EmailOutbox.status == "dead").update(
+        {"status": "pending", "attempts": 0, "next_attempt_at": _now()},
+        synchronize_session=False
+    )
+    db.commit()
+    return requeued
+
+
+def _with_session(fn, *args):
+    from core.database import SessionLocal
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def drain_outbox(send: Optional[Callable[[OutboxMessage], Awaitable[None]]] = None) -> int:
+    """
+    Claim one batch of due emails, send them and record the outcomes.
+    Returns the number of emails attempted.
+    """
+    if send is None:
+        from services.email_service import deliver_outbox_email
+        send = deliver_outbox_email
+
+    messages = await run_in_threadpool(_with_session, claim_batch, OUTBOX_BATCH_SIZE)
+    if not messages:
+        return 0
+
+    semaphore = asyncio.Semaphore(max(1, OUTBOX_SEND_CONCURRENCY))
+
+    async def attempt(message: OutboxMessage) -> Optional[str]:
+        async with semaphore:
+            try:
+                await send(message)
+                return None
+            except Exception as e:
+                logger.warning(f"⚠️  Email {message.id} attempt {message.attempts} failed: {e}")
+                return f"{type(e).__name__}: {e}"[:1000]
+
+    errors = await asyncio.gather(*(attempt(message) for message in messages))
+    results = {message.id: error for message, error in zip(messages, errors)}
+    await run_in_threadpool(_with_session, record_results, results)
+    return len(messages)
+
+
+async def drain_until_empty(max_batches: Optional[int] = None) -> int:
+    """
+    Send batches until no email is due (or max_batches were sent), then close this
+    loop's SMTP connections. Returns the number of emails attempted.
+    """
+    from services.smtp_pool import close_smtp_pool
+    total = batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            attempted = await drain_outbox()
+            if not attempted:
+                break
+            total += attempted
+            batches += 1
+    finally:
+        await close_smtp_pool()
+    return total
+
+
+def deliver_after_response(background_tasks: BackgroundTasks) -> None:
+    """
+    Call after committing queued email: when this process has no outbox worker
+    (serverless), the email is sent once the response is out, in the same request.
+    """
+    if not outbox_worker.running:
+        background_tasks.add_task(drain_until_empty, OUTBOX_AFTER_RESPONSE_BATCHES)
+
+
+class OutboxWorker:
+    """Drains the outbox in the background of one process's event loop."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start the worker on the running event loop (no-op if already running)."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        from services.smtp_pool import close_smtp_pool
+        await close_smtp_pool()
+
+    def wake(self) -> None:
+        """Check for due emails now (thread-safe; no-op when the worker isn't running)."""
+        if not self.running:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # The loop is closed; the worker is gone with it
+            pass
+
+    async def _run(self) -> None:
+        last_purge = None
+        while True:
+            try:
+                if last_purge is None or _now() - last_purge > timedelta(hours=1):
+                    await run_in_threadpool(_with_session, purge_sent_emails)
+                    last_purge = _now()
+                self._wakeup.clear()
+                if await drain_outbox() >= OUTBOX_BATCH_SIZE:
+                    # More may be due already
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️  Email outbox worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+outbox_worker = OutboxWorker()
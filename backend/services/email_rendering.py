@@ -0,0 +1,132 @@
+"""
+Email rendering: the Jinja templates in email_templates/ are compiled once per process
+(load_email_templates runs at startup) instead of being parsed again for every send,
+which is what fastapi_mail's template loader does. Compiled templates keep their static
+markup (styles, headers, footers) as constant strings, so a render only fills in the
+variables.
+
+Every email is sent as multipart/alternative: the HTML plus a plain-text version made
+from it (html_to_text), for clients that don't show HTML and for spam filters that
+penalize HTML-only mail. Rendering is CPU work, so the outbox worker runs it in a
+thread (render_email_async) rather than on the event loop.
+"""
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from starlette.concurrency import run_in_threadpool
+
+EMAIL_TEMPLATE_FOLDER = Path(__file__).resolve().parent.parent / "email_templates"
+
+_environment = Environment(
+    loader=FileSystemLoader(str(EMAIL_TEMPLATE_FOLDER)),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+    cache_size=-1,
+)
+
+
+class RenderedEmail(NamedTuple):
+    html: str
+    text: str
+
+
+def load_email_templates() -> List[str]:
+    """Compile every email template now (on startup) so no send pays for it. Returns their names."""
+    names = _environment.list_templates(extensions=["html"])
+    for name in names:
+        _environment.get_template(name)
+    return names
+
+
+def render_email(template_name: Optional[str] = None, context: Optional[dict] = None,
+                 html: Optional[str] = None) -> RenderedEmail:
+    """Render a template with context (or take ready-made html) and add its plain-text version."""
+    if template_name:
+        html = _environment.get_template(template_name).render(**(context or {}))
+    html = html or ""
+    return RenderedEmail(html=html, text=html_to_text(html))
+
+
+async def render_email_async(template_name: Optional[str] = None, context: Optional[dict] = None,
+                             html: Optional[str] = None) -> RenderedEmail:
+    """render_email in a worker thread"""
+    return await run_in_threadpool(render_email, template_name, context, html)
+
+
+# Tags whose content never shows up in the text version
+_HIDDEN_TAGS = {"head", "style", "script", "title"}
+
+# Tags that end a paragraph (blank line) or a line in the text version
+_PARAGRAPH_TAGS = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "table", "blockquote", "hr"}
+_LINE_TAGS = {"div", "br", "tr", "li"}
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an email, keeping line breaks, list items and link targets"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._hidden = 0
+        self._links: List[Optional[str]] = []
+        # Newlines (1 or 2) owed before the next text, and the bullet to start it with
+        self._breaks = 0
+        self._bullet = ""
+
+    def _break(self, newlines: int) -> None:
+        self._breaks = max(self._breaks, newlines)
+
+    def _write(self, text: str) -> None:
+        if self._breaks:
+            if self.parts:
+                self.parts.append("\n" * self._breaks)
+            self.parts.append(self._bullet)
+            self._breaks, self._bullet = 0, ""
+        self.parts.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _HIDDEN_TAGS:
+            self._hidden += 1
+        elif tag in _PARAGRAPH_TAGS:
+            self._break(2)
+        elif tag in _LINE_TAGS:
+            self._break(1)
+            if tag == "li":
+                self._bullet = "- "
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            self._links.append(href if href and not href.startswith("mailto:") else None)
+
+    def handle_endtag(self, tag):
+        if tag in _HIDDEN_TAGS:
+            self._hidden = max(0, self._hidden - 1)
+        elif tag in _PARAGRAPH_TAGS:
+            self._break(2)
+        elif tag in _LINE_TAGS:
+            self._break(1)
+        elif tag == "a" and self._links:
+            href = self._links.pop()
+            if href:
+                self._write(f" ({href})")
+
+    def handle_data(self, data):
+        if self._hidden:
+            return
+        # Source line breaks are just whitespace in HTML
+        text = re.sub(r"\s+", " ", data)
+        if text.strip():
+            self._write(text)
+        elif text and not self._breaks:
+            self.parts.append(" ")
+
+
+def html_to_text(html: str) -> str:
+    """The plain-text version of an HTML email"""
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    lines = [re.sub(r" +", " ", line).strip() for line in "".join(extractor.parts).split("\n")]
+    return "\n".join(lines).strip() + "\n"
@@ -1,15 +1,19 @@
 from jose import jwt
 from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
 import os
 import secrets
 import string
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from models.models import VerificationCode
+from services.email_outbox import enqueue_email, OutboxMessage
+from services.email_rendering import RenderedEmail, render_email_async
+from services.smtp_pool import get_smtp_pool
 
 # Import email config with error handling
 try:
-    from fastapi_mail import FastMail, MessageSchema
     from config.email_config import conf, email_settings
     # Secret key for JWT tokens (in production, use a secure random key)
     SECRET_KEY = email_settings.secret_key if email_settings else os.getenv("SECRET_KEY", "your-super-secret-key-change-in-production")
@@ -21,8 +25,6 @@ except Exception as e:
     conf = None
     email_settings = None
     SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-in-production")
-    FastMail = None
-    MessageSchema = None
 
 ALGORITHM = "HS256"
 
@@ -50,27 +52,25 @@ def generate_unique_verification_code(db: Session, max_attempts: int = 10) -> st
     raise ValueError("Failed to generate unique verification code after multiple attempts")
 
 def store_verification_code(db: Session, code: str, user_id: int, action: str) -> None:
-    """Store verification code in database with expiration"""
+    """Store verification code in database with expiration (the caller commits)"""
     # Use timezone-aware datetime for consistency
     expires_at = datetime.now(timezone.utc) + timedelta(hours=24)  # 24 hour expiration
     
     try:
-        db_code = VerificationCode(
-            code=code,
-            user_id=user_id,
-            action=action,
-            expires_at=expires_at
-        )
-        
-        db.add(db_code)
-        db.commit()
+        # Savepoint, so a collision doesn't roll back the caller's transaction
+        with db.begin_nested():
+            db_code = VerificationCode(
+                code=code,
+                user_id=user_id,
+                action=action,
+                expires_at=expires_at
+            )
+            db.add(db_code)
     except IntegrityError:
         # Code already exists (unique constraint violation)
         # This is rare but possible with 6-digit codes
-        db.rollback()
         raise ValueError(f"Code collision detected. Please try again.")
     except Exception as e:
-        db.rollback()
         raise ValueError(f"Failed to store verification code: {str(e)}")
 
 def get_verification_code_data(db: Session, code: str, check_user_verified: bool = False) -> dict:
@@ -165,8 +165,11 @@ def verify_token(token: str) -> dict:
     except jwt.JWTError:
         raise ValueError("Invalid token")
 
-async def send_verification_email(user_email: str, user_name: str, user_major: str, user_academic_year: str, user_id: int, db: Session, base_url: str = "http://localhost:8001"):
-    """Send verification email to user"""
+def queue_verification_email(user_email: str, user_name: str, user_major: str, user_academic_year: str, user_id: int, db: Session, base_url: str = "http://localhost:8001"):
+    """
+    Create verification codes and queue the verification email to the user.
+    Does not commit: the codes and the email are saved with the caller's transaction.
+    """
     
     # Generate unique verification codes (with retry logic for collisions)
     verify_code = generate_unique_verification_code(db)
@@ -182,16 +185,12 @@ async def send_verification_email(user_email: str, user_name: str, user_major: s
     ).all()
     for old_code in old_codes:
         old_code.used = True  # Mark old codes as used
-    if old_codes:
-        db.commit()
     
     # Store new codes with user data in database
     try:
         store_verification_code(db, verify_code, user_id, "verify")
         store_verification_code(db, reject_code, user_id, "reject")
     except ValueError as e:
-        # If storing fails, rollback the old code invalidation
-        db.rollback()
         raise ValueError(f"Failed to create verification codes: {str(e)}")
     
     # Create JWT tokens for API responses (not for URLs)
@@ -213,18 +212,15 @@ async def send_verification_email(user_email: str, user_name: str, user_major: s
         "verification_code": verify_code  # Also include the code in the email
     }
     
-    # Create message
-    message = MessageSchema(
+    # Queue message
+    enqueue_email(
+        db,
         subject="Verify Your Study Buddy Account",
         recipients=[user_email],
-        template_body=template_vars,
-        subtype="html"
+        template_name="verification.html",
+        template_body=template_vars
     )
     
-    # Send email
-    fm = FastMail(conf)
-    await fm.send_message(message, template_name="verification.html")
-    
     return {
         "verification_code": verify_code,
         "rejection_code": reject_code,
@@ -232,14 +228,13 @@ async def send_verification_email(user_email: str, user_name: str, user_major: s
         "rejection_token": reject_token_str
     }
 
-async def send_reach_out_email(
+def queue_reach_out_email(
     sender: "User",
     recipient: "User",
     personal_message: str = None,
     db: Session = None
 ):
-    """Send reach out email to recipient and CC sender"""
-    from models.models import User
+    """Queue the reach out email to recipient, CC sender (sent when the caller commits)"""
     
     # Helper function to get initials
     def get_initials(name: str) -> str:
@@ -274,42 +269,62 @@ async def send_reach_out_email(
         "personal_message": personal_message or ""
     }
     
-    # Create message - send to recipient, CC sender
-    message = MessageSchema(
+    # Queue message - send to recipient, CC sender
+    enqueue_email(
+        db,
         subject=f"🎉 {sender.name or 'Someone'} Reached Out to Be Your Study Buddy!",
         recipients=[recipient.school_email],
         cc=[sender.school_email],
-        template_body=template_vars,
-        subtype="html"
+        template_name="reach_out.html",
+        template_body=template_vars
     )
     
-    # Send email
-    fm = FastMail(conf)
-    await fm.send_message(message, template_name="reach_out.html")
-    
     return True
 
-async def send_password_reset_email(user_email: str, user_name: str, user_id: int, db: Session, base_url: str = "http://localhost:8001"):
+def queue_password_reset_email(user_email: str, user_name: str, user_id: int, db: Session, base_url: str = "http://localhost:8001"):
+    """Create a reset code and queue the password reset email (the caller commits)"""
     reset_code = generate_verification_code()
     store_verification_code(db, reset_code, user_id, "reset")
 
     reset_url = f"{FRONTEND_BASE_URL}/reset-password/{reset_code}"
 
-    # If you have a template, swap template_name + template_body.
-    message = MessageSchema(
+    enqueue_email(
+        db,
         subject="Reset your Study Buddy password",
         recipients=[user_email],
-        subtype="html",
-        body=f"""
-        <div style="font-family:system-ui, -apple-system, Segoe UI, Roboto, Helvetica, Arial;">
-          <p>Hi {user_name or "there"},</p>
-          <p>We received a request to reset your password.</p>
-          <p><a href="{reset_url}">Click here to reset your password</a></p>
-          <p>If you didn’t request this, you can ignore this email.</p>
-          <p>— Study Buddy</p>
-        </div>
-        """
+        template_name="password_reset.html",
+        template_body={
+            "name": user_name or "there",
+            "reset_url": reset_url,
+        }
     )
-    fm = FastMail(conf)
-    await fm.send_message(message)
     return True
+
+def build_email(subject: str, recipients: list, rendered: RenderedEmail, cc: list = None) -> EmailMessage:
+    """A multipart/alternative email (plain text and HTML) from the configured sender"""
+    email = EmailMessage()
+    email["Subject"] = subject
+    email["From"] = f"{conf.MAIL_FROM_NAME} <{conf.MAIL_FROM}>" if conf.MAIL_FROM_NAME else conf.MAIL_FROM
+    email["To"] = ", ".join(recipients)
+    if cc:
+        email["Cc"] = ", ".join(cc)
+    email["Date"] = formatdate(localtime=True)
+    email["Message-ID"] = make_msgid()
+    email.set_content(rendered.text)
+    email.add_alternative(rendered.html, subtype="html")
+    return email
+
+async def deliver_outbox_email(message: OutboxMessage) -> None:
+    """
+    Send a queued email over a pooled SMTP connection (raises on failure;
+    called by the outbox worker)
+    """
+    if conf is None:
+        raise RuntimeError("Email is not configured")
+    
+    # Emails queued before password_reset.html existed carry their HTML as body
+    rendered = await render_email_async(message.template_name, message.template_body, message.body)
+    email = build_email(message.subject, message.recipients, rendered, message.cc)
+    if conf.SUPPRESS_SEND:
+        return
+    await get_smtp_pool(conf).send_message(email)
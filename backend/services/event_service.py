@@ -0,0 +1,241 @@
+"""
+Event service: pushes small notification events (new reach out, connection marked
+met, rating due, new mutual match) to a user's open /api/events streams.
+
+Open streams subscribe to the in-process EventHub. Write paths publish through an
+event backend once their transaction has committed (the same backend carries
+process-wide broadcasts such as cache invalidations):
+- MemoryEventBackend (default) delivers to streams in this process only
+- PostgresEventBackend fans events out to every worker with LISTEN/NOTIFY
+Choose with EVENTS_BACKEND=memory|postgres.
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per stream; a stream that falls further behind drops events
+# (clients refetch their state on any event, so a dropped one is only a missed nudge)
+STREAM_QUEUE_SIZE = 100
+
+# PostgreSQL NOTIFY channel shared by all workers
+NOTIFY_CHANNEL = "app_events"
+
+
+class Subscription:
+    """One open event stream: a queue fed from any thread, read on its event loop."""
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    def _put(self, event: dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    def deliver(self, event: dict) -> None:
+        """Queue an event for the stream (thread-safe)."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The stream's event loop is closed; it is about to unsubscribe
+            pass
+
+
+class EventHub:
+    """
+    In-process fan-out from user ids to their open streams, plus process-wide
+    broadcast handlers (e.g. cache invalidation) that every worker runs.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._broadcast_handlers: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+
+    def on_broadcast(self, handler: Callable[[dict], None]) -> None:
+        """Register a handler for broadcast messages (called on the publishing or listener thread)."""
+        with self._lock:
+            if handler not in self._broadcast_handlers:
+                self._broadcast_handlers.append(handler)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Open a stream for a user. Call from the event loop that will read it."""
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            streams = self._subscriptions.get(subscription.user_id)
+            if streams is not None:
+                streams.discard(subscription)
+                if not streams:
+                    del self._subscriptions[subscription.user_id]
+
+    def dispatch(self, user_id: int, event: dict) -> None:
+        """Deliver an event to the user's streams in this process."""
+        with self._lock:
+            streams = list(self._subscriptions.get(user_id, ()))
+        for subscription in streams:
+            subscription.deliver(event)
+
+    def broadcast(self, message: dict) -> None:
+        """Run every broadcast handler in this process."""
+        with self._lock:
+            handlers = list(self._broadcast_handlers)
+        for handler in handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                logger.warning(f"⚠️  Broadcast handler failed: {e}")
+
+
+class MemoryEventBackend:
+    """Delivers events to streams in this process only (single worker or development)."""
+
+    def __init__(self, hub: EventHub):
+        self.hub = hub
+
+    def start(self) -> None:
+        pass
+
+    def publish(self, user_id: int, event: dict) -> None:
+        self.hub.dispatch(user_id, event)
+
+    def broadcast(self, message: dict) -> None:
+        self.hub.broadcast(message)
+
+
+class PostgresEventBackend:
+    """
+    Fans events out across worker processes with PostgreSQL LISTEN/NOTIFY.
+    Each process runs one listener thread (started by its first stream or cache)
+    that dispatches notifications to its local hub.
+    """
+
+    def __init__(self, hub: EventHub, engine):
+        self.hub = hub
+        self.engine = engine
+        self._listener: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="event-listener", daemon=True)
+                self._listener.start()
+
+    def _notify(self, message: dict) -> None:
+        payload = json.dumps(message, separators=(",", ":"))
+        with self.engine.begin() as connection:
+            connection.execute(text("SELECT pg_notify(:channel, :payload)"),
+                               {"channel": NOTIFY_CHANNEL, "payload": payload})
+
+    def publish(self, user_id: int, event: dict) -> None:
+        self._notify({"user_id": user_id, "event": event})
+
+    def broadcast(self, message: dict) -> None:
+        # This process gets its own notification back through the listener too
+        self._notify({"broadcast": message})
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                self._listen_once()
+            except Exception as e:
+                logger.warning(f"⚠️  Event listener connection lost, reconnecting: {e}")
+                threading.Event().wait(5)
+
+    def _listen_once(self) -> None:
+        connection = self.engine.raw_connection()
+        try:
+            dbapi_connection = connection.dbapi_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+            while True:
+                # Wake up periodically so a dead connection is noticed
+                if select.select([dbapi_connection], [], [], 30) == ([], [], []):
+                    with dbapi_connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notify = dbapi_connection.notifies.pop(0)
+                    try:
+                        message = json.loads(notify.payload)
+                        if "broadcast" in message:
+                            self.hub.broadcast(message["broadcast"])
+                        else:
+                            self.hub.dispatch(int(message["user_id"]), message["event"])
+                    except (ValueError, KeyError, TypeError):
+                        logger.warning(f"⚠️  Ignoring malformed event notification: {notify.payload[:200]}")
+        finally:
+            connection.invalidate()
+
+
+hub = EventHub()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_event_backend():
+    """The configured event backend (created on first use)."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = os.getenv("EVENTS_BACKEND", "memory").lower()
+                if name == "postgres":
+                    from core.database import engine
+                    _backend = PostgresEventBackend(hub, engine)
+                else:
+                    if name != "memory":
+                        logger.warning(f"⚠️  Unknown EVENTS_BACKEND '{name}', using in-process events")
+                    _backend = MemoryEventBackend(hub)
+    return _backend
+
+
+def broadcasts_reach_all_workers() -> bool:
+    """
+    True if broadcasts reach every worker process: the postgres backend, outside
+    serverless deployments (Vercel), whose instances can't keep a listener thread running.
+    """
+    from core.database import IS_VERCEL
+    return os.getenv("EVENTS_BACKEND", "memory").lower() == "postgres" and not IS_VERCEL
+
+
+def broadcast(message: dict) -> None:
+    """
+    Run the broadcast handlers of every worker process (only this one with the memory
+    backend). Never raises.
+    """
+    try:
+        get_event_backend().broadcast(message)
+    except Exception as e:
+        logger.warning(f"⚠️  Could not broadcast {message.get('type')} message: {e}")
+
+
+def publish_event(user_id: int, event_type: str, **data) -> None:
+    """
+    Push an event to a user's open streams. Call after the write it describes has
+    committed. Never raises: a failed notification must not fail the request.
+    """
+    try:
+        get_event_backend().publish(user_id, {"type": event_type, **data})
+    except Exception as e:
+        logger.warning(f"⚠️  Could not publish {event_type} event to user {user_id}: {e}")
@@ -0,0 +1,113 @@
+"""
+Feature service for maintaining the normalized profile features used by similarity scoring
+"""
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy.orm import Session
+from models.models import User, UserFeatures, ClassIndexEntry
+from utils.features import ProfileFeatures, build_feature_values, normalize_classes
+
+
+def get_class_index_query(db: Session, user_id: int):
+    """Query of a user's entries in the class index."""
+    return db.query(ClassIndexEntry).filter(ClassIndexEntry.user_id == user_id)
+
+
+def sync_class_index(db: Session, user_id: int, course_codes: Optional[List[str]]) -> None:
+    """Replace a user's entries in the class index. Does not commit."""
+    get_class_index_query(db, user_id).delete(synchronize_session=False)
+    for code in course_codes or []:
+        db.add(ClassIndexEntry(course_code=code, user_id=user_id))
+
+
+def refresh_user_features(db: Session, user: User) -> UserFeatures:
+    """
+    Rebuild a user's normalized feature record and class index entries from their current profile.
+    Call this from profile write paths before committing; it does not commit.
+    """
+    values = build_feature_values(user)
+    record = db.query(UserFeatures).filter(UserFeatures.user_id == user.id).first()
+    if record is None:
+        record = UserFeatures(user_id=user.id, **values)
+        db.add(record)
+    else:
+        for field, value in values.items():
+            setattr(record, field, value)
+
+    sync_class_index(db, user.id, values["classes_taking"])
+    return record
+
+
+def get_user_taking_codes(db: Session, user: User) -> List[str]:
+    """Normalized codes of the classes a user is taking, read from their feature record when available."""
+    record = db.query(UserFeatures).filter(UserFeatures.user_id == user.id).first()
+    if record is not None:
+        return record.classes_taking or []
+    return normalize_classes(user.classes_taking)
+
+
+def get_user_features_query(db: Session, user_ids: List[int]):
+    """Query of the stored feature records of these users."""
+    return db.query(UserFeatures).filter(UserFeatures.user_id.in_(user_ids))
+
+
+def load_user_features(db: Session, users: Iterable[User]) -> Dict[int, ProfileFeatures]:
+    """
+    Load comparison-ready features for a batch of users in one query.
+    Users without a stored record (e.g. created before the table existed) are normalized on the fly.
+    """
+    users = list(users)
+    if not users:
+        return {}
+
+    records = get_user_features_query(db, [u.id for u in users]).all()
+    features = {record.user_id: ProfileFeatures.from_record(record) for record in records}
+
+    for user in users:
+        if user.id not in features:
+            features[user.id] = ProfileFeatures.from_user(user)
+
+    return features
+
+
+def backfill_user_features(db: Session) -> int:
+    """
+    Create feature records for completed profiles that don't have one yet.
+    Safe to run repeatedly; returns the number of records created.
+    """
+    missing_users = db.query(User).outerjoin(
+        UserFeatures, UserFeatures.user_id == User.id
+    ).filter(
+        User.profile_completed == True,
+        UserFeatures.user_id == None
+    ).all()
+
+    for user in missing_users:
+        values = build_feature_values(user)
+        db.add(UserFeatures(user_id=user.id, **values))
+        sync_class_index(db, user.id, values["classes_taking"])
+
+    if missing_users:
+        db.commit()
+
+    return len(missing_users)
+
+
+def backfill_class_index(db: Session) -> int:
+    """
+    Populate class index entries for feature records that list classes taking but have no index entries yet.
+    Safe to run repeatedly; returns the number of users indexed.
+    """
+    indexed_users = db.query(ClassIndexEntry.user_id).distinct()
+    records = db.query(UserFeatures).filter(UserFeatures.user_id.notin_(indexed_users)).all()
+
+    indexed = 0
+    for record in records:
+        codes = record.classes_taking or []
+        if codes:
+            sync_class_index(db, record.user_id, codes)
+            indexed += 1
+
+    if indexed:
+        db.commit()
+
+    return indexed
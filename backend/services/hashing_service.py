@@ -0,0 +1,146 @@
+"""
+Hashing service: runs bcrypt (~250ms of CPU at cost 12) on a small dedicated thread
+pool, so login bursts can't take over the threadpool that serves every other endpoint.
+
+bcrypt releases the GIL while hashing, so threads run in parallel. At most
+HASH_WORKERS hashes run at once and HASH_QUEUE_LIMIT more may wait; beyond that
+requests are shed right away with a 503 instead of queueing behind the burst.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from fastapi import HTTPException, status
+
+from services.auth_utils import hash_password, verify_password
+from services.password_policy import needs_rehash
+
+# Hashes run at once (defaults to half the CPUs, so other requests keep some)
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Hashes allowed to wait for a worker before new ones are rejected
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "16"))
+
+# Seconds clients are told to wait before retrying a shed request
+RETRY_AFTER_SECONDS = 2
+
+# Recent hashes kept for the latency percentiles
+LATENCY_WINDOW = 256
+
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class HashingPool:
+    """A bounded thread pool for password hashing with admission control and latency stats."""
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_limit)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_ms = deque(maxlen=LATENCY_WINDOW)
+        self._hash_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue fn(*args) on the pool. Raises 503 if the pool and its queue are full."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-in requests right now. Please try again in a moment.",
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+
+        queued_at = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+
+        def run():
+            started_at = time.perf_counter()
+            with self._lock:
+                self._running += 1
+            try:
+                return fn(*args)
+            finally:
+                finished_at = time.perf_counter()
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._wait_ms.append((started_at - queued_at) * 1000)
+                    self._hash_ms.append((finished_at - started_at) * 1000)
+
+        def release(_future):
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+        try:
+            future = self._executor.submit(run)
+        except Exception:
+            release(None)
+            raise
+        future.add_done_callback(release)
+        return future
+
+    async def run(self, fn: Callable, *args):
+        """Run fn(*args) on the pool and await the result without holding a request thread."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self) -> dict:
+        with self._lock:
+            wait_ms, hash_ms = list(self._wait_ms), list(self._hash_ms)
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "running": self._running,
+                "queue_depth": self._in_flight - self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "wait_ms_p50": round(_percentile(wait_ms, 0.5), 1),
+                "wait_ms_p95": round(_percentile(wait_ms, 0.95), 1),
+                "hash_ms_p50": round(_percentile(hash_ms, 0.5), 1),
+                "hash_ms_p95": round(_percentile(hash_ms, 0.95), 1),
+            }
+
+
+hashing_pool = HashingPool(HASH_WORKERS, HASH_QUEUE_LIMIT)
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on the hashing pool (503 when overloaded)"""
+    return await hashing_pool.run(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the hashing pool (503 when overloaded)"""
+    return await hashing_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def upgrade_password_hash(user, password: str) -> bool:
+    """
+    After a successful login, rehash the password if the stored hash doesn't match the
+    hashing policy. Returns whether user.password_hash changed (the caller commits).
+    Skipped when the pool is saturated; the next login tries again.
+    """
+    if not needs_rehash(user.password_hash):
+        return False
+    try:
+        user.password_hash = await hash_password_async(password)
+    except HTTPException:
+        return False
+    return True
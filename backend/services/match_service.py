@@ -0,0 +1,177 @@
+"""
+Match service for maintaining the materialized mutual_matches table and cleaning up
+approvals that never turned into a match
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+from sqlalchemy import and_, exists, func, select
+from sqlalchemy.orm import Session, aliased
+from models.models import User, UserApproval, MutualMatch
+from services.version_service import bump_data_version
+
+
+def lock_pair(db: Session, user_id: int, other_id: int) -> None:
+    """
+    Lock both users' rows (in id order, so concurrent requests can't deadlock) so that
+    two people approving each other at the same moment can't both miss the match.
+    """
+    db.query(User.id).filter(User.id.in_([user_id, other_id])).order_by(User.id).with_for_update().all()
+
+
+def get_approval_query(db: Session, approver_id: int, approved_user_id: int):
+    """Query of one user's approval or rejection of another."""
+    return db.query(UserApproval).filter(
+        and_(
+            UserApproval.approver_id == approver_id,
+            UserApproval.approved_user_id == approved_user_id
+        )
+    )
+
+
+def get_mutual_matches_query(db: Session, user_id: int):
+    """Query of (user, matched_at) for everyone mutually matched with the user, by user id."""
+    return db.query(User, MutualMatch.matched_at).join(
+        MutualMatch, MutualMatch.matched_user_id == User.id
+    ).filter(
+        MutualMatch.user_id == user_id
+    ).order_by(User.id)
+
+
+def _is_approved(db: Session, approver_id: int, approved_user_id: int) -> bool:
+    approval = get_approval_query(db, approver_id, approved_user_id).with_entities(UserApproval.is_approved).first()
+    return bool(approval and approval.is_approved)
+
+
+def sync_mutual_match(db: Session, user_id: int, other_id: int) -> bool:
+    """
+    Insert or delete the match between two users to reflect their current approvals.
+    Call this after writing an approval, in the same transaction; it does not commit.
+    Returns True if the users are mutually matched.
+    """
+    db.flush()
+    is_match = _is_approved(db, user_id, other_id) and _is_approved(db, other_id, user_id)
+
+    existing = db.query(MutualMatch).filter(
+        MutualMatch.user_id.in_([user_id, other_id]),
+        MutualMatch.matched_user_id.in_([user_id, other_id])
+    ).all()
+
+    if is_match and len(existing) < 2:
+        matched_at = datetime.now(timezone.utc)
+        present = {(m.user_id, m.matched_user_id) for m in existing}
+        for a, b in ((user_id, other_id), (other_id, user_id)):
+            if (a, b) not in present:
+                db.add(MutualMatch(user_id=a, matched_user_id=b, matched_at=matched_at))
+        bump_data_version(db, [user_id, other_id])
+    elif not is_match and existing:
+        for match in existing:
+            db.delete(match)
+        bump_data_version(db, [user_id, other_id])
+
+    return is_match
+
+
+def backfill_mutual_matches(db: Session) -> int:
+    """
+    Create mutual_matches rows for reciprocal approvals that don't have one yet,
+    dated by the later of the two approvals. Safe to run repeatedly; returns the
+    number of rows created.
+    """
+    given = aliased(UserApproval)
+    received = aliased(UserApproval)
+    pairs = db.query(
+        given.approver_id,
+        given.approved_user_id,
+        func.max(given.created_at),
+        func.max(received.created_at),
+    ).join(
+        received,
+        and_(
+            received.approver_id == given.approved_user_id,
+            received.approved_user_id == given.approver_id,
+            received.is_approved == True
+        )
+    ).outerjoin(
+        MutualMatch,
+        and_(
+            MutualMatch.user_id == given.approver_id,
+            MutualMatch.matched_user_id == given.approved_user_id
+        )
+    ).filter(
+        given.is_approved == True,
+        given.approver_id != given.approved_user_id,
+        MutualMatch.user_id == None
+    ).group_by(given.approver_id, given.approved_user_id).all()
+
+    for user_id, matched_user_id, given_at, received_at in pairs:
+        approval_times = [t for t in (given_at, received_at) if t is not None]
+        db.add(MutualMatch(
+            user_id=user_id,
+            matched_user_id=matched_user_id,
+            matched_at=max(approval_times) if approval_times else datetime.now(timezone.utc),
+        ))
+
+    db.commit()
+    return len(pairs)
+
+
+# Number of approvals deleted per statement (and transaction) during cleanup
+CLEANUP_BATCH_SIZE = 1000
+
+
+def _stale_approval_ids(cutoff: datetime):
+    """
+    SELECT of approvals older than cutoff that aren't half of a mutual match (an approval
+    whose reverse is also an approval). Deleting these never turns a kept row stale, so
+    batches don't cascade and the count is exact.
+    """
+    stale = aliased(UserApproval)
+    reverse = aliased(UserApproval)
+    return select(stale.id).where(
+        stale.created_at < cutoff,
+        ~and_(
+            stale.is_approved == True,
+            exists().where(
+                and_(
+                    reverse.approver_id == stale.approved_user_id,
+                    reverse.approved_user_id == stale.approver_id,
+                    reverse.is_approved == True
+                )
+            )
+        )
+    )
+
+
+def count_stale_approvals(db: Session, days_old: int = 7) -> int:
+    """Number of approvals cleanup_stale_approvals would delete right now."""
+    cutoff = datetime.utcnow() - timedelta(days=days_old)
+    return db.scalar(select(func.count()).select_from(_stale_approval_ids(cutoff).subquery()))
+
+
+def cleanup_stale_approvals(
+    db: Session,
+    days_old: int = 7,
+    batch_size: int = CLEANUP_BATCH_SIZE,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Delete approvals/rejections older than days_old that don't result in a mutual match,
+    with one anti-join DELETE per batch of at most batch_size rows. Each batch is committed
+    on its own; `progress` is called with the running total after each one.
+    Returns the number of approvals deleted.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days_old)
+    deleted = 0
+
+    while True:
+        batch_ids = _stale_approval_ids(cutoff).limit(batch_size)
+        result = db.query(UserApproval).filter(
+            UserApproval.id.in_(batch_ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+
+        deleted += result
+        if progress is not None:
+            progress(deleted)
+        if result < batch_size:
+            return deleted
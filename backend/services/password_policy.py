@@ -0,0 +1,35 @@
+"""
+Password hashing policy: the bcrypt cost new hashes are made with, and whether a
+stored hash should be upgraded to it (done at the next successful login).
+
+Each step of BCRYPT_ROUNDS doubles the CPU time of every login; pick it with
+benchmark_password_hashing.py on the production hardware.
+"""
+import os
+import re
+from typing import Optional, Tuple
+
+# bcrypt accepts costs 4-31
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+BCRYPT_ROUNDS = min(MAX_ROUNDS, max(MIN_ROUNDS, int(os.getenv("BCRYPT_ROUNDS", "12"))))
+
+# Variant new hashes are made with
+BCRYPT_PREFIX = "2b"
+
+_BCRYPT_HASH = re.compile(r"^\$(2[abxy])\$(\d{2})\$[./A-Za-z0-9]{53}$")
+
+
+def hash_parameters(hashed_password: Optional[str]) -> Optional[Tuple[str, int]]:
+    """(variant, cost) of a bcrypt hash, or None if it isn't one"""
+    match = _BCRYPT_HASH.match(hashed_password or "")
+    if not match:
+        return None
+    return match.group(1), int(match.group(2))
+
+
+def needs_rehash(hashed_password: Optional[str]) -> bool:
+    """Whether a stored hash was made with different parameters than the current policy"""
+    parameters = hash_parameters(hashed_password)
+    return parameters is not None and parameters != (BCRYPT_PREFIX, BCRYPT_ROUNDS)
@@ -0,0 +1,184 @@
+"""
+Principal cache: the authenticated user's columns, kept in process so
+get_current_user doesn't need a users round trip on every request.
+
+Entries live for PRINCIPAL_CACHE_TTL seconds. Any transaction that updates
+user rows (including data_version bumps, see services/version_service.py)
+records the ids it touched; when it commits, those entries are evicted here and
+the eviction is broadcast to the other workers through the event backend. A load
+that started before the latest eviction of its user is not cached, so a slow
+request can't put back a row that was already replaced.
+
+Cached rows carry the gate flags and data_version (behind ETags), so a worker that
+misses an eviction would serve them stale. The cache is therefore only on when
+evictions reach every worker (EVENTS_BACKEND=postgres, not on Vercel); otherwise,
+or with PRINCIPAL_CACHE_TTL=0, every request loads the user row.
+"""
+import copy
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from models.models import User
+from services.event_service import broadcasts_reach_all_workers
+
+# Seconds a cached principal is trusted without an eviction (0 when evictions can't reach other workers)
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30")) if broadcasts_reach_all_workers() else 0.0
+
+# Most ids per broadcast message (keeps NOTIFY payloads well under their 8000 byte limit)
+BROADCAST_CHUNK = 500
+
+_COLUMNS = [attr.key for attr in inspect(User).column_attrs]
+
+
+class PrincipalCache:
+    """User id -> column values, with a TTL and eviction times to reject stale loads."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[float, dict]] = {}
+        self._evicted_at: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def clock() -> float:
+        return time.monotonic()
+
+    def get(self, user_id: int) -> Optional[dict]:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            cached_at, columns = entry
+            if self.clock() - cached_at > self.ttl:
+                del self._entries[user_id]
+                return None
+            return columns
+
+    def put(self, user: User, loaded_at: float) -> None:
+        """Cache a user row that was read from the database at `loaded_at` (a clock() value)."""
+        if self.ttl <= 0:
+            return
+        columns = {key: copy.deepcopy(getattr(user, key)) for key in _COLUMNS}
+        with self._lock:
+            if self._evicted_at.get(user.id, float("-inf")) >= loaded_at:
+                return
+            self._entries[user.id] = (loaded_at, columns)
+
+    def evict(self, user_ids: Iterable[int]) -> None:
+        now = self.clock()
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+                self._evicted_at[user_id] = now
+            # Eviction times only matter for loads still in flight
+            if len(self._evicted_at) > 10000:
+                cutoff = now - 60
+                self._evicted_at = {k: t for k, t in self._evicted_at.items() if t > cutoff}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL)
+
+
+def _on_broadcast(message: dict) -> None:
+    if message.get("type") == "principals_changed":
+        principal_cache.evict(int(user_id) for user_id in message.get("user_ids", ()))
+
+
+_listening = False
+_listening_lock = threading.Lock()
+
+
+def _ensure_listening() -> None:
+    """Receive evictions broadcast by other workers (starts the event backend's listener)."""
+    global _listening
+    if _listening:
+        return
+    with _listening_lock:
+        if not _listening:
+            from services.event_service import hub, get_event_backend
+            hub.on_broadcast(_on_broadcast)
+            get_event_backend().start()
+            _listening = True
+
+
+def get_user_query(db: Session, user_id: int):
+    """Query of the user with this id."""
+    return db.query(User).filter(User.id == user_id)
+
+
+def get_user_by_email_query(db: Session, school_email: str):
+    """Query of the user with this school email (the login lookup)."""
+    return db.query(User).filter(User.school_email == school_email)
+
+
+def load_principal(db: Session, user_id: int) -> Optional[User]:
+    """
+    The user with this id, attached to the session. Served from the cache when
+    possible (no SQL); the returned object behaves like a loaded row, so handlers
+    can read, update and commit it as usual.
+    """
+    if principal_cache.ttl > 0:
+        _ensure_listening()
+
+    columns = principal_cache.get(user_id)
+    if columns is not None:
+        user = User(**copy.deepcopy(columns))
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    loaded_at = principal_cache.clock()
+    # By primary key, so a second load in the same request (authorization, then the
+    # handler's current user) is served from the session without another query; the
+    # session keeps a reference because its identity map only holds objects weakly
+    user = db.get(User, user_id)
+    if user is not None:
+        db.info.setdefault("principals", {})[user_id] = user
+        principal_cache.put(user, loaded_at)
+    return user
+
+
+def mark_users_changed(session: Session, user_ids: Iterable[int]) -> None:
+    """Note user rows written in this transaction; their cache entries are evicted on commit."""
+    session.info.setdefault("changed_user_ids", set()).update(user_ids)
+
+
+@event.listens_for(Session, "before_flush")
+def _note_flushed_users(session, flush_context, instances):
+    """Record user rows this flush updates or deletes (SQL-level bumps call mark_users_changed)."""
+    user_ids = [
+        obj.id for obj in session.dirty
+        if isinstance(obj, User) and session.is_modified(obj, include_collections=False)
+    ]
+    user_ids += [obj.id for obj in session.deleted if isinstance(obj, User)]
+    if user_ids:
+        mark_users_changed(session, user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_changed_users(session):
+    user_ids = sorted(session.info.pop("changed_user_ids", ()))
+    if not user_ids:
+        return
+    principal_cache.evict(user_ids)
+    from services.event_service import broadcast
+    for start in range(0, len(user_ids), BROADCAST_CHUNK):
+        broadcast({"type": "principals_changed", "user_ids": user_ids[start:start + BROADCAST_CHUNK]})
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    # A rolled back transaction changed nothing, but evicting is always safe
+    user_ids = session.info.pop("changed_user_ids", ())
+    if user_ids:
+        principal_cache.evict(user_ids)
@@ -0,0 +1,298 @@
+"""
+Ranking service: streaming top-k candidate ranking, and the materialized feed
+behind the design1 list view.
+
+Each viewer's ranked candidate list is materialized in the ranked_feed table the
+first time it is read, and served page by page with indexed keyset range reads.
+When one user's ranking inputs change, only their row (their own feed) and their
+column (their entry in every other materialized feed) are re-scored; the rest of
+the stored relation is left untouched. Feeds also expire after FEED_MAX_AGE so
+newly completed profiles show up.
+
+Ranking streams the full candidate set in chunks of CHUNK_SIZE and keeps only a
+bounded top-k heap, so results are exact at any population size while memory stays
+flat. A feed stores the top FEED_SIZE entries; pages past that are streamed on demand.
+"""
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy import and_, or_, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.models import User, RankedFeedEntry, RankedFeedState
+from services.candidate_service import get_candidate_query, get_viewer_query, split_by_classmates
+from services.feature_service import load_user_features
+from services.version_service import bump_data_version
+from utils.features import ProfileFeatures
+from utils.pagination import RankKey, rank_key, top_k_after
+from utils.similarity import calculate_feature_similarity, score_users
+
+# Number of candidate rows loaded and scored at a time
+CHUNK_SIZE = 500
+
+# Number of top-ranked entries stored per viewer
+FEED_SIZE = 1000
+
+# Rebuild feeds at least this often so new profiles appear
+FEED_MAX_AGE = timedelta(minutes=15)
+
+# Profile fields that affect scores or candidate eligibility
+RANKING_FIELDS = (
+    "gender", "major", "academic_year", "classes_taking", "classes_taken",
+    "learn_best_when", "study_snack", "favorite_study_spot", "mbti", "yap_to_study_ratio",
+)
+
+# Preference flags a candidate uses to require a match (they decide who may see the candidate)
+REQUIREMENT_FIELDS = ("match_by_gender", "match_by_major", "match_by_academic_year")
+
+# All preference flags; they weight the viewer's own scores
+PREFERENCE_FIELDS = REQUIREMENT_FIELDS + ("match_by_study_preferences", "match_by_classes")
+
+
+def ranking_snapshot(user: User) -> dict:
+    """Capture a user's ranking inputs so a write path can tell afterwards whether they changed."""
+    return {field: getattr(user, field) for field in RANKING_FIELDS + PREFERENCE_FIELDS}
+
+
+def _iter_chunks(query, size: int = CHUNK_SIZE) -> Iterator[List[User]]:
+    """Stream a query's rows in lists of at most `size`, holding one chunk at a time."""
+    rows = iter(query.yield_per(size))
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _stream_scores(db: Session, viewer: User, query, viewer_features: dict) -> Iterator[Tuple[User, float]]:
+    """Score every user in the query against the viewer, one chunk at a time."""
+    for chunk in _iter_chunks(query.order_by(User.id)):
+        features = load_user_features(db, chunk)
+        features.update(viewer_features)
+        yield from score_users(viewer, chunk, features)
+
+
+def rank_top_k(db: Session, viewer: User, base_q, k: int, after: Optional[RankKey] = None) -> List[Tuple[User, float, int]]:
+    """
+    Rank the users in base_q for the viewer and return the best `k` that sort after `after`.
+    Returns (user, score, tier) tuples in rank order: classmates first (when the viewer
+    matches by classes), then the general pool; each tier by score descending, then id
+    ascending. Later tiers are only scanned if earlier ones can't fill `k`.
+    """
+    tiers = split_by_classmates(db, viewer, base_q)
+    viewer_features = load_user_features(db, [viewer])
+
+    ranked = []
+    for tier, tier_q in enumerate(tiers if tiers is not None else (base_q,)):
+        needed = k - len(ranked)
+        if needed <= 0:
+            break
+        if after is not None and tier < after[0]:
+            # Every item in this tier sorts before the cursor
+            continue
+        ranked.extend(top_k_after(_stream_scores(db, viewer, tier_q, viewer_features), needed, tier, after))
+    return ranked
+
+
+def rank_candidates(db: Session, viewer: User, k: int, after: Optional[RankKey] = None) -> List[Tuple[User, float, int]]:
+    """Rank the viewer's list view candidates (see rank_top_k)."""
+    return rank_top_k(db, viewer, get_candidate_query(db, viewer), k, after)
+
+
+def _write_feed(db: Session, viewer: User) -> int:
+    """Replace the viewer's feed rows and state with a fresh ranking. Does not commit."""
+    # Rank one extra entry to tell whether the feed was cut off
+    ranked = rank_candidates(db, viewer, FEED_SIZE + 1)
+    truncated = len(ranked) > FEED_SIZE
+    ranked = ranked[:FEED_SIZE]
+    rows = [
+        {"viewer_id": viewer.id, "candidate_id": user.id, "tier": tier, "score": score}
+        for user, score, tier in ranked
+    ]
+
+    db.query(RankedFeedEntry).filter(RankedFeedEntry.viewer_id == viewer.id).delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(RankedFeedEntry), rows)
+
+    state = db.get(RankedFeedState, viewer.id)
+    if state is None:
+        state = RankedFeedState(viewer_id=viewer.id)
+        db.add(state)
+    state.built_at = datetime.now(timezone.utc)
+    state.candidate_count = len(rows)
+    bump_data_version(db, [viewer.id])
+    # Remember where a cut-off feed ends, for later pages and column re-scoring
+    if truncated:
+        last_user, last_score, last_tier = ranked[-1]
+        state.boundary_tier, state.boundary_score, state.boundary_candidate_id = last_tier, last_score, last_user.id
+    else:
+        state.boundary_tier = state.boundary_score = state.boundary_candidate_id = None
+    return len(rows)
+
+
+def _boundary_key(state: RankedFeedState) -> Optional[RankKey]:
+    """Rank key of the last stored entry of a cut-off feed, or None if the feed is complete."""
+    if state.boundary_candidate_id is None:
+        return None
+    return rank_key(state.boundary_tier, state.boundary_score, state.boundary_candidate_id)
+
+
+def build_ranked_feed(db: Session, viewer: User) -> int:
+    """Rank the viewer's candidates and replace their materialized feed. Commits."""
+    count = _write_feed(db, viewer)
+
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent request rebuilt the same feed first; its rows are just as good
+        db.rollback()
+
+    return count
+
+
+def _feed_is_fresh(state: Optional[RankedFeedState]) -> bool:
+    if state is None:
+        return False
+    built_at = state.built_at
+    if built_at.tzinfo is None:
+        # SQLite returns naive datetimes; they are stored as UTC
+        built_at = built_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - built_at < FEED_MAX_AGE
+
+
+def get_feed_state_query(db: Session, viewer_id: int):
+    """Query of the state row of a viewer's materialized feed."""
+    return db.query(RankedFeedState).filter(RankedFeedState.viewer_id == viewer_id)
+
+
+def is_feed_fresh(db: Session, viewer: User) -> bool:
+    """True if the viewer's feed is materialized and can be served without a rebuild."""
+    return _feed_is_fresh(db.get(RankedFeedState, viewer.id))
+
+
+def ensure_ranked_feed(db: Session, viewer: User) -> RankedFeedState:
+    """Build the viewer's feed if it is missing, invalidated or expired, and return its state."""
+    state = db.get(RankedFeedState, viewer.id)
+    if not _feed_is_fresh(state):
+        build_ranked_feed(db, viewer)
+        state = get_feed_state_query(db, viewer.id).first()
+    return state
+
+
+def get_feed_page_query(db: Session, viewer_id: int, after: Optional[RankKey] = None):
+    """Query of (entry, user) rows of a viewer's stored feed that sort after the `after` rank key, in rank order."""
+    query = db.query(RankedFeedEntry, User).join(
+        User, User.id == RankedFeedEntry.candidate_id
+    ).filter(RankedFeedEntry.viewer_id == viewer_id)
+
+    if after is not None:
+        tier, neg_score, candidate_id = after
+        score = -neg_score
+        query = query.filter(
+            or_(
+                RankedFeedEntry.tier > tier,
+                and_(RankedFeedEntry.tier == tier, RankedFeedEntry.score < score),
+                and_(
+                    RankedFeedEntry.tier == tier,
+                    RankedFeedEntry.score == score,
+                    RankedFeedEntry.candidate_id > candidate_id,
+                ),
+            )
+        )
+
+    return query.order_by(
+        RankedFeedEntry.tier,
+        RankedFeedEntry.score.desc(),
+        RankedFeedEntry.candidate_id,
+    )
+
+
+def read_feed_page(db: Session, viewer: User, after: Optional[RankKey], limit: int) -> List[Tuple[User, float, int]]:
+    """
+    Read up to `limit` feed entries that sort after the `after` rank key.
+    Entries past the end of a cut-off feed are ranked on demand.
+    Returns (user, score, tier) tuples in rank order.
+    """
+    state = ensure_ranked_feed(db, viewer)
+
+    rows = get_feed_page_query(db, viewer.id, after).limit(limit).all()
+    page = [(user, entry.score, entry.tier) for entry, user in rows]
+
+    # Ran off the end of a cut-off feed: stream the rest after its last stored entry
+    boundary = _boundary_key(state)
+    if len(page) < limit and boundary is not None:
+        start = boundary if after is None or after < boundary else after
+        page.extend(rank_candidates(db, viewer, limit - len(page), start))
+
+    return page
+
+
+def _candidate_tier(viewer: User, viewer_features: ProfileFeatures, candidate_features: ProfileFeatures) -> int:
+    """Tier the candidate falls in for this viewer, matching split_by_classmates."""
+    viewer_codes = viewer_features.classes_taking
+    if not viewer.match_by_classes or not viewer_codes:
+        return 0
+    return 0 if viewer_codes & candidate_features.classes_taking else 1
+
+
+def get_feed_viewers_query(db: Session, candidate_id: int):
+    """Query of the viewers whose stored feed lists the candidate."""
+    return db.query(RankedFeedEntry.viewer_id).filter(RankedFeedEntry.candidate_id == candidate_id)
+
+
+def rescore_column(db: Session, candidate: User) -> int:
+    """
+    Re-score one candidate in every materialized feed, in batch.
+    The candidate's old entries are replaced by fresh (tier, score) rows for every
+    viewer with a feed who may now see them. A cut-off feed only gets the candidate if
+    they rank within its stored prefix. Does not commit.
+    Returns the number of feeds that list the candidate afterwards.
+    """
+    # Every feed that listed the candidate, or may list them now, changes
+    listed_in = [viewer_id for (viewer_id,) in get_feed_viewers_query(db, candidate.id)]
+    db.query(RankedFeedEntry).filter(
+        RankedFeedEntry.candidate_id == candidate.id
+    ).delete(synchronize_session=False)
+
+    viewers = get_viewer_query(db, candidate).join(
+        RankedFeedState, RankedFeedState.viewer_id == User.id
+    ).add_entity(RankedFeedState).all()
+    bump_data_version(db, listed_in + [viewer.id for viewer, _ in viewers])
+    if not viewers:
+        return 0
+
+    features = load_user_features(db, [viewer for viewer, _ in viewers] + [candidate])
+    candidate_features = features[candidate.id]
+    rows = []
+    for viewer, state in viewers:
+        tier = _candidate_tier(viewer, features[viewer.id], candidate_features)
+        score = calculate_feature_similarity(viewer, features[viewer.id], candidate_features)
+        boundary = _boundary_key(state)
+        if boundary is not None and rank_key(tier, score, candidate.id) > boundary:
+            continue
+        rows.append({"viewer_id": viewer.id, "candidate_id": candidate.id, "tier": tier, "score": score})
+
+    if rows:
+        db.execute(insert(RankedFeedEntry), rows)
+    return len(rows)
+
+
+def rescore_for_user_change(db: Session, user: User, before: dict) -> bool:
+    """
+    Update the ranked feeds affected by a write to a user, given their ranking_snapshot
+    from before the write. The user's own feed (their row) depends on all of their inputs
+    and is re-ranked if it was materialized; other feeds (their column) only depend on
+    their profile fields and requirement flags. Does not commit.
+    Returns True if anything was re-scored.
+    """
+    after = ranking_snapshot(user)
+    changed = {field for field in after if after[field] != before.get(field)}
+    if not changed:
+        return False
+
+    has_feed = get_feed_state_query(db, user.id).with_entities(RankedFeedState.viewer_id).first()
+    if has_feed is not None:
+        _write_feed(db, user)
+    if changed.intersection(RANKING_FIELDS + REQUIREMENT_FIELDS):
+        rescore_column(db, user)
+    return True
@@ -0,0 +1,151 @@
+"""
+Rating service for maintaining per-user rating aggregates (the user_rating_stats table),
+and the lookups of study session ratings and the reflection notes written with them
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models.models import StudySessionRating, UserNote, UserRatingStats
+from services.version_service import bump_viewers_of
+
+
+def _rating_scores(rating: StudySessionRating) -> List[tuple]:
+    """(criterion, score) pairs of a rating."""
+    return [
+        (rating.criterion_1, rating.rating_1),
+        (rating.criterion_2, rating.rating_2),
+        (rating.criterion_3, rating.rating_3),
+    ]
+
+
+def _apply_rating(stats: UserRatingStats, rating: StudySessionRating) -> None:
+    """Add one rating to a stats record in memory."""
+    # JSON columns are only persisted when reassigned, so build new dicts
+    criterion_sums = dict(stats.criterion_sums or {})
+    criterion_counts = dict(stats.criterion_counts or {})
+    for criterion, score in _rating_scores(rating):
+        criterion_sums[criterion] = criterion_sums.get(criterion, 0) + score
+        criterion_counts[criterion] = criterion_counts.get(criterion, 0) + 1
+
+    stats.rating_count = (stats.rating_count or 0) + 1
+    stats.rating_sum = (stats.rating_sum or 0) + rating.rating_1 + rating.rating_2 + rating.rating_3
+    stats.average_rating = stats.rating_sum / (3.0 * stats.rating_count)
+    stats.criterion_sums = criterion_sums
+    stats.criterion_counts = criterion_counts
+
+
+def _get_or_create_stats(db: Session, user_id: int) -> UserRatingStats:
+    """Get a user's stats record locked for update, creating an empty one if needed."""
+    stats = db.query(UserRatingStats).filter(UserRatingStats.user_id == user_id).with_for_update().first()
+    if stats is not None:
+        return stats
+
+    # Create in a savepoint so a concurrent insert doesn't roll back the caller's transaction
+    try:
+        with db.begin_nested():
+            stats = UserRatingStats(user_id=user_id, rating_count=0, rating_sum=0,
+                                    criterion_sums={}, criterion_counts={})
+            db.add(stats)
+        return stats
+    except IntegrityError:
+        return db.query(UserRatingStats).filter(UserRatingStats.user_id == user_id).with_for_update().one()
+
+
+def record_rating(db: Session, rating: StudySessionRating) -> UserRatingStats:
+    """
+    Add a new rating to the rated user's aggregates.
+    Call this in the transaction that inserts the rating; it does not commit.
+    """
+    stats = _get_or_create_stats(db, rating.rated_user_id)
+    _apply_rating(stats, rating)
+    # The new average shows wherever the rated user is listed
+    bump_viewers_of(db, rating.rated_user_id)
+    return stats
+
+
+def get_rating_query(db: Session, reach_out_id: int, rater_id: int):
+    """Query of the rating a user gave a connection."""
+    return db.query(StudySessionRating).filter(
+        and_(
+            StudySessionRating.reach_out_id == reach_out_id,
+            StudySessionRating.rater_id == rater_id
+        )
+    )
+
+
+def get_recent_ratings_query(db: Session, rated_user_id: int, since: datetime):
+    """Query of the ratings a user has received since a time."""
+    return db.query(StudySessionRating).filter(
+        and_(
+            StudySessionRating.rated_user_id == rated_user_id,
+            StudySessionRating.created_at >= since
+        )
+    )
+
+
+def get_notes_query(db: Session, user_id: int):
+    """Query of a user's reflection notes, newest first."""
+    return db.query(UserNote).filter(UserNote.user_id == user_id).order_by(UserNote.created_at.desc())
+
+
+def get_average_ratings_query(db: Session, user_ids: List[int]):
+    """Query of (user_id, average_rating) for the given users who have been rated."""
+    return db.query(UserRatingStats.user_id, UserRatingStats.average_rating).filter(
+        UserRatingStats.user_id.in_(user_ids),
+        UserRatingStats.rating_count > 0
+    )
+
+
+def get_average_ratings(db: Session, user_ids: Iterable[int]) -> Dict[int, float]:
+    """Average rating per user id, for users who have been rated (one primary key lookup)."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+
+    rows = get_average_ratings_query(db, user_ids).all()
+    return {user_id: float(avg) for user_id, avg in rows}
+
+
+def rebuild_rating_stats(db: Session, user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute rating aggregates from study_session_ratings and commit.
+    Rebuilds every user when user_ids is None. Returns the number of stats records written.
+    """
+    ratings_q = db.query(StudySessionRating)
+    stats_q = db.query(UserRatingStats)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        ratings_q = ratings_q.filter(StudySessionRating.rated_user_id.in_(user_ids))
+        stats_q = stats_q.filter(UserRatingStats.user_id.in_(user_ids))
+
+    stats_q.delete(synchronize_session=False)
+
+    rebuilt: Dict[int, UserRatingStats] = {}
+    for rating in ratings_q.order_by(StudySessionRating.id).yield_per(1000):
+        stats = rebuilt.get(rating.rated_user_id)
+        if stats is None:
+            stats = UserRatingStats(user_id=rating.rated_user_id, rating_count=0, rating_sum=0,
+                                    criterion_sums={}, criterion_counts={})
+            rebuilt[rating.rated_user_id] = stats
+        _apply_rating(stats, rating)
+
+    db.add_all(rebuilt.values())
+    db.commit()
+    return len(rebuilt)
+
+
+def backfill_rating_stats(db: Session) -> int:
+    """
+    Build aggregates for rated users that don't have a stats record yet.
+    Safe to run repeatedly; returns the number of records created.
+    """
+    missing_ids = [
+        user_id for (user_id,) in db.query(StudySessionRating.rated_user_id).outerjoin(
+            UserRatingStats, UserRatingStats.user_id == StudySessionRating.rated_user_id
+        ).filter(UserRatingStats.user_id == None).distinct()
+    ]
+    if not missing_ids:
+        return 0
+    return rebuild_rating_stats(db, missing_ids)
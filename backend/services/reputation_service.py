@@ -2,9 +2,10 @@
 Reputation service for calculating and managing user reputation scores
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import func
 from datetime import datetime, timedelta
-from models.models import User, StudySessionRating
+from models.models import User
+from services.rating_service import get_recent_ratings_query
 
 # All possible rating criteria
 ALL_CRITERIA = [
@@ -71,12 +72,7 @@ def check_and_update_badge(db: Session, user_id: int):
     
     # Get ratings from the past week
     week_ago = datetime.utcnow() - timedelta(days=7)
-    recent_ratings = db.query(StudySessionRating).filter(
-        and_(
-            StudySessionRating.rated_user_id == user_id,
-            StudySessionRating.created_at >= week_ago
-        )
-    ).all()
+    recent_ratings = get_recent_ratings_query(db, user_id, week_ago).all()
     
     # Count 5-star and 4-star ratings across all criteria
     five_star_count = 0
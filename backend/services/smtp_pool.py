@@ -0,0 +1,163 @@
+"""
+SMTP connection pool: keeps up to SMTP_POOL_SIZE logged-in connections open and
+reuses them across emails, so a send costs one mail transaction instead of a new
+TCP + TLS + AUTH handshake.
+
+- connections idle for more than SMTP_KEEPALIVE seconds are checked with NOOP
+  before reuse; ones idle past SMTP_IDLE_TIMEOUT (servers drop those) are replaced
+- a connection is retired after SMTP_MAX_MESSAGES (providers cap messages per session)
+- a send that fails because the connection dropped is retried once on a fresh one
+Connections belong to an event loop, so each loop gets its own pool (get_smtp_pool).
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from email.message import Message
+from typing import Dict
+
+import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+# Connections kept open per process (match OUTBOX_SEND_CONCURRENCY)
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+
+# Seconds idle after which a connection is checked with NOOP before reuse
+SMTP_KEEPALIVE = 30
+
+# Seconds idle after which a connection is closed instead of reused
+SMTP_IDLE_TIMEOUT = int(os.getenv("SMTP_IDLE_TIMEOUT", "240"))
+
+# Messages sent over one connection before it is replaced
+SMTP_MAX_MESSAGES = int(os.getenv("SMTP_MAX_MESSAGES", "100"))
+
+# Errors meaning the connection is unusable (the message can be retried on a new one)
+CONNECTION_ERRORS = (
+    aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError,
+    aiosmtplib.SMTPTimeoutError, ConnectionError, OSError,
+)
+
+
+class PooledConnection:
+    """A logged-in SMTP connection and its usage"""
+
+    def __init__(self, smtp: aiosmtplib.SMTP):
+        self.smtp = smtp
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self.last_used
+
+    async def close(self) -> None:
+        try:
+            await self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+
+
+class SMTPPool:
+    """Reusable SMTP connections for one event loop, configured like fastapi_mail's Connection."""
+
+    def __init__(self, config, size: int = SMTP_POOL_SIZE):
+        self.config = config
+        self.size = max(1, size)
+        self._idle: list = []
+        self._slots = asyncio.Semaphore(self.size)
+        self.connections_opened = 0
+
+    async def _connect(self) -> PooledConnection:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.config.MAIL_SERVER,
+            port=self.config.MAIL_PORT,
+            timeout=self.config.TIMEOUT,
+            use_tls=self.config.MAIL_SSL_TLS,
+            start_tls=self.config.MAIL_STARTTLS,
+            validate_certs=self.config.VALIDATE_CERTS,
+        )
+        await smtp.connect()
+        if self.config.USE_CREDENTIALS:
+            await smtp.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD)
+        self.connections_opened += 1
+        return PooledConnection(smtp)
+
+    async def _checkout(self) -> PooledConnection:
+        """An idle connection that still works, or a new one"""
+        while self._idle:
+            connection = self._idle.pop()
+            if connection.idle_seconds() > SMTP_IDLE_TIMEOUT or not connection.smtp.is_connected:
+                await connection.close()
+                continue
+            if connection.idle_seconds() > SMTP_KEEPALIVE:
+                try:
+                    await connection.smtp.noop()
+                except Exception:
+                    await connection.close()
+                    continue
+            return connection
+        return await self._connect()
+
+    def _checkin(self, connection: PooledConnection) -> None:
+        connection.last_used = time.monotonic()
+        self._idle.append(connection)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a connection (waits while all SMTP_POOL_SIZE are in use)."""
+        async with self._slots:
+            connection = await self._checkout()
+            healthy = False
+            try:
+                yield connection
+                healthy = True
+            except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused):
+                # The server refused this message (aiosmtplib has reset the transaction);
+                # the connection is still good for the next one
+                healthy = connection.smtp.is_connected
+                raise
+            finally:
+                if healthy and connection.messages_sent < SMTP_MAX_MESSAGES:
+                    self._checkin(connection)
+                else:
+                    await connection.close()
+
+    async def send_message(self, message: Message) -> None:
+        """Send a built email, reconnecting once if the pooled connection turns out to be dead."""
+        for attempt in (1, 2):
+            try:
+                async with self.connection() as connection:
+                    await connection.smtp.send_message(message)
+                    connection.messages_sent += 1
+                return
+            except CONNECTION_ERRORS as e:
+                if attempt == 2:
+                    raise
+                logger.info(f"SMTP connection lost ({e}), retrying on a new connection")
+
+    async def close(self) -> None:
+        while self._idle:
+            await self._idle.pop().close()
+
+
+_pools: Dict[asyncio.AbstractEventLoop, SMTPPool] = {}
+
+
+def get_smtp_pool(config) -> SMTPPool:
+    """The pool for the running event loop (created on first use)."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        # Drop pools of loops that are gone (e.g. finished asyncio.run calls)
+        for stale in [other for other in _pools if other.is_closed()]:
+            del _pools[stale]
+        pool = _pools[loop] = SMTPPool(config)
+    return pool
+
+
+async def close_smtp_pool() -> None:
+    """Close the running loop's idle connections (on shutdown)."""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
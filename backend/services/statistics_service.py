@@ -1,16 +1,28 @@
 """
 Statistics service for tracking user engagement metrics
 """
+from datetime import datetime
+from typing import Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, case
 from models.models import User, ReachOut
 
 
+def get_reach_outs_sent_query(db: Session, user_id: int, since: Optional[datetime] = None):
+    """
+    Query of the reach outs a user has sent (since a time, if given)
+    """
+    query = db.query(ReachOut).filter(ReachOut.sender_id == user_id)
+    if since is not None:
+        query = query.filter(ReachOut.created_at >= since)
+    return query
+
+
 def get_user_reach_out_count(db: Session, user_id: int) -> int:
     """
     Get total number of reach out emails sent by a user (all time)
     """
-    return db.query(ReachOut).filter(ReachOut.sender_id == user_id).count()
+    return get_reach_outs_sent_query(db, user_id).count()
 
 
 def get_all_users_reach_out_counts(db: Session) -> dict:
@@ -0,0 +1,69 @@
+"""
+Token service: access token claims and revocation.
+
+Access tokens carry the user's gating fields (email verified, password set, profile
+completed, frontend design) and token_version as signed claims, so requests can be
+authorized without checking them on the user row. Bumping a user's token_version
+revokes every token issued before it (password resets do this).
+
+Revocation is checked against the user's current token_version on every request,
+read through load_principal (services/principal_cache.py): from the database, or
+from the principal cache only where its evictions reach every worker. A revoked
+token is therefore rejected by every instance, not just the one that revoked it.
+"""
+from typing import NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from models.models import User
+
+
+class Principal(NamedTuple):
+    """The authenticated user as far as authorization needs to know."""
+    user_id: int
+    token_version: int
+    email_verified: bool
+    password_set: bool
+    profile_completed: bool
+    frontend_design: Optional[str]
+
+
+def principal_from_claims(payload: dict) -> Optional[Principal]:
+    """
+    The principal described by a token's claims, or None if the token predates
+    the claims (or they are incomplete) and the user row has to be checked.
+    """
+    if "tv" not in payload or not payload.get("user_id"):
+        return None
+    return Principal(
+        user_id=int(payload["user_id"]),
+        token_version=int(payload["tv"]),
+        email_verified=payload.get("ev") is True,
+        password_set=payload.get("pw") is True,
+        profile_completed=payload.get("pc") is True,
+        frontend_design=payload.get("fd"),
+    )
+
+
+def principal_from_user(user: User) -> Principal:
+    return Principal(
+        user_id=user.id,
+        token_version=user.token_version or 0,
+        email_verified=user.email_verified is True,
+        password_set=user.password_hash is not None,
+        profile_completed=bool(user.profile_completed),
+        frontend_design=user.frontend_design,
+    )
+
+
+def is_token_revoked(token_version: int, user: User) -> bool:
+    """True if a token of this version was issued before the user's latest revocation."""
+    return token_version < (user.token_version or 0)
+
+
+def revoke_user_tokens(db: Session, user: User) -> None:
+    """
+    Revoke every access token issued to the user so far. Does not commit; the revocation
+    takes effect once the transaction commits. Issue new tokens after the commit.
+    """
+    user.token_version = (user.token_version or 0) + 1
@@ -0,0 +1,78 @@
+"""
+Version service for the per-user data_version behind ETag/304 responses.
+
+A user's data_version is bumped whenever something they can see changes:
+- their own profile row: bumped automatically on flush
+- another user's profile fields they display (connections, matches, list view
+  feed): bumped for every such viewer automatically on flush
+- reach outs, met answers, ratings, notes, mutual matches and ranked feeds:
+  bumped by the services that write them (see bump_data_version callers)
+
+Bumps are SQL increments (data_version = data_version + 1), so versions only
+grow even when the in-memory user is stale. Bumped users are reported to the
+principal cache, which evicts them when the transaction commits.
+"""
+from typing import Iterable
+from sqlalchemy import event, inspect, select, union, update
+from sqlalchemy.orm import Session
+from models.models import User, ReachOut, MutualMatch, RankedFeedEntry
+from services.principal_cache import mark_users_changed
+
+# Profile fields other users see (directly or through their match scores)
+DISPLAYED_FIELDS = (
+    "name", "school_email", "profile_picture", "gender", "major", "academic_year",
+    "classes_taking", "classes_taken", "learn_best_when", "study_snack", "favorite_study_spot",
+    "mbti", "yap_to_study_ratio", "reputation_score",
+)
+
+
+def _bump(user_ids_clause):
+    # Keep updated_at: this is not a change to the bumped users' own profiles
+    return update(User).where(User.id.in_(user_ids_clause)).values(
+        data_version=User.data_version + 1,
+        updated_at=User.updated_at,
+    ).returning(User.id).execution_options(synchronize_session=False)
+
+
+def bump_data_version(db: Session, user_ids: Iterable[int]) -> None:
+    """Invalidate cached responses of the given users. Does not commit."""
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        db.execute(_bump(user_ids))
+        mark_users_changed(db, user_ids)
+
+
+def viewers_of(user_id: int):
+    """SELECT of the users whose responses display this user: connections, mutual matches and feeds listing them."""
+    return union(
+        select(ReachOut.recipient_id).where(ReachOut.sender_id == user_id),
+        select(ReachOut.sender_id).where(ReachOut.recipient_id == user_id),
+        select(MutualMatch.matched_user_id).where(MutualMatch.user_id == user_id),
+        select(RankedFeedEntry.viewer_id).where(RankedFeedEntry.candidate_id == user_id),
+    )
+
+
+def bump_viewers_of(db: Session, user_id: int) -> None:
+    """Invalidate cached responses of everyone who displays this user. Does not commit."""
+    mark_users_changed(db, db.execute(_bump(viewers_of(user_id))).scalars().all())
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_changed_users(session, flush_context, instances):
+    """Bump the version of every user row about to be updated, and note displayed-field changes."""
+    for obj in session.dirty:
+        if not isinstance(obj, User) or not session.is_modified(obj, include_collections=False):
+            continue
+        attrs = inspect(obj).attrs
+        displayed_changed = any(attrs[field].history.has_changes() for field in DISPLAYED_FIELDS)
+        obj.data_version = User.data_version + 1
+        if displayed_changed:
+            session.info.setdefault("displayed_changes", set()).add(obj.id)
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_viewers_of_changed_users(session, flush_context):
+    """Bump everyone who displays a user whose displayed fields were just written."""
+    for user_id in sorted(session.info.pop("displayed_changes", ())):
+        bumped = session.connection().execute(_bump(viewers_of(user_id))).scalars().all()
+        mark_users_changed(session, bumped)
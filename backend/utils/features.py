@@ -0,0 +1,171 @@
+"""
+Normalized profile features used for similarity scoring.
+
+Profile text is normalized once (when the profile is written) and stored in
+the user_features table. At scoring time the stored values are interned into
+process-wide integer codes, so comparing two users is pure set and integer
+work with no string normalization.
+"""
+import threading
+from typing import Dict, FrozenSet, List, Optional, Set
+
+from models.models import User, UserFeatures
+
+# Values interned per generation of the intern table before a new generation starts
+MAX_CODES = 100_000
+
+# Code used for a missing categorical value (None or empty string)
+MISSING = -1
+
+
+class _InternTable:
+    """
+    Process-wide intern table: normalized string -> integer code.
+
+    The vocabulary grows with every distinct value ever loaded (free-text words
+    included), so it is kept in two generations. When the current one is full it
+    becomes the previous one and the oldest is dropped; values still in use are
+    carried over with their code on their next lookup. Codes are never reused, so
+    two different strings never share one, and memory stays under 2 * MAX_CODES
+    entries. A value only loses its code after MAX_CODES other new values were
+    interned without it being seen, far longer than one ranking pass holds its
+    features.
+    """
+
+    def __init__(self, max_codes: int = MAX_CODES):
+        self.max_codes = max_codes
+        self.current: Dict[str, int] = {}
+        self.previous: Dict[str, int] = {}
+        self._next_code = 0
+        self._lock = threading.Lock()
+
+    def code(self, value: str) -> int:
+        code = self.current.get(value)
+        if code is not None:
+            return code
+        with self._lock:
+            code = self.current.get(value)
+            if code is None:
+                code = self.previous.get(value)
+                if code is None:
+                    code = self._next_code
+                    self._next_code += 1
+                if len(self.current) >= self.max_codes:
+                    self.previous, self.current = self.current, {}
+                self.current[value] = code
+            return code
+
+
+_codes = _InternTable()
+
+
+def intern_code(value: str) -> int:
+    """Return the stable integer code for a normalized string, assigning one if needed."""
+    return _codes.code(value)
+
+
+def normalize_category(value: Optional[str], upper: bool = False) -> Optional[str]:
+    """Normalize a single-valued field the same way the scorer compares it."""
+    if not value:
+        return None
+    return value.upper() if upper else value.lower()
+
+
+def normalize_classes(classes: Optional[list]) -> List[str]:
+    """Normalize a class list into the (sorted) set used for Jaccard overlap."""
+    if not classes:
+        return []
+    return sorted(set(str(c).lower().strip() for c in classes if c))
+
+
+def normalize_words(text: Optional[str]) -> Optional[List[str]]:
+    """
+    Split free text into the lowercase word set used by _text_similarity.
+    Returns None when the field is empty (it then carries no weight), and a
+    possibly empty list otherwise.
+    """
+    if not text:
+        return None
+    return sorted(set(word.strip() for word in text.lower().split() if word.strip()))
+
+
+def build_feature_values(user: User) -> dict:
+    """Normalized column values for a user's UserFeatures record."""
+    return {
+        "gender": normalize_category(user.gender),
+        "major": normalize_category(user.major),
+        "academic_year": normalize_category(user.academic_year),
+        "mbti": normalize_category(user.mbti, upper=True),
+        "yap_to_study_ratio": normalize_category(user.yap_to_study_ratio),
+        "classes_taking": normalize_classes(user.classes_taking),
+        "classes_taken": normalize_classes(user.classes_taken),
+        "learn_best_when": normalize_words(user.learn_best_when),
+        "study_snack": normalize_words(user.study_snack),
+        "favorite_study_spot": normalize_words(user.favorite_study_spot),
+    }
+
+
+def _code_or_missing(value: Optional[str]) -> int:
+    return MISSING if value is None else intern_code(value)
+
+
+def _code_set(values: Optional[List[str]]) -> FrozenSet[int]:
+    return frozenset(intern_code(v) for v in values) if values else frozenset()
+
+
+class ProfileFeatures:
+    """Comparison-ready view of a profile: categorical codes and interned token sets."""
+
+    __slots__ = (
+        "user_id",
+        "gender", "major", "academic_year", "mbti", "yap_to_study_ratio",
+        "classes_taking", "classes_taken",
+        "learn_best_when", "study_snack", "favorite_study_spot",
+        "has_learn_best_when", "has_study_snack", "has_favorite_study_spot",
+    )
+
+    def __init__(self, user_id: int, values: dict):
+        self.user_id = user_id
+        self.gender = _code_or_missing(values["gender"])
+        self.major = _code_or_missing(values["major"])
+        self.academic_year = _code_or_missing(values["academic_year"])
+        self.mbti = _code_or_missing(values["mbti"])
+        self.yap_to_study_ratio = _code_or_missing(values["yap_to_study_ratio"])
+        self.classes_taking = _code_set(values["classes_taking"])
+        self.classes_taken = _code_set(values["classes_taken"])
+        self.learn_best_when = _code_set(values["learn_best_when"])
+        self.study_snack = _code_set(values["study_snack"])
+        self.favorite_study_spot = _code_set(values["favorite_study_spot"])
+        # Text fields carry weight whenever they are non-empty, even if they contain no words
+        self.has_learn_best_when = values["learn_best_when"] is not None
+        self.has_study_snack = values["study_snack"] is not None
+        self.has_favorite_study_spot = values["favorite_study_spot"] is not None
+
+    @classmethod
+    def from_user(cls, user: User) -> "ProfileFeatures":
+        """Normalize directly from a User row (used when no stored record exists)."""
+        return cls(user.id, build_feature_values(user))
+
+    @classmethod
+    def from_record(cls, record: UserFeatures) -> "ProfileFeatures":
+        """Build from a stored UserFeatures record without re-normalizing any text."""
+        return cls(record.user_id, {
+            "gender": record.gender,
+            "major": record.major,
+            "academic_year": record.academic_year,
+            "mbti": record.mbti,
+            "yap_to_study_ratio": record.yap_to_study_ratio,
+            "classes_taking": record.classes_taking,
+            "classes_taken": record.classes_taken,
+            "learn_best_when": record.learn_best_when,
+            "study_snack": record.study_snack,
+            "favorite_study_spot": record.favorite_study_spot,
+        })
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    """Jaccard similarity of two code sets (0.0 if either is empty)."""
+    if not a or not b:
+        return 0.0
+    intersection = len(a & b)
+    return intersection / (len(a) + len(b) - intersection)
@@ -0,0 +1,49 @@
+"""
+Conditional GET helpers: ETags derived from the user's data_version, and
+If-None-Match handling that answers 304 Not Modified before any heavy query runs.
+"""
+from fastapi import HTTPException, Request, Response, status
+
+from models.models import User
+
+# Browsers may keep a private copy but must revalidate it on every use
+CACHE_CONTROL = "private, no-cache"
+
+
+def user_etag(user: User) -> str:
+    """Weak ETag for a response built from everything the user can see."""
+    return f'W/"{user.id}-{user.data_version or 0}"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison: W/"x" and "x" name the same representation
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Authorization"}
+
+
+def set_etag(response: Response, etag: str) -> None:
+    """Set (or replace) the ETag and cache headers on the response being built."""
+    response.headers.update(_cache_headers(etag))
+
+
+def check_not_modified(request: Request, response: Response, etag: str) -> None:
+    """
+    Raise a 304 if the request's If-None-Match already has this ETag; otherwise
+    set the ETag and cache headers on the response being built.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=_cache_headers(etag))
+    set_etag(response, etag)
@@ -0,0 +1,87 @@
+"""
+Opaque keyset cursors for ranked lists.
+
+A cursor encodes the sort key of the last item on a page, so the next page is
+"everything that sorts after this key". Pages stay consistent when the list
+shifts between requests, and a deep page costs the same as the first one.
+"""
+import base64
+import binascii
+import heapq
+import json
+from typing import Iterable, List, Optional, Tuple
+
+from models.models import User
+
+# Sort key of a ranked item: (tier ascending, score descending, user id ascending)
+RankKey = Tuple[int, float, int]
+
+
+def rank_key(tier: int, score: float, user_id: int) -> RankKey:
+    """Sort key for an item in a ranked list (smaller sorts first)."""
+    return (tier, -score, user_id)
+
+
+def encode_cursor(tier: int, score: float, user_id: int) -> str:
+    """Encode the position after (tier, score, user_id) as an opaque URL-safe string."""
+    # json keeps the float's shortest round-trip repr, so the score decodes exactly
+    raw = json.dumps([tier, score, user_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> RankKey:
+    """
+    Decode a cursor produced by encode_cursor into the rank key it points after.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        tier, score, user_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return rank_key(int(tier), float(score), int(user_id))
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def encode_id_cursor(item_id: int) -> str:
+    """Encode the position after an id in a list ordered by id descending."""
+    raw = json.dumps([item_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_id_cursor(cursor: str) -> int:
+    """
+    Decode a cursor produced by encode_id_cursor into the id it points after.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        (item_id,) = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return int(item_id)
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise ValueError("Invalid cursor")
+
+
+def top_k_after(
+    scored_users: Iterable[Tuple[User, float]],
+    k: int,
+    tier: int = 0,
+    after: Optional[RankKey] = None,
+) -> List[Tuple[User, float, int]]:
+    """
+    Select the k best (user, score) pairs that sort strictly after `after`, using a bounded heap.
+    Returns (user, score, tier) tuples in rank order.
+    """
+    if k <= 0:
+        return []
+    if after is not None and after[0] > tier:
+        return []
+
+    candidates = (
+        (rank_key(tier, score, user.id), user, score)
+        for user, score in scored_users
+    )
+    if after is not None:
+        candidates = (c for c in candidates if c[0] > after)
+
+    best = heapq.nsmallest(k, candidates, key=lambda c: c[0])
+    return [(user, score, tier) for _, user, score in best]
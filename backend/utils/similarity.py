@@ -1,8 +1,15 @@
 """
 Utility functions for calculating similarity between users for study buddy matching.
 """
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from models.models import User
+from utils.features import MISSING, ProfileFeatures, jaccard
+
+# NumPy is optional: without it, ranking falls back to the pairwise scorer below
+try:
+    from utils.similarity_engine import CandidateMatrix
+except ImportError:
+    CandidateMatrix = None
 
 
 def calculate_similarity_score(current_user: User, candidate_user: User) -> float:
@@ -159,18 +166,113 @@ def _text_similarity(text1: str, text2: str) -> float:
     return len(intersection) / len(union)
 
 
-def sort_users_by_similarity(current_user: User, candidate_users: List[User]) -> List[Tuple[User, float]]:
+def calculate_feature_similarity(current_user: User, current: ProfileFeatures, candidate: ProfileFeatures) -> float:
     """
-    Sort a list of candidate users by their similarity to the current user.
-    Returns a list of tuples (user, similarity_score) sorted by score descending.
+    Same score as calculate_similarity_score, computed from pre-normalized ProfileFeatures.
+    Only set and integer comparisons happen here; all string normalization was done up front.
     """
-    scored_users = [
-        (user, calculate_similarity_score(current_user, user))
+    score = 0.0
+    total_weight = 0.0
+    
+    if current_user.match_by_gender:
+        if current.gender != MISSING and current.gender == candidate.gender:
+            score += 0.2
+        total_weight += 0.2
+    
+    if current_user.match_by_major:
+        if current.major != MISSING and current.major == candidate.major:
+            score += 0.3
+        total_weight += 0.3
+    
+    if current_user.match_by_academic_year:
+        if current.academic_year != MISSING and current.academic_year == candidate.academic_year:
+            score += 0.2
+        total_weight += 0.2
+    
+    if current_user.match_by_classes:
+        class_score = 0.0
+        if current.classes_taking and candidate.classes_taking:
+            class_score += 0.2 * jaccard(current.classes_taking, candidate.classes_taking)
+        if current.classes_taken and candidate.classes_taken:
+            class_score += 0.1 * jaccard(current.classes_taken, candidate.classes_taken)
+        score += class_score
+        total_weight += 0.3
+    
+    if current_user.match_by_study_preferences:
+        study_pref_score = 0.0
+        study_pref_weight = 0.0
+        
+        for current_value, candidate_value in (
+            (current.mbti, candidate.mbti),
+            (current.yap_to_study_ratio, candidate.yap_to_study_ratio),
+        ):
+            if current_value != MISSING and candidate_value != MISSING:
+                if current_value == candidate_value:
+                    study_pref_score += 0.05
+                study_pref_weight += 0.05
+        
+        for current_present, current_words, candidate_present, candidate_words in (
+            (current.has_learn_best_when, current.learn_best_when,
+             candidate.has_learn_best_when, candidate.learn_best_when),
+            (current.has_study_snack, current.study_snack,
+             candidate.has_study_snack, candidate.study_snack),
+            (current.has_favorite_study_spot, current.favorite_study_spot,
+             candidate.has_favorite_study_spot, candidate.favorite_study_spot),
+        ):
+            if current_present and candidate_present:
+                study_pref_score += 0.05 * jaccard(current_words, candidate_words)
+                study_pref_weight += 0.05
+        
+        if study_pref_weight > 0:
+            score += (study_pref_score / study_pref_weight) * 0.3
+        
+        total_weight += 0.3
+    
+    if total_weight > 0:
+        return score / total_weight
+    
+    return 0.5
+
+
+def score_users(
+    current_user: User,
+    candidate_users: List[User],
+    features: Optional[Dict[int, ProfileFeatures]] = None,
+) -> List[Tuple[User, float]]:
+    """
+    Score candidate users against the current user without sorting them.
+    `features` maps user id to pre-loaded ProfileFeatures (see services.feature_service);
+    users missing from it are normalized on the fly.
+    Uses the vectorized engine when NumPy is available; scores are identical either way.
+    """
+    features = features or {}
+    current = features.get(current_user.id) or ProfileFeatures.from_user(current_user)
+    
+    if CandidateMatrix is not None and candidate_users:
+        matrix = CandidateMatrix(candidate_users, features)
+        return list(zip(matrix.users, matrix.score(current_user, current).tolist()))
+    
+    return [
+        (user, calculate_feature_similarity(
+            current_user, current, features.get(user.id) or ProfileFeatures.from_user(user)
+        ))
         for user in candidate_users
     ]
+
+
+def sort_users_by_similarity(
+    current_user: User,
+    candidate_users: List[User],
+    features: Optional[Dict[int, ProfileFeatures]] = None,
+) -> List[Tuple[User, float]]:
+    """
+    Sort a list of candidate users by their similarity to the current user.
+    Returns a list of tuples (user, similarity_score) sorted by score descending.
+    See score_users for the `features` argument.
+    """
+    scored_users = score_users(current_user, candidate_users, features)
     
     # Sort by similarity score descending, then by user id ascending for stability
     scored_users.sort(key=lambda x: (-x[1], x[0].id))
     
     return scored_users
-
@@ -0,0 +1,149 @@
+"""
+Vectorized similarity engine for ranking many candidates against one user.
+
+The candidate pool's ProfileFeatures are packed into NumPy arrays (categorical
+codes for single-valued fields, flattened token/owner arrays for class and
+word sets) and then scored against the current user with a handful of array
+operations.
+Scores are identical to calculate_similarity_score in utils/similarity.py:
+every term is accumulated in the same order so the floating point results
+match bit for bit.
+"""
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from models.models import User
+from utils.features import MISSING, ProfileFeatures
+
+
+class _TokenSets:
+    """Sparse encoding of one set-valued field across the candidate pool."""
+
+    __slots__ = ("owners", "tokens", "sizes")
+
+    def __init__(self, sets: List[Set[int]]):
+        owners: List[int] = []
+        tokens: List[int] = []
+        for idx, values in enumerate(sets):
+            tokens.extend(values)
+            owners.extend([idx] * len(values))
+        self.owners = np.asarray(owners, dtype=np.int64)
+        self.tokens = np.asarray(tokens, dtype=np.int64)
+        self.sizes = np.asarray([len(values) for values in sets], dtype=np.int64)
+
+    def jaccard(self, current: Set[int]) -> np.ndarray:
+        """Jaccard similarity of `current` against every candidate set (0.0 where either is empty)."""
+        n = len(self.sizes)
+        if not current or n == 0:
+            return np.zeros(n)
+        if len(self.tokens):
+            mask = np.isin(self.tokens, np.fromiter(current, dtype=np.int64, count=len(current)))
+            intersection = np.bincount(self.owners[mask], minlength=n)
+        else:
+            intersection = np.zeros(n, dtype=np.int64)
+        union = len(current) + self.sizes - intersection
+        return np.where(self.sizes > 0, intersection / np.maximum(union, 1), 0.0)
+
+
+class CandidateMatrix:
+    """
+    Column-oriented encoding of a candidate pool.
+    Build it once per request and score it against the current user with score().
+    """
+
+    def __init__(self, candidates: Iterable[User], features: Optional[Dict[int, ProfileFeatures]] = None):
+        self.users: List[User] = list(candidates)
+        features = features or {}
+        profiles = [features.get(user.id) or ProfileFeatures.from_user(user) for user in self.users]
+
+        self.ids = np.asarray([user.id for user in self.users], dtype=np.int64)
+        self.gender = np.asarray([f.gender for f in profiles], dtype=np.int64)
+        self.major = np.asarray([f.major for f in profiles], dtype=np.int64)
+        self.academic_year = np.asarray([f.academic_year for f in profiles], dtype=np.int64)
+        self.mbti = np.asarray([f.mbti for f in profiles], dtype=np.int64)
+        self.yap_to_study_ratio = np.asarray([f.yap_to_study_ratio for f in profiles], dtype=np.int64)
+
+        self.classes_taking = _TokenSets([f.classes_taking for f in profiles])
+        self.classes_taken = _TokenSets([f.classes_taken for f in profiles])
+        self.learn_best_when = _TokenSets([f.learn_best_when for f in profiles])
+        self.study_snack = _TokenSets([f.study_snack for f in profiles])
+        self.favorite_study_spot = _TokenSets([f.favorite_study_spot for f in profiles])
+
+        self.has_learn_best_when = np.asarray([f.has_learn_best_when for f in profiles], dtype=bool)
+        self.has_study_snack = np.asarray([f.has_study_snack for f in profiles], dtype=bool)
+        self.has_favorite_study_spot = np.asarray([f.has_favorite_study_spot for f in profiles], dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def score(self, current_user: User, current: Optional[ProfileFeatures] = None) -> np.ndarray:
+        """
+        Score every candidate against current_user.
+        Mirrors calculate_similarity_score term by term; see that function for the weights.
+        """
+        n = len(self.users)
+        if current is None:
+            current = ProfileFeatures.from_user(current_user)
+        score = np.zeros(n)
+        total_weight = 0.0
+
+        if current_user.match_by_gender:
+            if current.gender != MISSING:
+                score = score + np.where(self.gender == current.gender, 0.2, 0.0)
+            total_weight += 0.2
+
+        if current_user.match_by_major:
+            if current.major != MISSING:
+                score = score + np.where(self.major == current.major, 0.3, 0.0)
+            total_weight += 0.3
+
+        if current_user.match_by_academic_year:
+            if current.academic_year != MISSING:
+                score = score + np.where(self.academic_year == current.academic_year, 0.2, 0.0)
+            total_weight += 0.2
+
+        if current_user.match_by_classes:
+            class_score = np.zeros(n)
+            if current.classes_taking:
+                class_score = class_score + 0.2 * self.classes_taking.jaccard(current.classes_taking)
+            if current.classes_taken:
+                class_score = class_score + 0.1 * self.classes_taken.jaccard(current.classes_taken)
+            score = score + class_score
+            total_weight += 0.3
+
+        if current_user.match_by_study_preferences:
+            study_pref_score = np.zeros(n)
+            study_pref_weight = np.zeros(n)
+
+            for current_value, column in (
+                (current.mbti, self.mbti),
+                (current.yap_to_study_ratio, self.yap_to_study_ratio),
+            ):
+                if current_value != MISSING:
+                    both = column != MISSING
+                    study_pref_score = study_pref_score + np.where(both & (column == current_value), 0.05, 0.0)
+                    study_pref_weight = study_pref_weight + np.where(both, 0.05, 0.0)
+
+            for current_present, current_words, present, token_sets in (
+                (current.has_learn_best_when, current.learn_best_when, self.has_learn_best_when, self.learn_best_when),
+                (current.has_study_snack, current.study_snack, self.has_study_snack, self.study_snack),
+                (current.has_favorite_study_spot, current.favorite_study_spot,
+                 self.has_favorite_study_spot, self.favorite_study_spot),
+            ):
+                if current_present:
+                    text_sim = token_sets.jaccard(current_words)
+                    study_pref_score = study_pref_score + np.where(present, 0.05 * text_sim, 0.0)
+                    study_pref_weight = study_pref_weight + np.where(present, 0.05, 0.0)
+
+            has_weight = study_pref_weight > 0
+            normalized = np.zeros(n)
+            np.divide(study_pref_score, study_pref_weight, out=normalized, where=has_weight)
+            score = score + np.where(has_weight, normalized * 0.3, 0.0)
+            total_weight += 0.3
+
+        if total_weight > 0:
+            return score / total_weight
+
+        # If no preferences are set, every candidate gets the neutral score
+        return np.full(n, 0.5)
@@ -1,7 +1,10 @@
 import { useNavigate, useLocation } from "react-router-dom";
 import { useSidebar } from "./SidebarContext";
 import { useState, useEffect } from "react";
-import { getConnections } from "./authService";
+import { getConnectionsSummary, getEventsURL } from "./authService";
+
+// Events that can change whether a connection needs attention
+const CONNECTION_EVENTS = ["reach_out", "connection_met", "rating_due", "connection_rated"];
 
 export default function Sidebar() {
   const navigate = useNavigate();
@@ -25,44 +28,9 @@ export default function Sidebar() {
   useEffect(() => {
     const checkPendingConnections = async () => {
       try {
-        const response = await getConnections();
-        const connections = response.data;
-        
-        // Check if there are any connections that need attention:
-        // 1. met === null (haven't indicated if they met)
-        // 2. met === true && !has_rating (met but haven't rated)
-        const allConnections = [
-          ...(connections.reached_out_to || []),
-          ...(connections.reached_out_by || [])
-        ];
-        
-        const pendingConnections = allConnections.filter(conn => 
-          conn.met === null || (conn.met === true && !conn.has_rating)
-        );
-        
-        const hasPending = pendingConnections.length > 0;
-        
-        console.log("Pending connections check:", {
-          totalConnections: allConnections.length,
-          hasPending,
-          pendingCount: pendingConnections.length,
-          allConnections: allConnections.map(c => ({
-            id: c.id,
-            name: c.name || c.school_email,
-            met: c.met,
-            has_rating: c.has_rating,
-            isPending: c.met === null || (c.met === true && !c.has_rating)
-          })),
-          pendingConnections: pendingConnections.map(c => ({
-            id: c.id,
-            name: c.name || c.school_email,
-            met: c.met,
-            has_rating: c.has_rating
-          }))
-        });
-        
-        console.log("Setting hasPendingConnections to:", hasPending);
-        setHasPendingConnections(hasPending);
+        // The server keeps these counts up to date, so this doesn't load the connections
+        const response = await getConnectionsSummary();
+        setHasPendingConnections(response.data.pending > 0);
       } catch (err) {
         // Silently fail - don't show notification if we can't check
         console.error("Error checking pending connections:", err);
@@ -73,9 +41,32 @@ export default function Sidebar() {
     // Check immediately
     checkPendingConnections();
     
-    // Check more frequently when on connections page, otherwise every 30 seconds
+    // Polling is the fallback while the event stream is unavailable:
+    // more frequently when on connections page, otherwise every 30 seconds
     const intervalTime = location.pathname === "/connections" ? 5000 : 30000;
-    const interval = setInterval(checkPendingConnections, intervalTime);
+    let interval = null;
+    const startPolling = () => {
+      if (!interval) interval = setInterval(checkPendingConnections, intervalTime);
+    };
+    const stopPolling = () => {
+      clearInterval(interval);
+      interval = null;
+    };
+    
+    // Re-check only when the server pushes a connection event
+    let events = null;
+    if (window.EventSource && localStorage.getItem("jwt")) {
+      events = new EventSource(getEventsURL());
+      CONNECTION_EVENTS.forEach((type) => events.addEventListener(type, checkPendingConnections));
+      events.onopen = () => {
+        // (Re)connected: catch up on anything missed while disconnected
+        stopPolling();
+        checkPendingConnections();
+      };
+      events.onerror = startPolling;
+    } else {
+      startPolling();
+    }
     
     // Also listen for storage events (in case connections are updated in another tab/window)
     const handleStorageChange = () => {
@@ -85,7 +76,8 @@ export default function Sidebar() {
     window.addEventListener('storage', handleStorageChange);
     
     return () => {
-      clearInterval(interval);
+      stopPolling();
+      if (events) events.close();
       window.removeEventListener('focus', checkPendingConnections);
       window.removeEventListener('storage', handleStorageChange);
     };
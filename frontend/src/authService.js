@@ -56,7 +56,14 @@ export const reportUser = (reportedUserId, reason = null, context = null) =>
 export const getReachOutStatus = () => api.get("/reach-out/status");
 
 // Reputation system API calls
-export const getConnections = () => api.get("/connections");
+export const getConnections = (params) => api.get("/connections", { params });
+
+// Counts of connections needing attention, plus a version that changes with the connections
+export const getConnectionsSummary = () => api.get("/connections/summary");
+
+// Server-Sent Events stream URL (EventSource can't send headers, so the token goes in the query)
+export const getEventsURL = () =>
+  `${api.defaults.baseURL}/events?token=${encodeURIComponent(localStorage.getItem("jwt") || "")}`;
 
 export const markConnectionMet = (reachOutId, met) =>
   api.post("/connections/mark-met", {